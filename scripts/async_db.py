@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Non-blocking Supabase access for the async fetch, scrape and migrate scripts.
+
+supabase-py's client is synchronous, so every .execute() inside a coroutine
+blocks the event loop: while a query runs, no provider request makes
+progress, and the queries themselves run one at a time. AsyncSupabase runs
+the queries in a bounded thread pool instead:
+
+    db = AsyncSupabase(create_client(SUPABASE_URL, SUPABASE_KEY))
+    result = await db.execute(db.table("teams").select("id").eq("external_id", 1))
+
+Queries are built on the event loop as before; only .execute() moves to a
+worker thread. At most SUPABASE_THREADS queries run at once.
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from row_ledger import RowLedger, stored_keys
+
+# Supabase queries in flight at once per script
+SUPABASE_THREADS = int(os.getenv("SUPABASE_THREADS", "8"))
+
+
+class AsyncSupabase:
+    """A supabase-py Client whose queries are executed in a thread pool."""
+
+    def __init__(self, client, max_workers: int = SUPABASE_THREADS):
+        self.client = client
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="supabase")
+
+    def table(self, name: str):
+        """Query builder for a table; pass the finished query to execute()."""
+        return self.client.table(name)
+
+    async def execute(self, query) -> Any:
+        """Execute a query builder without blocking the event loop."""
+        return await self.run(query.execute)
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Call a blocking function in the pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+async def afilter_changed(ledger: Optional[RowLedger], db: AsyncSupabase, table: str, rows: List[Dict[str, Any]],
+                          on_conflict) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """row_ledger.filter_changed for an AsyncSupabase.
+
+    The verification sweep reads the table in the pool; the ledger itself is
+    only used from the event loop thread, as sqlite3 connections require.
+    """
+    if not ledger or not on_conflict:
+        return rows, []
+    if ledger.verification_due(table):
+        ledger.verify(table, await db.run(stored_keys, db.client, table, on_conflict), on_conflict)
+    return ledger.partition(table, rows, on_conflict)
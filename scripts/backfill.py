@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Multi-season backfill for the MLB and NBA fetchers.
+
+    python scripts/backfill.py --leagues mlb --from-season 2010 --to-season 2025
+    python scripts/backfill.py --leagues mlb --from-season 2015 --to-season 2024 --resources games
+    python scripts/backfill.py --leagues nba --from-season 2024 --to-season 2024
+
+The work is split into partitions, one per league, season and resource:
+
+    mlb  games, player_stats    SportsData.io, via fetch_mlb_data
+    nba  teams, players         MySportsFeeds, via fetch_nba_data
+
+Partitions run in parallel, BACKFILL_PARALLEL at a time. Every provider
+request goes through that provider's RateLimiter, so the SportsData.io and
+MySportsFeeds quotas hold however many partitions are running. Each
+partition writes its own season's rows as bulk upserts of
+BACKFILL_CHUNK_SIZE rows, through the fetch scripts' write paths and the
+row ledger.
+
+MLB teams are synced once up front. Stats are matched to the players
+already stored for those teams. A season's players who are not stored yet
+are written first, with the team they played for that season. Stats rows
+whose player or team still cannot be matched are counted as skipped in the
+progress lines and the summary.
+
+NBA seasons are the MySportsFeeds regular seasons starting in each year
+(2024 is '2024-2025-regular'). The NBA tables hold one row per team and per
+player, not per season, so each season would overwrite the last: --leagues
+nba takes a single season.
+
+A progress line after every partition and a summary at the end report
+rows, rows/sec and the ETA.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from row_ledger import RowLedger
+from async_db import AsyncSupabase
+from rate_limit import RateLimiter
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Partitions running at once; the provider limiters bound the requests themselves
+BACKFILL_PARALLEL = int(os.getenv("BACKFILL_PARALLEL", "6"))
+
+# Rows per upsert request
+BACKFILL_CHUNK_SIZE = int(os.getenv("BACKFILL_CHUNK_SIZE", "500"))
+
+RESOURCES = {
+    "mlb": ("games", "player_stats"),
+    "nba": ("teams", "players"),
+}
+
+
+class Partition:
+    """One league, season and resource of a backfill, and how it went."""
+
+    def __init__(self, league: str, season: int, resource: str,
+                 run: Callable[["Partition"], Awaitable[int]]):
+        self.league = league
+        self.season = season
+        self.resource = resource
+        self.run = run
+        self.rows = 0
+        # Rows fetched but not written, e.g. stats of unknown players
+        self.skipped = 0
+        self.seconds = 0.0
+        self.error: Optional[BaseException] = None
+
+    def __str__(self) -> str:
+        return f"{self.league} {self.season} {self.resource}"
+
+
+class Backfill:
+    """Runs partitions in parallel and reports throughput."""
+
+    def __init__(self, partitions: List[Partition], parallel: int = BACKFILL_PARALLEL):
+        self.partitions = partitions
+        self.parallel = parallel
+        self.finished = 0
+        self.rows = 0
+        self.started = 0.0
+
+    async def run(self) -> None:
+        self.started = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.parallel)
+
+        async def run_one(partition: Partition) -> None:
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    partition.rows = await partition.run(partition)
+                except Exception as e:
+                    partition.error = e
+                    logger.exception(f"Partition {partition} failed: {e}")
+                finally:
+                    partition.seconds = time.perf_counter() - started
+                self._progress(partition)
+
+        await asyncio.gather(*(run_one(partition) for partition in self.partitions))
+
+    def _progress(self, partition: Partition) -> None:
+        self.finished += 1
+        self.rows += partition.rows
+        elapsed = time.perf_counter() - self.started
+        remaining = len(self.partitions) - self.finished
+        eta = elapsed / self.finished * remaining
+        status = "failed" if partition.error else f"{partition.rows} rows in {partition.seconds:.1f}s"
+        if partition.skipped:
+            status += f", {partition.skipped} skipped"
+        rate = self.rows / elapsed if elapsed else 0
+        logger.info(f"[{self.finished}/{len(self.partitions)}] {partition}: {status} | "
+                    f"{self.rows} rows, {rate:.0f} rows/sec, ETA {eta:.0f}s")
+
+    def summary(self) -> None:
+        elapsed = time.perf_counter() - self.started
+        logger.info("Backfill summary:")
+        groups: Dict[tuple, List[Partition]] = {}
+        for partition in self.partitions:
+            groups.setdefault((partition.league, partition.resource), []).append(partition)
+        for (league, resource), partitions in groups.items():
+            rows = sum(partition.rows for partition in partitions)
+            seconds = sum(partition.seconds for partition in partitions)
+            skipped = sum(partition.skipped for partition in partitions)
+            failed = [str(partition.season) for partition in partitions if partition.error]
+            line = f"  {league} {resource}: {rows} rows over {len(partitions)} seasons in {seconds:.1f}s of partition time"
+            if skipped:
+                line += f", {skipped} rows skipped"
+            if failed:
+                line += f", failed seasons: {', '.join(failed)}"
+            (logger.warning if skipped or failed else logger.info)(line)
+        logger.info(f"  Total: {self.rows} rows in {elapsed:.1f}s ({self.rows / elapsed if elapsed else 0:.0f} rows/sec)")
+
+    @property
+    def failed(self) -> List[Partition]:
+        return [partition for partition in self.partitions if partition.error]
+
+
+async def mlb_partitions(seasons: List[int], resources: List[str], ledger: RowLedger,
+                         closers: List[Callable[[], Any]]) -> List[Partition]:
+    """Sync the MLB teams, then one partition per season and resource."""
+    # Imported here: each fetch script checks its own credentials on import
+    import fetch_mlb_data as mlb
+    from supabase import create_client
+
+    limiter = RateLimiter(mlb.SPORTSDATA_RATE, concurrency=mlb.SPORTSDATA_CONCURRENCY)
+    client = mlb.SportsDataClient(mlb.SPORTSDATA_API_KEY, limiter)
+    db = AsyncSupabase(create_client(mlb.SUPABASE_URL, mlb.SUPABASE_KEY))
+    closers += [client.close, db.close]
+
+    league_id, teams = await asyncio.gather(
+        mlb.get_or_create_league(db, mlb.MLB_LEAGUE_NAME, mlb.MLB_LEAGUE_EXTERNAL_ID),
+        client.get_all_teams()
+    )
+    if not league_id or not teams:
+        raise RuntimeError("Could not get the MLB league or teams")
+    team_key_to_id = await mlb.sync_teams(db, teams, league_id, ledger)
+    player_key_to_id = {}
+    if "player_stats" in resources:
+        player_key_to_id = await mlb.load_player_ids(db, sorted(set(team_key_to_id.values())))
+        logger.info(f"Matching MLB stats against {len(player_key_to_id)} stored players")
+
+    async def games(partition: Partition) -> int:
+        data = await client.get_games_for_season(partition.season)
+        if data is None:
+            raise RuntimeError("games request failed")
+        return await mlb.upsert_games(db, data, partition.season, league_id, team_key_to_id,
+                                      ledger, chunk_size=BACKFILL_CHUNK_SIZE)
+
+    async def player_stats(partition: Partition) -> int:
+        data = await client.get_player_season_stats(partition.season)
+        if data is None:
+            raise RuntimeError("player stats request failed")
+        # Past seasons name players who are on no current roster
+        player_key_to_id.update(await mlb.sync_season_players(
+            db, data, player_key_to_id, team_key_to_id, ledger, chunk_size=BACKFILL_CHUNK_SIZE))
+        partition.skipped = len(mlb.unmatched_season_stats(data, player_key_to_id, team_key_to_id))
+        return await mlb.upsert_player_season_stats(db, data, partition.season, player_key_to_id,
+                                                    team_key_to_id, ledger, chunk_size=BACKFILL_CHUNK_SIZE)
+
+    runners = {"games": games, "player_stats": player_stats}
+    return [Partition("mlb", season, resource, runners[resource])
+            for season in seasons for resource in resources]
+
+
+async def nba_partitions(seasons: List[int], resources: List[str], ledger: RowLedger,
+                         closers: List[Callable[[], Any]]) -> List[Partition]:
+    """One partition per season and resource; parse_args allows a single season."""
+    import fetch_nba_data as nba
+    from supabase import create_client
+
+    limiter = RateLimiter(nba.MSF_RATE, concurrency=nba.MSF_CONCURRENCY)
+    db = AsyncSupabase(create_client(nba.SUPABASE_URL, nba.SUPABASE_KEY))
+    closers.append(db.close)
+
+    # Per resource: fetch, prepare rows, table, natural key
+    sources: Dict[str, tuple] = {
+        "teams": (nba.fetch_nba_teams, nba.prepare_team_rows, "nba_teams", ["external_team_id"]),
+        "players": (nba.fetch_nba_players, nba.prepare_player_rows, "nba_players", ["external_player_id"]),
+    }
+
+    def runner(resource: str) -> Callable[[Partition], Awaitable[int]]:
+        fetch, prepare, table, unique_cols = sources[resource]
+
+        async def run(partition: Partition) -> int:
+            rows = prepare(await fetch(nba.msf_season(partition.season), limiter))
+            return await nba.upsert_to_supabase(db, table, rows, unique_cols, ledger,
+                                                chunk_size=BACKFILL_CHUNK_SIZE)
+        return run
+
+    return [Partition("nba", season, resource, runner(resource))
+            for season in seasons for resource in resources]
+
+
+PARTITION_BUILDERS = {
+    "mlb": mlb_partitions,
+    "nba": nba_partitions,
+}
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Backfill several seasons of MLB and NBA data in parallel')
+    parser.add_argument('--leagues', nargs='+', choices=sorted(RESOURCES), default=['mlb'],
+                        help='Leagues to backfill (default: mlb)')
+    parser.add_argument('--from-season', type=int, required=True,
+                        help='First season; for the NBA, the year the season starts, and the only one')
+    parser.add_argument('--to-season', type=int, required=True,
+                        help='Last season, inclusive')
+    parser.add_argument('--resources', nargs='+',
+                        choices=sorted({resource for resources in RESOURCES.values() for resource in resources}),
+                        help='Resources to backfill (default: all of each league\'s)')
+    parser.add_argument('--parallel', type=int, default=BACKFILL_PARALLEL,
+                        help=f'Partitions running at once (default: {BACKFILL_PARALLEL})')
+    parser.add_argument('--full', action='store_true',
+                        help='Send every row, even ones the local ledger says are unchanged')
+    args = parser.parse_args()
+    if args.from_season > args.to_season:
+        parser.error("--from-season must not be after --to-season")
+    if "nba" in args.leagues and args.from_season != args.to_season:
+        parser.error("the NBA tables hold one row per team and player, so --leagues nba "
+                     "takes a single season (--from-season equal to --to-season)")
+    return args
+
+
+async def main() -> int:
+    args = parse_args()
+    seasons = list(range(args.from_season, args.to_season + 1))
+    ledger = RowLedger(full=args.full)
+    # Client and database close() methods, sync or async
+    closers: List[Callable[[], Any]] = []
+    try:
+        partitions: List[Partition] = []
+        for league in args.leagues:
+            resources = [resource for resource in RESOURCES[league]
+                         if not args.resources or resource in args.resources]
+            if resources:
+                partitions += await PARTITION_BUILDERS[league](seasons, resources, ledger, closers)
+        if not partitions:
+            logger.error("Nothing to backfill for the given leagues and resources")
+            return 1
+
+        logger.info(f"Backfilling {len(partitions)} partitions: {', '.join(args.leagues)}, "
+                    f"seasons {args.from_season}-{args.to_season}, {args.parallel} at a time")
+        backfill = Backfill(partitions, args.parallel)
+        await backfill.run()
+        backfill.summary()
+        return 1 if backfill.failed else 0
+    finally:
+        for close in closers:
+            result = close()
+            if asyncio.iscoroutine(result):
+                await result
+        ledger.close()
+
+
+if __name__ == "__main__":
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    sys.exit(asyncio.run(main()))
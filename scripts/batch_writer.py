@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Batched writes with bisecting failure recovery, shared by the sync scripts.
+
+A BatchWriter sends rows in fixed-size batches through an async `send`
+callable. When the database rejects a batch because of its rows (a 400,
+409 or 422, or a 413 for a batch too large), it is split in halves and
+each half is retried, recursively, until the failing rows are isolated.
+k bad rows in a batch of n therefore cost O(k log n) extra requests,
+instead of the n single-row requests of the old one-by-one fallback. Every
+isolated row is appended to a JSON-lines dead-letter file together with
+the error, and the following batches keep their full size.
+
+Transient failures (408, 429, 5xx, timeouts, connection errors) say
+nothing about the rows: the batch is retried whole, with exponential
+backoff, and the error is raised once the retries run out. Any other
+error is raised straight away.
+
+With an AdaptiveBatchSizer, batches are cut by serialized size rather than
+row count, and the byte budget is tuned from each response AIMD-style:
+it grows by a fixed step while requests come back fast, and halves on a
+slow response, a 413 (payload too large) or a timeout.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Rows that cannot be written are appended here, one JSON object per line
+DEAD_LETTER_PATH = os.getenv("DEAD_LETTER_PATH", "dead_letter.jsonl")
+
+# Adaptive batch sizing defaults (bytes of JSON per request)
+INITIAL_BATCH_BYTES = 128 * 1024
+MIN_BATCH_BYTES = 8 * 1024
+MAX_BATCH_BYTES = 2 * 1024 * 1024
+BATCH_BYTES_STEP = 32 * 1024
+TARGET_LATENCY_SECONDS = 2.0
+MAX_BATCH_ROWS = 1000
+
+# HTTP statuses that mean the batch was too big or too slow
+SHRINK_STATUSES = {408, 413, 504}
+
+# HTTP statuses that blame the batch's rows: bisect to isolate them
+ROW_ERROR_STATUSES = {400, 409, 413, 422}
+
+# HTTP statuses worth retrying with the same batch
+TRANSIENT_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# SQLSTATE classes in supabase-py's APIError.code: data exceptions and
+# constraint violations blame rows; connection, transaction rollback,
+# resource and operator-intervention errors (e.g. statement timeout) are transient
+ROW_ERROR_SQLSTATE_CLASSES = {"22", "23"}
+TRANSIENT_SQLSTATE_CLASSES = {"08", "40", "53", "57"}
+
+# Connection-level exception base classes of aiohttp and httpx, matched by name
+# so this module does not import either
+TRANSIENT_ERROR_CLASSES = {"ClientConnectionError", "TransportError"}
+
+# Retries of a transiently failing batch, and the delay before the first
+TRANSIENT_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 1.0
+
+# Seconds the last `send` spent on the request itself. A send that first
+# waits on a rate limiter sets this once it holds its slot, so that the
+# queueing is not mistaken for a slow write; otherwise the whole send is timed.
+request_seconds: ContextVar[Optional[float]] = ContextVar("request_seconds", default=None)
+
+
+def error_status(error: Exception) -> Optional[int]:
+    """HTTP status carried by a write error, if any."""
+    for source in (error, getattr(error, "response", None)):
+        for attribute in ("status", "status_code", "code"):
+            value = getattr(source, attribute, None)
+            if isinstance(value, int):
+                return value
+    return None
+
+
+def _sqlstate_class(error: Exception) -> Optional[str]:
+    code = getattr(error, "code", None)
+    if isinstance(code, str) and len(code) == 5 and not code.startswith("PGRST"):
+        return code[:2]
+    return None
+
+
+def is_row_error(error: Exception) -> bool:
+    """True when the database rejected the batch because of (some of) its rows."""
+    status = error_status(error)
+    if status is not None:
+        return status in ROW_ERROR_STATUSES
+    return _sqlstate_class(error) in ROW_ERROR_SQLSTATE_CLASSES
+
+
+def is_transient(error: Exception) -> bool:
+    """True when the same batch may well succeed if sent again."""
+    status = error_status(error)
+    if status is not None:
+        return status in TRANSIENT_STATUSES or status >= 500
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    if _sqlstate_class(error) in TRANSIENT_SQLSTATE_CLASSES:
+        return True
+    return any(cls.__name__ in TRANSIENT_ERROR_CLASSES for cls in type(error).__mro__)
+
+
+class AdaptiveBatchSizer:
+    """Byte budget for write batches, tuned additive-increase / multiplicative-decrease."""
+
+    def __init__(self, initial_bytes: int = INITIAL_BATCH_BYTES, min_bytes: int = MIN_BATCH_BYTES,
+                 max_bytes: int = MAX_BATCH_BYTES, step_bytes: int = BATCH_BYTES_STEP,
+                 target_latency: float = TARGET_LATENCY_SECONDS, max_rows: int = MAX_BATCH_ROWS):
+        self.budget = initial_bytes
+        self.min_bytes = min_bytes
+        self.max_bytes = max_bytes
+        self.step_bytes = step_bytes
+        self.target_latency = target_latency
+        self.max_rows = max_rows
+        # One entry per request: (rows, bytes, seconds, succeeded, budget after)
+        self.history: List[tuple] = []
+
+    def batches(self, rows: List[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+        """Cut rows into batches under the current budget; the budget is re-read for every batch."""
+        batch: List[Dict[str, Any]] = []
+        size = 0
+        for row in rows:
+            row_size = len(json.dumps(row, default=str)) + 1
+            if batch and (size + row_size > self.budget or len(batch) >= self.max_rows):
+                yield batch
+                batch, size = [], 0
+            batch.append(row)
+            size += row_size
+        if batch:
+            yield batch
+
+    def record(self, rows: int, size: int, seconds: float, error: Optional[Exception] = None) -> None:
+        """Adjust the budget from one request's outcome."""
+        too_big = error is not None and (isinstance(error, asyncio.TimeoutError)
+                                         or getattr(error, "status", None) in SHRINK_STATUSES)
+        if too_big or (error is None and seconds > self.target_latency):
+            self.budget = max(self.min_bytes, self.budget // 2)
+        elif error is None:
+            self.budget = min(self.max_bytes, self.budget + self.step_bytes)
+        self.history.append((rows, size, seconds, error is None, self.budget))
+
+    def metrics(self) -> Dict[str, Any]:
+        """Summary of the sizes chosen so far."""
+        if not self.history:
+            return {"requests": 0, "budget_bytes": self.budget}
+        recent = self.history[-10:]
+        return {
+            "requests": len(self.history),
+            "failed": sum(1 for entry in self.history if not entry[3]),
+            "budget_bytes": self.budget,
+            "recent_rows_per_batch": sum(entry[0] for entry in recent) / len(recent),
+            "recent_bytes_per_batch": sum(entry[1] for entry in recent) / len(recent),
+            "recent_seconds_per_batch": round(sum(entry[2] for entry in recent) / len(recent), 3),
+        }
+
+
+class BatchWriter:
+    """Write rows through `send(batch)` in batches, isolating rows that fail."""
+
+    def __init__(self, send: Callable[[List[Dict[str, Any]]], Awaitable[Any]],
+                 table: str, batch_size: int = 50,
+                 dead_letter_path: Optional[str] = DEAD_LETTER_PATH,
+                 sizer: Optional[AdaptiveBatchSizer] = None,
+                 retries: int = TRANSIENT_RETRIES, backoff: float = RETRY_BACKOFF_SECONDS):
+        self.send = send
+        self.table = table
+        self.batch_size = batch_size
+        self.dead_letter_path = dead_letter_path
+        self.sizer = sizer
+        self.retries = retries
+        self.backoff = backoff
+        self.requests = 0
+        self.written = 0
+        self.dead_letters = 0
+
+    async def write(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Write all rows; returns the rows the server sent back for the successful writes."""
+        results: List[Dict[str, Any]] = []
+        if self.sizer:
+            batches = self.sizer.batches(rows)
+        else:
+            batches = (rows[i:i + self.batch_size] for i in range(0, len(rows), self.batch_size))
+        for batch in batches:
+            await self._write_batch(batch, results)
+        if self.dead_letters:
+            logger.warning(f"{self.dead_letters} {self.table} rows failed and were written to {self.dead_letter_path}")
+        return results
+
+    async def _write_batch(self, batch: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> None:
+        attempt = 0
+        while True:
+            self.requests += 1
+            request_seconds.set(None)
+            started = time.perf_counter()
+            try:
+                result = await self.send(batch)
+                break
+            except Exception as e:
+                self._record(batch, started, e)
+                if is_transient(e) and attempt < self.retries:
+                    delay = self.backoff * 2 ** attempt
+                    attempt += 1
+                    logger.warning(f"Batch of {len(batch)} {self.table} rows failed ({e}); "
+                                   f"retry {attempt}/{self.retries} in {delay:g}s")
+                    await asyncio.sleep(delay)
+                    continue
+                if not is_row_error(e):
+                    raise
+                if len(batch) == 1:
+                    self._dead_letter(batch[0], e)
+                    return
+                middle = len(batch) // 2
+                logger.debug(f"Batch of {len(batch)} {self.table} rows failed ({e}); retrying halves")
+                await self._write_batch(batch[:middle], results)
+                await self._write_batch(batch[middle:], results)
+                return
+
+        self._record(batch, started)
+        self.written += len(batch)
+        if isinstance(result, list):
+            results.extend(result)
+        elif result:
+            results.append(result)
+
+    def _record(self, batch: List[Dict[str, Any]], started: float, error: Optional[Exception] = None) -> None:
+        if self.sizer:
+            size = sum(len(json.dumps(row, default=str)) + 1 for row in batch)
+            seconds = request_seconds.get()
+            if seconds is None:
+                seconds = time.perf_counter() - started
+            self.sizer.record(len(batch), size, seconds, error)
+
+    def _dead_letter(self, row: Dict[str, Any], error: Exception) -> None:
+        self.dead_letters += 1
+        logger.error(f"Failed to write {self.table} row {row.get('external_id', '')}: {error}")
+        if not self.dead_letter_path:
+            return
+        entry = {
+            "table": self.table,
+            "failed_at": datetime.now(timezone.utc).isoformat(),
+            "status": getattr(error, "status", None),
+            "error": getattr(error, "body", None) or str(error),
+            "row": row,
+        }
+        with open(self.dead_letter_path, "a") as f:
+            f.write(json.dumps(entry, default=str) + "\n")
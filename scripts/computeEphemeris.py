@@ -1,7 +1,6 @@
-
 #!/usr/bin/env python3
 """
-computeEphemeris.py - Generate astronomical ephemeris data for 2025
+computeEphemeris.py - Generate astronomical ephemeris data for any date range
 and store it in Supabase for use in sports betting astrological calculations.
 
 This script uses Swiss Ephemeris (pyswisseph) to calculate:
@@ -10,34 +9,44 @@ This script uses Swiss Ephemeris (pyswisseph) to calculate:
 - Mercury retrograde status
 - Major aspects (Sun-Mars, Sun-Saturn, Sun-Jupiter transits)
 
+Every body is computed once per timestamp into a NumPy array of shape
+(timestamps, bodies, [longitude, latitude, speed]); signs, phases, retrograde
+flags and aspects are then derived from that array with vectorized operations.
+
 Data is stored in the Supabase 'ephemeris' table for later use.
+
+Usage:
+    python computeEphemeris.py                      # current calendar year
+    python computeEphemeris.py --year 2024
+    python computeEphemeris.py --start 1995-01-01 --end 2025-12-31 --workers 16
+    python computeEphemeris.py --start 2025-01-01 --end 2025-01-31 --output jan.json
+    python computeEphemeris.py --start 1995-01-01 --end 2026-12-31 --fill-gaps
 """
 
-import swisseph as swe
+import argparse
 import datetime
-import math
+import hashlib
 import json
 import os
-from supabase import create_client
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import numpy as np
+import swisseph as swe
 
 # Supabase configuration
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_ANON_KEY')
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("Please set SUPABASE_URL and SUPABASE_ANON_KEY environment variables")
-
-# Initialize Supabase client
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-
 # Initialize Swiss Ephemeris
-swe.set_ephe_path('./ephemeris')  # Path to ephemeris files, adjust as needed
+EPHE_PATH = './ephemeris'  # Path to ephemeris files, adjust as needed
+swe.set_ephe_path(EPHE_PATH)
 
 # Constants
-YEAR = 2025
 ZODIAC_SIGNS = [
-    "Aries", "Taurus", "Gemini", "Cancer", 
-    "Leo", "Virgo", "Libra", "Scorpio", 
+    "Aries", "Taurus", "Gemini", "Cancer",
+    "Leo", "Virgo", "Libra", "Scorpio",
     "Sagittarius", "Capricorn", "Aquarius", "Pisces"
 ]
 
@@ -49,6 +58,23 @@ VENUS = swe.VENUS
 MARS = swe.MARS
 JUPITER = swe.JUPITER
 SATURN = swe.SATURN
+URANUS = swe.URANUS
+NEPTUNE = swe.NEPTUNE
+PLUTO = swe.PLUTO
+
+# Bodies computed for every timestamp, in array order
+BODIES = (SUN, MOON, MERCURY, VENUS, MARS, JUPITER, SATURN, URANUS, NEPTUNE, PLUTO)
+BODY_NAMES = ("sun", "moon", "mercury", "venus", "mars",
+              "jupiter", "saturn", "uranus", "neptune", "pluto")
+BODY_INDEX = {body: i for i, body in enumerate(BODIES)}
+
+# Bodies whose sign is written to the daily ephemeris record
+SIGN_BODIES = (SUN, MOON, MERCURY, VENUS, MARS, JUPITER, SATURN)
+
+# Columns of the position array's last axis
+LON, LAT, SPEED = 0, 1, 2
+
+CALC_FLAGS = swe.FLG_SWIEPH | swe.FLG_SPEED
 
 # Aspect orbs (in degrees)
 CONJUNCTION_ORB = 8.0
@@ -57,237 +83,466 @@ TRINE_ORB = 8.0
 SQUARE_ORB = 7.0
 SEXTILE_ORB = 6.0
 
+# Aspects in precedence order: (name, exact angle, orb)
+ASPECTS = (
+    ("conjunction", 0.0, CONJUNCTION_ORB),
+    ("opposition", 180.0, OPPOSITION_ORB),
+    ("trine", 120.0, TRINE_ORB),
+    ("square", 90.0, SQUARE_ORB),
+    ("sextile", 60.0, SEXTILE_ORB),
+)
+
+# Aspect pairs written to the daily ephemeris record
+RECORD_ASPECT_PAIRS = (
+    ("sun_mars", SUN, MARS),
+    ("sun_saturn", SUN, SATURN),
+    ("sun_jupiter", SUN, JUPITER),
+)
+
+# Version of the computation behind each stored row. Bump it whenever a
+# change (orbs, bodies, sign handling, ...) alters the output, so --fill-gaps
+# recomputes rows written by older versions.
+#   1: original per-day script
+#   2: vectorized engine with corrected degree handling
+SCHEMA_VERSION = 2
+
+# Columns written to the 'ephemeris' table
+EPHEMERIS_COLUMNS = (
+    "date", "moon_phase", "moon_sign", "sun_sign", "mercury_sign", "venus_sign",
+    "mars_sign", "jupiter_sign", "saturn_sign", "mercury_retrograde", "aspects",
+    "schema_version",
+)
+
+# Supabase upload tuning
+UPLOAD_CHUNK_SIZE = 500
+UPLOAD_CONCURRENCY = 4
+FETCH_PAGE_SIZE = 1000
+
+# Days generated and stored per step when filling gaps
+GAP_BATCH_DAYS = 2000
+
+# Process pool chunking: several chunks per worker keeps the pool busy
+# to the end, and tiny chunks are not worth the pickling overhead
+CHUNKS_PER_WORKER = 4
+MIN_CHUNK_DAYS = 31
+
+_supabase = None
+
+
+def get_supabase():
+    """Return the Supabase client, creating it on first use."""
+    global _supabase
+    if _supabase is None:
+        from supabase import create_client
+
+        if not SUPABASE_URL or not SUPABASE_KEY:
+            raise ValueError("Please set SUPABASE_URL and SUPABASE_ANON_KEY environment variables")
+        _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _supabase
+
+
 def get_julday(year, month, day):
     """Convert calendar date to Julian day."""
     return swe.utc_to_jd(year, month, day, 0, 0, 0, swe.GREG_CAL)[1]
 
-def get_moon_phase(jd):
-    """Calculate moon phase (0-1) for given Julian day."""
-    # Get positions
-    sun_pos = swe.calc_ut(jd, SUN)
-    moon_pos = swe.calc_ut(jd, MOON)
-    
-    print(f"Raw positions: sun={sun_pos}, moon={moon_pos}")
-    
-    # Extract position (first element of the first tuple)
-    sun_pos = sun_pos[0][0]
-    moon_pos = moon_pos[0][0]
-    
-    print(f"Extracted positions: sun={sun_pos}, moon={moon_pos}")
-    
-    # Convert to degrees
-    sun_pos = math.degrees(sun_pos)
-    moon_pos = math.degrees(moon_pos)
-    
-    print(f"Degrees positions: sun={sun_pos}, moon={moon_pos}")
-    
-    # Normalize to 0-360 degrees
-    sun_pos = (sun_pos + 360) % 360
-    moon_pos = (moon_pos + 360) % 360
-    
-    print(f"Normalized positions: sun={sun_pos}, moon={moon_pos}")
-    
-    # Calculate phase angle
-    phase_angle = (moon_pos - sun_pos) % 360
-    
-    # Convert to 0-1 range (0 = new moon, 0.5 = full moon)
-    phase = phase_angle / 360.0
-    
-    return phase
-
-def get_zodiac_sign(longitude):
-    """Convert ecliptic longitude to zodiac sign."""
-    # Convert to degrees if needed
-    if isinstance(longitude, tuple):
-        longitude = longitude[0]  # Get the first element of the tuple
-    if longitude < 180:
-        longitude = math.degrees(longitude)
-    
-    # Normalize to 0-360 degrees
-    longitude = (longitude + 360) % 360
-    
-    # Get zodiac sign
-    sign_index = int(longitude / 30) % 12
-    return ZODIAC_SIGNS[sign_index]
-
-def is_retrograde(planet, jd):
-    """Check if a planet is retrograde on given Julian day."""
-    # Get planet's speed
-    planet_info = swe.calc_ut(jd, planet)
-    
-    # Get the speed from the correct position in the tuple
-    speed = planet_info[1][3]  # Speed is in the second element, 4th position
-    
-    # If speed is negative, the planet is retrograde
-    return speed < 0
-
-def calculate_aspects(jd):
-    """Calculate major aspects between planets on given Julian day."""
-    # Get positions
-    sun_pos = swe.calc_ut(jd, SUN)
-    mars_pos = swe.calc_ut(jd, MARS)
-    saturn_pos = swe.calc_ut(jd, SATURN)
-    jupiter_pos = swe.calc_ut(jd, JUPITER)
-    
-    print(f"Raw positions: sun={sun_pos}, mars={mars_pos}, saturn={saturn_pos}, jupiter={jupiter_pos}")
-    
-    # Extract position (first element of the first tuple)
-    sun_pos = sun_pos[0][0]
-    mars_pos = mars_pos[0][0]
-    saturn_pos = saturn_pos[0][0]
-    jupiter_pos = jupiter_pos[0][0]
-    
-    print(f"Extracted positions: sun={sun_pos}, mars={mars_pos}, saturn={saturn_pos}, jupiter={jupiter_pos}")
-    
-    # Convert to degrees if needed
-    sun_pos = math.degrees(sun_pos)
-    mars_pos = math.degrees(mars_pos)
-    saturn_pos = math.degrees(saturn_pos)
-    jupiter_pos = math.degrees(jupiter_pos)
-    
-    print(f"Degrees positions: sun={sun_pos}, mars={mars_pos}, saturn={saturn_pos}, jupiter={jupiter_pos}")
-    
-    # Normalize to 0-360 degrees
-    sun_pos = (sun_pos + 360) % 360
-    mars_pos = (mars_pos + 360) % 360
-    saturn_pos = (saturn_pos + 360) % 360
-    jupiter_pos = (jupiter_pos + 360) % 360
-    
-    print(f"Normalized positions: sun={sun_pos}, mars={mars_pos}, saturn={saturn_pos}, jupiter={jupiter_pos}")
-    
-    aspects = {
-        "sun_mars": check_aspect(sun_pos, mars_pos),
-        "sun_saturn": check_aspect(sun_pos, saturn_pos),
-        "sun_jupiter": check_aspect(sun_pos, jupiter_pos)
-    }
-    
-    return aspects
-
-def check_aspect(pos1, pos2):
-    """Check for aspects between two celestial positions."""
-    # Convert to degrees if needed
-    pos1 = math.degrees(pos1) if pos1 < 180 else pos1
-    pos2 = math.degrees(pos2) if pos2 < 180 else pos2
-    
-    # Calculate the angular difference
-    diff = abs((pos1 - pos2 + 180) % 360 - 180)
-    
-    # Check for each aspect type
-    if diff < CONJUNCTION_ORB:
-        return "conjunction"
-    elif abs(diff - 180) < OPPOSITION_ORB:
-        return "opposition"
-    elif abs(diff - 120) < TRINE_ORB:
-        return "trine"
-    elif abs(diff - 90) < SQUARE_ORB:
-        return "square"
-    elif abs(diff - 60) < SEXTILE_ORB:
-        return "sextile"
+
+def parse_game_time(value):
+    """Parse a games.game_time_utc value to an aware UTC datetime."""
+    return datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+
+
+def datetime_to_jd(dt):
+    """Convert a datetime (naive values are taken as UTC) to a UT Julian day."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(datetime.timezone.utc)
+    seconds = dt.second + dt.microsecond / 1e6
+    return swe.utc_to_jd(dt.year, dt.month, dt.day, dt.hour, dt.minute, seconds, swe.GREG_CAL)[1]
+
+
+def jd_to_datetime(jd):
+    """Convert a UT Julian day to a timezone-aware UTC datetime."""
+    year, month, day, hour, minute, seconds = swe.jdut1_to_utc(float(jd), swe.GREG_CAL)
+    # Round to the millisecond so 59.9999s rolls over instead of truncating
+    return (datetime.datetime(year, month, day, hour, minute, tzinfo=datetime.timezone.utc)
+            + datetime.timedelta(seconds=round(seconds, 3)))
+
+
+def julian_days(start_date, end_date, step_days=1.0):
+    """Return the Julian days from start_date up to and including end_date.
+
+    Each sample is anchored to the UT Julian day of its own UTC calendar day,
+    so results do not drift across leap seconds and do not depend on where
+    a range starts.
+    """
+    count = int(np.floor((end_date - start_date).days / step_days + 1e-9)) + 1
+    offsets = np.arange(count) * step_days
+    whole_days = np.floor(offsets + 1e-9)
+    unique_days = np.unique(whole_days)
+    anchors = np.empty(len(unique_days))
+    for i, days in enumerate(unique_days):
+        day = start_date + datetime.timedelta(days=int(days))
+        anchors[i] = get_julday(day.year, day.month, day.day)
+    return anchors[np.searchsorted(unique_days, whole_days)] + (offsets - whole_days)
+
+
+def compute_positions(jds, bodies=BODIES):
+    """Compute positions for every body at every Julian day.
+
+    Returns an array of shape (len(jds), len(bodies), 3) holding ecliptic
+    longitude (degrees), latitude (degrees) and longitude speed (degrees/day).
+    Each body is computed exactly once per timestamp.
+    """
+    jds = np.asarray(jds, dtype=np.float64)
+    positions = np.empty((len(jds), len(bodies), 3), dtype=np.float64)
+    for t, jd in enumerate(jds):
+        for b, body in enumerate(bodies):
+            xx = swe.calc_ut(float(jd), body, CALC_FLAGS)[0]
+            positions[t, b, LON] = xx[0]
+            positions[t, b, LAT] = xx[1]
+            positions[t, b, SPEED] = xx[3]
+    return positions
+
+
+def sign_indices(longitudes):
+    """Convert ecliptic longitudes (degrees) to zodiac sign indices 0-11."""
+    return (np.floor(np.mod(longitudes, 360.0) / 30.0) % 12).astype(np.int8)
+
+
+def moon_phases(positions):
+    """Moon phase (0-1) for each timestamp; 0 = new moon, 0.5 = full moon."""
+    sun = positions[:, BODY_INDEX[SUN], LON]
+    moon = positions[:, BODY_INDEX[MOON], LON]
+    return np.mod(moon - sun, 360.0) / 360.0
+
+
+def retrograde_flags(positions):
+    """Boolean array (timestamps x bodies), True where the body is retrograde."""
+    return positions[:, :, SPEED] < 0
+
+
+def angular_separation(lon1, lon2):
+    """Smallest angle (0-180 degrees) between two longitudes, element-wise."""
+    return np.abs(np.mod(lon1 - lon2 + 180.0, 360.0) - 180.0)
+
+
+def classify_aspects(separation, orbs=None):
+    """Classify separations into aspects.
+
+    Returns an int8 array of indices into ASPECTS, -1 where no aspect is in orb.
+    Earlier entries in ASPECTS take precedence, matching the original
+    if/elif chain. `orbs` optionally overrides the orb of each ASPECTS entry.
+    """
+    separation = np.asarray(separation)
+    if orbs is None:
+        orbs = [orb for _, _, orb in ASPECTS]
+    result = np.full(separation.shape, -1, dtype=np.int8)
+    for i, (_, angle, _) in reversed(list(enumerate(ASPECTS))):
+        result[np.abs(separation - angle) < orbs[i]] = i
+    return result
+
+
+def build_daily_records(dates, positions):
+    """Turn a position array into the daily ephemeris records stored in Supabase."""
+    signs = sign_indices(positions[:, :, LON])
+    phases = moon_phases(positions)
+    retrograde = retrograde_flags(positions)
+
+    aspect_codes = {}
+    for key, body1, body2 in RECORD_ASPECT_PAIRS:
+        separation = angular_separation(positions[:, BODY_INDEX[body1], LON],
+                                        positions[:, BODY_INDEX[body2], LON])
+        aspect_codes[key] = classify_aspects(separation)
+
+    mercury = BODY_INDEX[MERCURY]
+    records = []
+    for t, date in enumerate(dates):
+        record = {"date": date.isoformat(), "moon_phase": float(phases[t])}
+        for body in SIGN_BODIES:
+            b = BODY_INDEX[body]
+            record[f"{BODY_NAMES[b]}_sign"] = ZODIAC_SIGNS[signs[t, b]]
+        record["mercury_retrograde"] = bool(retrograde[t, mercury])
+        record["schema_version"] = SCHEMA_VERSION
+        record["aspects"] = {
+            key: ASPECTS[codes[t]][0] if codes[t] >= 0 else None
+            for key, codes in aspect_codes.items()
+        }
+        records.append(record)
+    return records
+
+
+def init_worker(ephe_path):
+    """Process pool initializer: point this worker's Swiss Ephemeris at the data files.
+
+    Shared by every script that computes positions in a process pool.
+    """
+    swe.set_ephe_path(ephe_path)
+
+
+def _generate_range(start_date, end_date):
+    """Daily ephemeris records for one contiguous date range."""
+    jds = julian_days(start_date, end_date)
+    dates = [start_date + datetime.timedelta(days=i) for i in range(len(jds))]
+    return build_daily_records(dates, compute_positions(jds))
+
+
+def split_date_range(start_date, end_date, chunks):
+    """Split [start_date, end_date] into at most `chunks` contiguous, ordered ranges."""
+    total_days = (end_date - start_date).days + 1
+    size = max(MIN_CHUNK_DAYS, -(-total_days // chunks))
+    ranges = []
+    for offset in range(0, total_days, size):
+        chunk_start = start_date + datetime.timedelta(days=offset)
+        chunk_end = min(end_date, chunk_start + datetime.timedelta(days=size - 1))
+        ranges.append((chunk_start, chunk_end))
+    return ranges
+
+
+def generate_ephemeris(start_date, end_date, workers=1):
+    """Generate daily ephemeris records from start_date to end_date inclusive.
+
+    With workers > 1 the range is split into chunks computed in a process
+    pool; results are merged in date order, so the output is identical to a
+    single-process run.
+    """
+    total_days = (end_date - start_date).days + 1
+    print(f"Generating ephemeris data for {start_date.isoformat()} to {end_date.isoformat()} "
+          f"({total_days} days, {workers} worker{'s' if workers != 1 else ''})...")
+    started = time.perf_counter()
+
+    if workers <= 1:
+        records = _generate_range(start_date, end_date)
     else:
-        return None
+        ranges = split_date_range(start_date, end_date, workers * CHUNKS_PER_WORKER)
+        records = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(os.path.abspath(EPHE_PATH),)) as pool:
+            # map() yields in submission order, which is date order
+            for chunk in pool.map(_generate_range, *zip(*ranges)):
+                records.extend(chunk)
+
+    print(f"Computed {len(records)} days in {time.perf_counter() - started:.2f}s")
+    return records
+
 
 def generate_ephemeris_for_year(year):
     """Generate ephemeris data for entire year."""
-    start_date = datetime.date(year, 1, 1)
-    end_date = datetime.date(year, 12, 31)
-    current_date = start_date
-    
-    ephemeris_data = []
-    
-    print(f"Generating ephemeris data for {year}...")
-    
-    while current_date <= end_date:
-        print(f"Processing {current_date.isoformat()}...")
-        
-        jd = get_julday(current_date.year, current_date.month, current_date.day)
-        
-        # Get planetary positions
-        sun_pos = swe.calc_ut(jd, SUN)[0][0]
-        moon_pos = swe.calc_ut(jd, MOON)[0][0]
-        mercury_pos = swe.calc_ut(jd, MERCURY)[0][0]
-        venus_pos = swe.calc_ut(jd, VENUS)[0][0]
-        mars_pos = swe.calc_ut(jd, MARS)[0][0]
-        jupiter_pos = swe.calc_ut(jd, JUPITER)[0][0]
-        saturn_pos = swe.calc_ut(jd, SATURN)[0][0]
-        
-        # Calculate moon phase and aspects
-        moon_phase = get_moon_phase(jd)
-        aspects = calculate_aspects(jd)
-        
-        # Check for Mercury retrograde
-        mercury_retrograde = is_retrograde(MERCURY, jd)
-        
-        # Create daily record
-        daily_data = {
-            "date": current_date.isoformat(),
-            "moon_phase": moon_phase,
-            "moon_sign": get_zodiac_sign(moon_pos),
-            "sun_sign": get_zodiac_sign(sun_pos),
-            "mercury_sign": get_zodiac_sign(mercury_pos),
-            "venus_sign": get_zodiac_sign(venus_pos),
-            "mars_sign": get_zodiac_sign(mars_pos),
-            "jupiter_sign": get_zodiac_sign(jupiter_pos),
-            "saturn_sign": get_zodiac_sign(saturn_pos),
-            "mercury_retrograde": mercury_retrograde,
-            "aspects": aspects
-        }
-        
-        ephemeris_data.append(daily_data)
-        current_date += datetime.timedelta(days=1)
-    
-    return ephemeris_data
-
-def store_in_supabase(ephemeris_data):
-    """Store ephemeris data in Supabase."""
-    print(f"Storing {len(ephemeris_data)} records in Supabase...")
-    
+    return generate_ephemeris(datetime.date(year, 1, 1), datetime.date(year, 12, 31))
+
+
+def row_hash(row):
+    """Content hash of an ephemeris row, stable across JSON key order.
+
+    Computed from the values as generated and stored in the row's
+    content_hash column, so it never depends on how the database
+    normalizes them.
+    """
+    canonical = json.dumps({column: row.get(column) for column in EPHEMERIS_COLUMNS},
+                           sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(canonical.encode()).hexdigest()
+
+
+def fetch_all(table, columns, start_date=None, end_date=None, key="date", where=None):
+    """Read every matching row of a table ordered by `key`, a page at a time.
+
+    start_date/end_date optionally bound the key column; `where` maps
+    column names to lists of allowed values.
+    """
+    rows = []
+    offset = 0
+    while True:
+        query = get_supabase().table(table).select(columns)
+        if start_date is not None:
+            query = query.gte(key, str(start_date))
+        if end_date is not None:
+            query = query.lte(key, str(end_date))
+        for column, values in (where or {}).items():
+            query = query.in_(column, list(values))
+        response = query.order(key).range(offset, offset + FETCH_PAGE_SIZE - 1).execute()
+        rows.extend(response.data)
+        if len(response.data) < FETCH_PAGE_SIZE:
+            return rows
+        offset += FETCH_PAGE_SIZE
+
+
+def fetch_stored_hashes(start_date, end_date):
+    """Return {date: content_hash} for rows already stored between the two dates."""
+    rows = fetch_all("ephemeris", "date,content_hash", start_date, end_date)
+    return {row["date"]: row.get("content_hash") for row in rows}
+
+
+def fetch_stored_versions(start_date, end_date):
+    """Return {date: schema_version} for rows already stored between the two dates."""
+    rows = fetch_all("ephemeris", "date,schema_version", start_date, end_date)
+    return {row["date"]: row.get("schema_version") or 0 for row in rows}
+
+
+def fetch_cached_dates(start_date, end_date):
+    """Dates between the two dates that the astrology API has cached in astro_cache."""
+    # Read through the next day so timestamp keys later on end_date are included
+    rows = fetch_all("astro_cache", "date", start_date, end_date + datetime.timedelta(days=1))
+    dates = {datetime.date.fromisoformat(str(row["date"])[:10]) for row in rows}
+    return {day for day in dates if start_date <= day <= end_date}
+
+
+def find_gap_dates(start_date, end_date):
+    """Dates that are missing from the ephemeris table or were written by an older SCHEMA_VERSION.
+
+    Candidates are every date in [start_date, end_date]. Dates the API has
+    cached in astro_cache within that range are among them, so dates that
+    have been served end up backed by an ephemeris row.
+    """
+    wanted = {start_date + datetime.timedelta(days=i) for i in range((end_date - start_date).days + 1)}
+    wanted |= fetch_cached_dates(start_date, end_date)
+    stored = fetch_stored_versions(start_date, end_date)
+    return sorted(d for d in wanted if stored.get(d.isoformat(), 0) < SCHEMA_VERSION)
+
+
+def contiguous_ranges(dates, max_days):
+    """Group sorted dates into (start, end) runs of consecutive days, each at most max_days long."""
+    ranges = []
+    for day in dates:
+        if ranges and day - ranges[-1][1] == datetime.timedelta(days=1) \
+                and (day - ranges[-1][0]).days < max_days:
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return [tuple(r) for r in ranges]
+
+
+def fill_gaps(start_date, end_date, workers=1):
+    """Compute and store only the missing or stale dates, batch by batch.
+
+    Returns the (written, failed) row counts.
+    """
+    gaps = find_gap_dates(start_date, end_date)
+    if not gaps:
+        print("Ephemeris table is up to date; nothing to fill.")
+        return 0, 0
+
+    ranges = contiguous_ranges(gaps, GAP_BATCH_DAYS)
+    print(f"Filling {len(gaps)} missing or stale dates in {len(ranges)} batches...")
+    written = failed = 0
+    for range_start, range_end in ranges:
+        batch_written, _, batch_failed = store_in_supabase(
+            generate_ephemeris(range_start, range_end, workers), compare=False)
+        written += batch_written
+        failed += batch_failed
+    return written, failed
+
+
+def upsert_chunk(chunk, table="ephemeris", on_conflict="date"):
+    """Upsert one chunk of rows, returning the number of rows sent."""
+    from postgrest.types import ReturnMethod
+
+    get_supabase().table(table).upsert(
+        chunk, on_conflict=on_conflict, returning=ReturnMethod.minimal
+    ).execute()
+    return len(chunk)
+
+
+def store_in_supabase(ephemeris_data, chunk_size=UPLOAD_CHUNK_SIZE, concurrency=UPLOAD_CONCURRENCY,
+                      compare=True):
+    """Upsert ephemeris data in Supabase, skipping rows that are already up to date.
+
+    Each row is written with its content hash, and only rows whose hash
+    differs from the stored one are sent, in chunks of chunk_size with up
+    to `concurrency` requests in flight. Safe to re-run. Pass compare=False
+    when the rows are already known to be missing or stale.
+
+    Returns the (written, skipped, failed) row counts.
+    """
+    if not ephemeris_data:
+        return 0, 0, 0
+
+    started = time.perf_counter()
+    rows = []
     for data in ephemeris_data:
-        # Format aspects as JSONB
-        aspects_json = json.dumps(data["aspects"])
-        
-        # Insert into Supabase
-        try:
-            response = supabase.table("ephemeris").insert({
-                "date": data["date"],
-                "moon_phase": data["moon_phase"],
-                "moon_sign": data["moon_sign"],
-                "sun_sign": data["sun_sign"],
-                "mercury_sign": data["mercury_sign"],
-                "venus_sign": data["venus_sign"],
-                "mars_sign": data["mars_sign"],
-                "jupiter_sign": data["jupiter_sign"],
-                "saturn_sign": data["saturn_sign"],
-                "mercury_retrograde": data["mercury_retrograde"],
-                "aspects": data["aspects"]
-            }).execute()
-            
-            # Check for errors
-            if hasattr(response, 'error') and response.error:
-                print(f"Error storing data for {data['date']}: {response.error}")
-            else:
-                print(f"Successfully stored data for {data['date']}")
-                
-        except Exception as e:
-            print(f"Exception storing data for {data['date']}: {e}")
-    
-    print("Finished storing ephemeris data.")
+        row = {column: data[column] for column in EPHEMERIS_COLUMNS}
+        row["content_hash"] = row_hash(row)
+        rows.append(row)
+    stored = fetch_stored_hashes(rows[0]["date"], rows[-1]["date"]) if compare else {}
+    changed = [row for row in rows if stored.get(row["date"]) != row["content_hash"]]
+    skipped = len(rows) - len(changed)
+    chunks = [changed[i:i + chunk_size] for i in range(0, len(changed), chunk_size)]
+    print(f"Storing {len(changed)} of {len(rows)} records in Supabase "
+          f"({skipped} unchanged, {len(chunks)} chunks)...")
+
+    written = failed = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(upsert_chunk, chunk): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            chunk = futures[future]
+            try:
+                written += future.result()
+            except Exception as e:
+                failed += len(chunk)
+                print(f"Exception storing {chunk[0]['date']} to {chunk[-1]['date']}: {e}")
+
+    elapsed = time.perf_counter() - started
+    print(f"Finished storing ephemeris data: {written} written, {skipped} skipped, {failed} failed "
+          f"in {elapsed:.2f}s ({written / elapsed if elapsed else 0:.0f} rows/s)")
+    return written, skipped, failed
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Generate ephemeris data and store it in Supabase')
+    parser.add_argument('--year', type=int, default=datetime.date.today().year,
+                        help='Calendar year to generate (default: current year)')
+    parser.add_argument('--start', type=datetime.date.fromisoformat,
+                        help='First date to generate (YYYY-MM-DD); overrides --year')
+    parser.add_argument('--end', type=datetime.date.fromisoformat,
+                        help='Last date to generate (YYYY-MM-DD); overrides --year')
+    parser.add_argument('--output', help='Write records to this JSON file instead of Supabase')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Worker processes for generation (default: 1)')
+    parser.add_argument('--fill-gaps', action='store_true',
+                        help='Only compute dates missing from Supabase or written by an older schema version')
+    args = parser.parse_args()
+
+    args.start = args.start or datetime.date(args.year, 1, 1)
+    args.end = args.end or datetime.date(args.year, 12, 31)
+    if args.end < args.start:
+        parser.error('--end must not be before --start')
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.fill_gaps and args.output:
+        parser.error('--fill-gaps writes to Supabase and cannot be combined with --output')
+    return args
+
 
 def main():
-    """Main execution function."""
+    """Main execution function; returns the exit status."""
+    args = parse_args()
     try:
-        # Generate ephemeris data for 2025
-        ephemeris_data = generate_ephemeris_for_year(YEAR)
-        
-        # Store in Supabase
-        store_in_supabase(ephemeris_data)
-        
-        print(f"Successfully generated and stored ephemeris data for {YEAR}.")
-        
+        if args.fill_gaps:
+            filled, failed = fill_gaps(args.start, args.end, args.workers)
+            print(f"Filled {filled} dates for {args.start.isoformat()} to {args.end.isoformat()}"
+                  f"{f'; {failed} failed' if failed else ''}.")
+            return 1 if failed else 0
+
+        ephemeris_data = generate_ephemeris(args.start, args.end, args.workers)
+
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(ephemeris_data, f, indent=2)
+            print(f"Wrote {len(ephemeris_data)} records to {args.output}")
+        else:
+            _, _, failed = store_in_supabase(ephemeris_data)
+            if failed:
+                print(f"Failed to store {failed} ephemeris records for "
+                      f"{args.start.isoformat()} to {args.end.isoformat()}.")
+                return 1
+            print(f"Successfully generated and stored ephemeris data for "
+                  f"{args.start.isoformat()} to {args.end.isoformat()}.")
+        return 0
+
     except Exception as e:
         print(f"Error: {e}")
+        return 1
     finally:
         # Close Swiss Ephemeris
         swe.close()
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
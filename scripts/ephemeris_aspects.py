@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+ephemeris_aspects.py - Precompute the full pairwise aspect matrix.
+
+For every timestamp, the separations between all pairs of the ten bodies in
+computeEphemeris.BODIES are computed in one array operation and classified
+against the five major aspects. Each aspect in orb is marked as applying or
+separating from the speed columns, and carries the exact UTC time at which it
+perfects (found by bracketing and root refinement, as in ephemeris_events.py).
+Aspects in orb at either end of the range are followed past it until they
+perfect or leave orb, so they get a time too.
+
+The output mirrors the aspect objects built per request by
+api/unified-astro.js (`calculateAspects` / `isApplying`), so the API can look
+them up instead of recomputing them.
+
+Usage:
+    python ephemeris_aspects.py --start 2025-01-01 --end 2025-12-31 --output aspects_2025.json
+    python ephemeris_aspects.py --start 2025-06-01 --end 2025-06-30 --orbs square=8,sextile=4 --output june.json
+"""
+
+import argparse
+import datetime
+import json
+import time
+
+import numpy as np
+import swisseph as swe
+
+from computeEphemeris import (
+    ASPECTS,
+    BODIES,
+    BODY_NAMES,
+    LON,
+    SPEED,
+    classify_aspects,
+    compute_positions,
+    jd_to_datetime,
+    julian_days,
+)
+from ephemeris_events import TOLERANCE_SECONDS, calc_column, refine_brackets, wrap_angle
+
+ASPECT_NAMES = tuple(name for name, _, _ in ASPECTS)
+ASPECT_ANGLES = np.array([angle for _, angle, _ in ASPECTS])
+DEFAULT_ORBS = {name: orb for name, _, orb in ASPECTS}
+
+# Every unordered pair of bodies, as parallel index arrays into BODIES
+PAIR_I, PAIR_J = (a.astype(np.int8) for a in np.triu_indices(len(BODIES), k=1))
+
+# Samples evaluated per pair and iteration when following an aspect past the
+# end of the grid
+EDGE_BLOCK = 64
+
+# How far an aspect is followed past the end of the grid; aspects between the
+# outer planets can stay in orb for decades
+EDGE_SEARCH_DAYS = 200 * 365.25
+
+# One row per exact aspect; `pair` indexes PAIR_I/PAIR_J, `aspect` indexes ASPECTS
+PERFECTION_DTYPE = np.dtype([
+    ("jd", "f8"),
+    ("pair", "i1"),
+    ("aspect", "i1"),
+])
+
+
+def resolve_orbs(orbs=None):
+    """Orb for each ASPECTS entry, with per-aspect overrides from a name->orb mapping."""
+    merged = dict(DEFAULT_ORBS)
+    merged.update(orbs or {})
+    unknown = set(merged) - set(DEFAULT_ORBS)
+    if unknown:
+        raise ValueError(f"Unknown aspects in orbs: {', '.join(sorted(unknown))}")
+    return np.array([merged[name] for name in ASPECT_NAMES])
+
+
+def aspect_matrix(positions, orbs=None):
+    """Classify every body pair at every timestamp.
+
+    Returns a dict of (timestamps x pairs) arrays:
+        separation: angular separation in degrees (0-180)
+        aspect:     index into ASPECTS, -1 where no aspect is in orb
+        orb:        distance from exact in degrees (NaN where no aspect)
+        applying:   True where the aspect is getting closer to exact
+    """
+    orb_limits = resolve_orbs(orbs)
+    lon = positions[:, :, LON]
+    speed = positions[:, :, SPEED]
+
+    signed = wrap_angle(lon[:, PAIR_I] - lon[:, PAIR_J])
+    separation = np.abs(signed)
+    # Rate of change of the (unsigned) separation, degrees/day
+    rate = np.sign(signed) * (speed[:, PAIR_I] - speed[:, PAIR_J])
+
+    aspect = classify_aspects(separation, orb_limits)
+    has_aspect = aspect >= 0
+    offset = separation - ASPECT_ANGLES[np.where(has_aspect, aspect, 0)]
+    orb = np.where(has_aspect, np.abs(offset), np.nan)
+    # |separation - angle| shrinking means the aspect is applying
+    applying = has_aspect & (np.sign(offset) * rate < 0)
+
+    return {
+        "separation": separation,
+        "aspect": aspect,
+        "orb": orb,
+        "applying": applying,
+    }
+
+
+def _pair_signed_separation(jds, pairs):
+    """Signed separation (body i minus body j) of each pair at each Julian day."""
+    return wrap_angle(calc_column(jds, PAIR_I[pairs], LON) - calc_column(jds, PAIR_J[pairs], LON))
+
+
+def find_perfections(grid, positions, tolerance_seconds=TOLERANCE_SECONDS):
+    """Exact times at which any pair forms any of the major aspects.
+
+    Brackets zero crossings of (signed separation - aspect angle) between
+    grid samples, for both the waxing and waning side of each aspect, then
+    refines them with ephemeris_events.refine_brackets. Returns a table sorted by time.
+    """
+    lon = positions[:, :, LON]
+    signed = wrap_angle(lon[:, PAIR_I] - lon[:, PAIR_J])
+    tolerance_days = tolerance_seconds / 86400.0
+
+    found = []
+    for a, angle in enumerate(ASPECT_ANGLES):
+        targets = (angle,) if angle in (0.0, 180.0) else (angle, -angle)
+        for target in targets:
+            f = wrap_angle(signed - target)
+            # Skip the wrap-around jump on the far side of the circle
+            near = (np.abs(f[:-1]) < 90.0) & (np.abs(f[1:]) < 90.0)
+            t, p = np.nonzero(((f[:-1] < 0) != (f[1:] < 0)) & near)
+            if not len(t):
+                continue
+            exact = refine_brackets(lambda jd, i: wrap_angle(_pair_signed_separation(jd, p[i]) - target),
+                                    grid[t], grid[t + 1], f[t, p], f[t + 1, p], tolerance_days)
+            rows = np.empty(len(exact), dtype=PERFECTION_DTYPE)
+            rows["jd"] = exact
+            rows["pair"] = p
+            rows["aspect"] = a
+            found.append(rows)
+
+    if not found:
+        return np.empty(0, dtype=PERFECTION_DTYPE)
+    perfections = np.concatenate(found)
+    return perfections[np.argsort(perfections["jd"], kind="stable")]
+
+
+def _edge_stretches(matrix, exact_times, side):
+    """Pairs in orb at one end of the grid that lack a perfection there.
+
+    side -1 is the start of the grid, where separating aspects need an
+    earlier perfection, and +1 the end, where applying aspects need a later
+    one. Returns the pair indices and the aspect each is in.
+    """
+    aspect, exact, applying = matrix["aspect"], exact_times, matrix["applying"]
+    if side > 0:
+        aspect, exact, applying = aspect[::-1], exact[::-1], applying[::-1]
+    edge = aspect[0]
+    # Samples in the same continuous stretch in orb as the edge sample
+    stretch = np.logical_and.accumulate(aspect == edge, axis=0) & (edge >= 0)
+    wanted = applying if side > 0 else ~applying
+    pairs = np.nonzero((stretch & np.isnan(exact) & wanted).any(axis=0))[0]
+    return pairs, edge[pairs]
+
+
+def edge_perfections(jds, positions, matrix, exact_times, step_days, orbs=None,
+                     tolerance_seconds=TOLERANCE_SECONDS):
+    """Perfections outside the grid of aspects in orb at either end of it.
+
+    find_perfections only brackets crossings between grid samples, so an
+    aspect in orb at the first or last sample may perfect outside the grid.
+    For each such pair, steps outward from the edge at step_days until the
+    pair crosses the aspect or leaves its orb, then refines the crossings.
+    Returns a table in the format of find_perfections.
+    """
+    orb_limits = resolve_orbs(orbs)
+    lon = positions[:, :, LON]
+    tolerance_days = tolerance_seconds / 86400.0
+
+    found = []
+    for side, edge in ((-1, 0), (1, len(jds) - 1)):
+        pairs, aspects = _edge_stretches(matrix, exact_times, side)
+        if not len(pairs):
+            continue
+        angles = ASPECT_ANGLES[aspects]
+        signed = wrap_angle(lon[edge, PAIR_I[pairs]] - lon[edge, PAIR_J[pairs]])
+        # The side of the aspect the pair is on; conjunction and opposition have one
+        targets = np.where(np.isin(angles, (0.0, 180.0)), angles, np.copysign(angles, signed))
+        last_jd = np.full(len(pairs), jds[edge])
+        last_f = wrap_angle(signed - targets)
+        offsets = side * step_days * np.arange(1, EDGE_BLOCK + 1)
+
+        brackets = []
+        active = np.arange(len(pairs))
+        travelled = 0.0
+        while len(active) and travelled < EDGE_SEARCH_DAYS:
+            block = last_jd[active, None] + offsets
+            separation = _pair_signed_separation(
+                block.ravel(), np.repeat(pairs[active], EDGE_BLOCK)).reshape(block.shape)
+            f = wrap_angle(separation - targets[active, None])
+            f_before = np.column_stack([last_f[active], f[:, :-1]])
+            jd_before = np.column_stack([last_jd[active], block[:, :-1]])
+            crossed = (((f_before < 0) != (f < 0))
+                       & (np.abs(f_before) < 90.0) & (np.abs(f) < 90.0))
+            left = classify_aspects(np.abs(separation), orb_limits) != aspects[active, None]
+
+            # The first sample that crosses the aspect or leaves its orb ends the search
+            stop = crossed | left
+            stopped = stop.any(axis=1)
+            k = np.argmax(stop, axis=1)
+            n = np.arange(len(active))
+            hit = stopped & crossed[n, k]
+            brackets.append((active[hit], jd_before[n, k][hit], block[n, k][hit],
+                             f_before[n, k][hit], f[n, k][hit]))
+
+            last_jd[active] = block[:, -1]
+            last_f[active] = f[:, -1]
+            active = active[~stopped]
+            travelled += EDGE_BLOCK * step_days
+
+        index, inner, outer, f_inner, f_outer = (np.concatenate(column) for column in zip(*brackets))
+        if not len(index):
+            continue
+        # refine_brackets wants the lower Julian day first
+        lo, hi, f_lo, f_hi = ((outer, inner, f_outer, f_inner) if side < 0
+                              else (inner, outer, f_inner, f_outer))
+        p, target = pairs[index], targets[index]
+        exact = refine_brackets(lambda jd, i: wrap_angle(_pair_signed_separation(jd, p[i]) - target[i]),
+                                lo, hi, f_lo, f_hi, tolerance_days)
+        rows = np.empty(len(exact), dtype=PERFECTION_DTYPE)
+        rows["jd"] = exact
+        rows["pair"] = p
+        rows["aspect"] = aspects[index]
+        found.append(rows)
+
+    if not found:
+        return np.empty(0, dtype=PERFECTION_DTYPE)
+    return np.concatenate(found)
+
+
+def perfection_times(jds, matrix, perfections):
+    """Exact time (Julian day) of each in-orb aspect, NaN if it does not perfect.
+
+    An applying aspect is matched to the next perfection of the same pair and
+    aspect, a separating one to the previous, provided it falls inside the
+    same continuous stretch in orb (a station can turn an aspect back before
+    it perfects).
+    """
+    aspect = matrix["aspect"]
+    applying = matrix["applying"]
+    result = np.full(aspect.shape, np.nan)
+    bounded = np.concatenate([[-np.inf], jds, [np.inf]])
+
+    for p in range(len(PAIR_I)):
+        for a in range(len(ASPECTS)):
+            in_orb = aspect[:, p] == a
+            if not in_orb.any():
+                continue
+            times = perfections["jd"][(perfections["pair"] == p) & (perfections["aspect"] == a)]
+            if not len(times):
+                continue
+
+            t = np.nonzero(in_orb)[0]
+            # Out-of-orb samples bounding each in-orb stretch, with sentinels
+            out = np.concatenate([[-1], np.nonzero(~in_orb)[0], [len(jds)]])
+            k = np.searchsorted(out, t)
+            prev_bound = bounded[out[k - 1] + 1]
+            next_bound = bounded[out[k] + 1]
+
+            n = np.searchsorted(times, jds[t])
+            after = times[np.minimum(n, len(times) - 1)]
+            before = times[np.maximum(n - 1, 0)]
+            exact = np.where(applying[t, p], after, before)
+            valid = np.where(applying[t, p],
+                             (n < len(times)) & (after <= next_bound),
+                             (n > 0) & (before >= prev_bound))
+            result[t[valid], p] = exact[valid]
+    return result
+
+
+def to_records(jds, matrix, exact_times, orbs=None):
+    """Per-timestamp aspect lists in the shape api/unified-astro.js returns."""
+    orb_limits = resolve_orbs(orbs)
+    records = []
+    for t, jd in enumerate(jds):
+        aspects = []
+        for p in np.nonzero(matrix["aspect"][t] >= 0)[0]:
+            a = int(matrix["aspect"][t, p])
+            orb = float(matrix["orb"][t, p])
+            exact = exact_times[t, p]
+            aspects.append({
+                "planet1": BODY_NAMES[PAIR_I[p]],
+                "planet2": BODY_NAMES[PAIR_J[p]],
+                "aspect": ASPECT_NAMES[a],
+                "angle": float(ASPECT_ANGLES[a]),
+                "orb": round(orb, 2),
+                "strength": round(1 - orb / orb_limits[a], 2),
+                "applying": bool(matrix["applying"][t, p]),
+                "exact_time": (jd_to_datetime(exact).isoformat(timespec="seconds").replace("+00:00", "Z")
+                               if not np.isnan(exact) else None),
+            })
+        records.append({
+            "time": jd_to_datetime(jd).isoformat(timespec="seconds").replace("+00:00", "Z"),
+            "aspects": aspects,
+        })
+    return records
+
+
+def compute_aspects(start_date, end_date, step_hours=24.0, orbs=None):
+    """Aspect records for every step from start_date to end_date inclusive."""
+    step_days = step_hours / 24.0
+    jds = julian_days(start_date, end_date, step_days=step_days)
+    positions = compute_positions(jds)
+    matrix = aspect_matrix(positions, orbs)
+    perfections = find_perfections(jds, positions)
+    exact_times = perfection_times(jds, matrix, perfections)
+
+    # Aspects in orb at the ends of the range may perfect outside it
+    outside = edge_perfections(jds, positions, matrix, exact_times, step_days, orbs)
+    if len(outside):
+        perfections = np.concatenate([perfections, outside])
+        perfections = perfections[np.argsort(perfections["jd"], kind="stable")]
+        exact_times = perfection_times(jds, matrix, perfections)
+    return to_records(jds, matrix, exact_times, orbs)
+
+
+def parse_orbs(value):
+    """Parse 'square=8,sextile=4' into a dict."""
+    orbs = {}
+    for item in filter(None, value.split(',')):
+        name, _, orb = item.partition('=')
+        orbs[name.strip().lower()] = float(orb)
+    return orbs
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Precompute pairwise aspects with exact perfection times')
+    parser.add_argument('--start', type=datetime.date.fromisoformat, required=True,
+                        help='First date to compute (YYYY-MM-DD)')
+    parser.add_argument('--end', type=datetime.date.fromisoformat, required=True,
+                        help='Last date to compute (YYYY-MM-DD)')
+    parser.add_argument('--step-hours', type=float, default=24.0,
+                        help='Sampling interval in hours (default: 24)')
+    parser.add_argument('--orbs', type=parse_orbs, default={},
+                        help='Orb overrides, e.g. square=8,sextile=4')
+    parser.add_argument('--output', required=True, help='JSON file to write')
+    args = parser.parse_args()
+    if args.end < args.start:
+        parser.error('--end must not be before --start')
+    return args
+
+
+def main():
+    """Main execution function."""
+    args = parse_args()
+    try:
+        started = time.perf_counter()
+        records = compute_aspects(args.start, args.end, args.step_hours, args.orbs)
+        total = sum(len(r["aspects"]) for r in records)
+        print(f"Computed {total} aspects over {len(records)} timestamps "
+              f"in {time.perf_counter() - started:.2f}s")
+
+        with open(args.output, 'w') as f:
+            json.dump(records, f, indent=2)
+        print(f"Wrote aspects to {args.output}")
+
+    except Exception as e:
+        print(f"Error: {e}")
+    finally:
+        swe.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+ephemeris_chebyshev.py - Chebyshev-compressed ephemeris for fast lookups.
+
+Game-time scoring needs planet positions at arbitrary instants, and calling
+Swiss Ephemeris per game per player is too slow at season scale. This module
+fits each body's ecliptic longitude with fixed-span Chebyshev segments and
+writes them to a compact, versioned binary file. Lookups memory-map the file
+and evaluate longitude and speed (the derivative of the same polynomial) in
+microseconds with NumPy alone; swisseph is only needed to build and verify.
+
+Each body gets the longest span in SPAN_CHOICES whose segments all stay
+within the error tolerance, so the segment for any instant is found by a
+single division (O(1)). Per-segment error bounds are stored in the file.
+
+File layout (little-endian):
+    header      HEADER_DTYPE
+    bodies      BODY_DTYPE x n_bodies
+    per body    float64 coefficients (n_segments x (degree + 1)),
+                float64 max error per segment (arcseconds)
+
+Usage:
+    python ephemeris_chebyshev.py --start 1995-01-01 --end 2030-12-31 --output ephemeris/cheb_1995_2030.bin
+    python ephemeris_chebyshev.py --check ephemeris/cheb_1995_2030.bin --samples 20000
+"""
+
+import argparse
+import datetime
+import mmap
+import time
+
+import numpy as np
+
+MAGIC = b"CHEB"
+FORMAT_VERSION = 1
+
+# Polynomial degree of every segment
+DEGREE = 13
+
+# Candidate segment spans in days, longest first
+SPAN_CHOICES = (32.0, 16.0, 8.0, 4.0)
+
+# Maximum fit error accepted when choosing a span, in arcseconds
+TOLERANCE_ARCSEC = 1.0
+
+# Points per segment at which the fit is checked against Swiss Ephemeris
+CHECK_POINTS = 3 * (DEGREE + 1)
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "S4"),
+    ("version", "<u2"),
+    ("n_bodies", "<u2"),
+    ("start_jd", "<f8"),
+    ("end_jd", "<f8"),
+])
+
+BODY_DTYPE = np.dtype([
+    ("name", "S8"),
+    ("body", "<i4"),
+    ("degree", "<i4"),
+    ("n_segments", "<i4"),
+    ("reserved", "<i4"),
+    ("span", "<f8"),
+    ("max_error", "<f8"),
+    ("coefficients_offset", "<i8"),
+    ("errors_offset", "<i8"),
+])
+
+
+def _chebyshev_nodes(degree):
+    """Chebyshev-Gauss nodes on [-1, 1] in ascending order."""
+    k = np.arange(degree + 1)
+    return -np.cos(np.pi * (k + 0.5) / (degree + 1))
+
+
+def evaluate(coefficients, x, scale):
+    """Evaluate Chebyshev series and their derivatives.
+
+    coefficients has shape (n, degree + 1) and x shape (n,), each row
+    evaluated at its own x in [-1, 1]. The derivative is taken with respect
+    to x and multiplied by scale. Uses T_k' = k * U_(k-1).
+    """
+    t_prev, t_curr = np.ones_like(x), x
+    u_prev, u_curr = np.zeros_like(x), np.ones_like(x)
+    value = coefficients[..., 0] + coefficients[..., 1] * x
+    derivative = coefficients[..., 1] * u_curr
+    for k in range(2, coefficients.shape[-1]):
+        t_prev, t_curr = t_curr, 2 * x * t_curr - t_prev
+        u_prev, u_curr = u_curr, 2 * x * u_curr - u_prev
+        value = value + coefficients[..., k] * t_curr
+        derivative = derivative + k * coefficients[..., k] * u_curr
+    return value, derivative * scale
+
+
+class ChebyshevEphemeris:
+    """Read-only, memory-mapped Chebyshev ephemeris."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header = np.frombuffer(self._mmap, dtype=HEADER_DTYPE, count=1)[0]
+        if header["magic"] != MAGIC:
+            raise ValueError(f"{path} is not a Chebyshev ephemeris file")
+        if header["version"] != FORMAT_VERSION:
+            raise ValueError(f"{path} has format version {header['version']}, expected {FORMAT_VERSION}")
+
+        self.start_jd = float(header["start_jd"])
+        self.end_jd = float(header["end_jd"])
+        self.bodies = np.frombuffer(self._mmap, dtype=BODY_DTYPE, count=int(header["n_bodies"]),
+                                    offset=HEADER_DTYPE.itemsize)
+        self.names = [name.decode() for name in self.bodies["name"]]
+        self._index = {name: i for i, name in enumerate(self.names)}
+        self._index.update({int(body): i for i, body in enumerate(self.bodies["body"])})
+
+        self._coefficients = []
+        self._errors = []
+        for entry in self.bodies:
+            n, width = int(entry["n_segments"]), int(entry["degree"]) + 1
+            self._coefficients.append(np.frombuffer(self._mmap, dtype="<f8", count=n * width,
+                                                    offset=int(entry["coefficients_offset"])).reshape(n, width))
+            self._errors.append(np.frombuffer(self._mmap, dtype="<f8", count=n,
+                                              offset=int(entry["errors_offset"])))
+
+    def close(self):
+        """Release the memory map."""
+        self._coefficients = self._errors = None
+        self.bodies = None
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _body(self, body):
+        try:
+            return self._index[body.lower() if isinstance(body, str) else int(body)]
+        except KeyError:
+            raise KeyError(f"Body {body!r} is not in {self.path}") from None
+
+    def lookup(self, body, jds):
+        """Longitude (degrees) and speed (degrees/day) of a body at Julian day(s).
+
+        body may be a Swiss Ephemeris body number or a name such as "mars".
+        Scalars in give scalars out.
+        """
+        b = self._body(body)
+        span = float(self.bodies[b]["span"])
+        jds = np.asarray(jds, dtype=np.float64)
+        if np.any(jds < self.start_jd) or np.any(jds > self.end_jd):
+            raise ValueError(f"Julian day outside {self.start_jd}-{self.end_jd}")
+
+        coefficients = self._coefficients[b]
+        segment = np.minimum(((jds - self.start_jd) // span).astype(np.int64), len(coefficients) - 1)
+        x = 2.0 * (jds - self.start_jd - segment * span) / span - 1.0
+        longitude, speed = evaluate(coefficients[segment], x, 2.0 / span)
+        return np.mod(longitude, 360.0), speed
+
+    def error_bound(self, body, jd):
+        """Stored fit error (arcseconds) of the segment covering jd."""
+        b = self._body(body)
+        segment = min(int((jd - self.start_jd) // float(self.bodies[b]["span"])), len(self._errors[b]) - 1)
+        return float(self._errors[b][segment])
+
+
+def _fit_body(body, start_jd, n_segments, span, degree):
+    """Fit one body over consecutive segments; returns (coefficients, errors)."""
+    from computeEphemeris import BODY_INDEX, LON
+    from ephemeris_events import calc_column, wrap_angle
+
+    b = BODY_INDEX[body]
+    nodes = _chebyshev_nodes(degree)
+    starts = start_jd + np.arange(n_segments) * span
+    node_jds = starts[:, None] + (nodes + 1.0) * span / 2.0
+
+    longitudes = calc_column(node_jds.ravel(), np.full(node_jds.size, b), LON).reshape(node_jds.shape)
+    longitudes = np.unwrap(longitudes, period=360.0, axis=1)
+    coefficients = np.polynomial.chebyshev.chebfit(nodes, longitudes.T, degree).T
+
+    check = np.linspace(-1.0, 1.0, CHECK_POINTS)
+    check_jds = starts[:, None] + (check + 1.0) * span / 2.0
+    actual = calc_column(check_jds.ravel(), np.full(check_jds.size, b), LON).reshape(check_jds.shape)
+    fitted = np.polynomial.chebyshev.chebval(check, coefficients.T)
+    errors = np.abs(wrap_angle(fitted - actual)).max(axis=1) * 3600.0
+    return coefficients, errors
+
+
+def build(path, start_jd, end_jd, bodies=None, degree=DEGREE, tolerance_arcsec=TOLERANCE_ARCSEC):
+    """Fit every body over [start_jd, end_jd] and write the binary file."""
+    from computeEphemeris import BODIES, BODY_INDEX, BODY_NAMES
+
+    bodies = BODIES if bodies is None else bodies
+    entries = np.zeros(len(bodies), dtype=BODY_DTYPE)
+    blocks = []
+    offset = HEADER_DTYPE.itemsize + BODY_DTYPE.itemsize * len(bodies)
+
+    for i, body in enumerate(bodies):
+        fit = None
+        for span in SPAN_CHOICES:
+            n_segments = int(np.ceil((end_jd - start_jd) / span))
+            coefficients, errors = _fit_body(body, start_jd, n_segments, span, degree)
+            # Stop shortening once halving the span no longer halves the error:
+            # the remainder is noise in the source ephemeris, not fit error.
+            if fit is not None and errors.max() > fit[3].max() / 2.0:
+                break
+            fit = (span, n_segments, coefficients, errors)
+            if errors.max() <= tolerance_arcsec:
+                break
+        span, n_segments, coefficients, errors = fit
+        name = BODY_NAMES[BODY_INDEX[body]]
+        if errors.max() > tolerance_arcsec:
+            print(f"Warning: {name} error {errors.max():.3f}\" exceeds {tolerance_arcsec}\"; "
+                  f"shorter spans do not improve it (check the ephemeris files in use)")
+        print(f"  {name:<8} span {span:>4g}d  {n_segments:>5} segments  max error {errors.max():.4f}\"")
+
+        entries[i] = (name.encode(), body, degree, n_segments, 0, span, errors.max(), offset,
+                      offset + coefficients.nbytes)
+        blocks.extend([coefficients.astype("<f8"), errors.astype("<f8")])
+        offset += coefficients.nbytes + errors.nbytes
+
+    header = np.array([(MAGIC, FORMAT_VERSION, len(bodies), start_jd, end_jd)], dtype=HEADER_DTYPE)
+    with open(path, "wb") as f:
+        f.write(header.tobytes())
+        f.write(entries.tobytes())
+        for block in blocks:
+            f.write(block.tobytes())
+    return offset
+
+
+def self_check(path, samples=10000, seed=0):
+    """Compare random lookups against swe.calc_ut.
+
+    Returns {body name: (max longitude error arcsec, max speed error arcsec/day)}.
+    """
+    from computeEphemeris import BODY_INDEX, LON, SPEED, compute_positions
+    from ephemeris_events import wrap_angle
+
+    rng = np.random.default_rng(seed)
+    results = {}
+    with ChebyshevEphemeris(path) as store:
+        jds = rng.uniform(store.start_jd, store.end_jd, samples)
+        bodies = [int(body) for body in store.bodies["body"]]
+        expected = compute_positions(jds, bodies=tuple(bodies))
+        for i, body in enumerate(bodies):
+            longitude, speed = store.lookup(body, jds)
+            results[store.names[i]] = (
+                float(np.abs(wrap_angle(longitude - expected[:, i, LON])).max() * 3600.0),
+                float(np.abs(speed - expected[:, i, SPEED]).max() * 3600.0),
+            )
+    return results
+
+
+def _print_check(path, samples):
+    """Run the self-check and print one line per body."""
+    print(f"Self-check against swe.calc_ut ({samples} random instants):")
+    for name, (lon_error, speed_error) in self_check(path, samples).items():
+        print(f"  {name:<8} longitude {lon_error:.4f}\"  speed {speed_error:.4f}\"/day")
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Build or check a Chebyshev-compressed ephemeris file')
+    parser.add_argument('--start', type=datetime.date.fromisoformat, help='First date covered (YYYY-MM-DD)')
+    parser.add_argument('--end', type=datetime.date.fromisoformat, help='Last date covered (YYYY-MM-DD)')
+    parser.add_argument('--output', help='Binary file to write')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE_ARCSEC,
+                        help=f'Maximum fit error in arcseconds (default: {TOLERANCE_ARCSEC})')
+    parser.add_argument('--check', metavar='PATH', help='Only run the accuracy self-check on an existing file')
+    parser.add_argument('--samples', type=int, default=10000, help='Random instants for the self-check')
+    args = parser.parse_args()
+    if not args.check and not (args.start and args.end and args.output):
+        parser.error('--start, --end and --output are required unless --check is given')
+    if args.start and args.end and args.end < args.start:
+        parser.error('--end must not be before --start')
+    return args
+
+
+def main():
+    """Main execution function."""
+    import swisseph as swe
+    from computeEphemeris import julian_days
+
+    args = parse_args()
+    try:
+        if args.check:
+            _print_check(args.check, args.samples)
+            return
+
+        jds = julian_days(args.start, args.end + datetime.timedelta(days=1))
+        started = time.perf_counter()
+        print(f"Fitting Chebyshev segments for {args.start.isoformat()} to {args.end.isoformat()}...")
+        size = build(args.output, jds[0], jds[-1], tolerance_arcsec=args.tolerance)
+        print(f"Wrote {size / 1024:.0f} KiB to {args.output} in {time.perf_counter() - started:.2f}s")
+        _print_check(args.output, args.samples)
+
+    except Exception as e:
+        print(f"Error: {e}")
+    finally:
+        swe.close()
+
+if __name__ == "__main__":
+    main()
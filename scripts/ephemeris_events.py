@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+ephemeris_events.py - Find the exact UTC time of astrological events.
+
+Daily ephemeris records are sampled at midnight UTC, so sign fields, Mercury
+retrograde and the moon phase can be wrong for most of the day around a
+transition. This module finds the instant of every transition instead:
+
+- Sign ingresses for all bodies
+- Retrograde and direct stations
+- New moon, first quarter, full moon and last quarter
+
+Bodies are sampled on a coarse grid with the vectorized engine from
+computeEphemeris.py, transitions are bracketed between neighbouring samples,
+and each bracket is refined by false position on Swiss Ephemeris longitudes
+or speeds down to about a second, falling back to bisection steps where it
+stalls. The result is a compact, time-sorted event table from which the
+state at any instant (e.g. first pitch) can be read back without dense
+sampling.
+
+Usage:
+    python ephemeris_events.py --start 2025-01-01 --end 2025-12-31 --output events_2025.npy
+    python ephemeris_events.py --start 2025-04-01 --end 2025-04-30 --output april.json
+"""
+
+import argparse
+import datetime
+import json
+import math
+import time
+
+import numpy as np
+import swisseph as swe
+
+from computeEphemeris import (
+    BODIES,
+    BODY_INDEX,
+    BODY_NAMES,
+    CALC_FLAGS,
+    LON,
+    MOON,
+    SPEED,
+    SUN,
+    ZODIAC_SIGNS,
+    compute_positions,
+    datetime_to_jd,
+    jd_to_datetime,
+    julian_days,
+    sign_indices,
+)
+
+# Grid spacing for bracketing; must be well under the Moon's ~2.5 day sign
+# period and ~7.4 day quarter period
+STEP_DAYS = 0.5
+
+# Refinement stops once the bracket is narrower than this
+TOLERANCE_SECONDS = 1.0
+
+# Event kinds
+INGRESS = 0
+STATION = 1
+LUNATION = 2
+EVENT_KINDS = ("ingress", "station", "lunation")
+
+# Values for STATION events (the motion the body switches to)
+DIRECT = 0
+RETROGRADE = 1
+STATION_NAMES = ("direct", "retrograde")
+
+# Values for LUNATION events (Sun-Moon elongation / 90 degrees)
+LUNATION_NAMES = ("new_moon", "first_quarter", "full_moon", "last_quarter")
+
+# One row per event; `value` is a sign index, station direction or lunation
+# quarter depending on `kind`. Rows with exact=False seed the state at the
+# start of the range and are not real transitions.
+EVENT_DTYPE = np.dtype([
+    ("jd", "f8"),
+    ("kind", "i1"),
+    ("body", "i1"),
+    ("value", "i1"),
+    ("exact", "?"),
+])
+
+# The Sun and Moon never station
+STATION_BODIES = tuple(i for i, body in enumerate(BODIES) if body not in (SUN, MOON))
+
+
+def wrap_angle(angle):
+    """Wrap angles (degrees) into [-180, 180)."""
+    return np.mod(np.asarray(angle) + 180.0, 360.0) - 180.0
+
+
+def calc_column(jds, body_indices, column):
+    """Evaluate one position column for paired arrays of Julian days and body indices."""
+    values = np.empty(len(jds), dtype=np.float64)
+    for i, (jd, b) in enumerate(zip(jds, body_indices)):
+        xx = swe.calc_ut(float(jd), BODIES[b], CALC_FLAGS)[0]
+        values[i] = xx[0] if column == LON else xx[3]
+    return values
+
+
+def _elongation(jds):
+    """Moon-Sun elongation (0-360 degrees) at each Julian day."""
+    moon = calc_column(jds, np.full(len(jds), BODY_INDEX[MOON]), LON)
+    sun = calc_column(jds, np.full(len(jds), BODY_INDEX[SUN]), LON)
+    return np.mod(moon - sun, 360.0)
+
+
+def refine_brackets(func, lo, hi, f_lo, f_hi, tolerance_days):
+    """Refine all brackets [lo, hi] of func at once to a root in each.
+
+    func(jds, idx) evaluates the function for the brackets selected by the
+    index array idx at the given Julian days. f_lo and f_hi are its values at
+    the bracket ends and must differ in sign. Uses the Illinois variant of
+    false position, which converges superlinearly on these smooth curves,
+    and only re-evaluates brackets that have not converged yet. A bracket
+    whose step did not at least halve it takes a bisection step next, so
+    every bracket halves at least every second iteration.
+    """
+    lo = np.array(lo, dtype=np.float64)
+    hi = np.array(hi, dtype=np.float64)
+    f_lo = np.array(f_lo, dtype=np.float64)
+    f_hi = np.array(f_hi, dtype=np.float64)
+    root = np.full(len(lo), np.nan)
+    if not len(lo):
+        return root
+
+    # Which end was replaced last: -1 lower, +1 upper, 0 neither
+    last_side = np.zeros(len(lo), dtype=np.int8)
+    # Brackets whose next step is a bisection
+    bisect = np.zeros(len(lo), dtype=bool)
+    active = np.arange(len(lo))
+    max_iterations = 2 * max(1, math.ceil(math.log2(np.max(hi - lo) / tolerance_days)))
+    for _ in range(max_iterations):
+        if not len(active):
+            break
+        a_lo, a_hi, a_flo, a_fhi = lo[active], hi[active], f_lo[active], f_hi[active]
+        x = np.where(bisect[active], 0.5 * (a_lo + a_hi), (a_lo * a_fhi - a_hi * a_flo) / (a_fhi - a_flo))
+        fx = func(x, active)
+
+        replace_lo = np.sign(fx) == np.sign(a_flo)
+        lo[active] = np.where(replace_lo, x, a_lo)
+        f_lo[active] = np.where(replace_lo, fx, a_flo)
+        hi[active] = np.where(replace_lo, a_hi, x)
+        f_hi[active] = np.where(replace_lo, a_fhi, fx)
+
+        # Illinois step: halve the stale end when the same end moves twice
+        side = np.where(replace_lo, -1, 1).astype(np.int8)
+        repeat = side == last_side[active]
+        f_hi[active] = np.where(repeat & replace_lo, f_hi[active] / 2.0, f_hi[active])
+        f_lo[active] = np.where(repeat & ~replace_lo, f_lo[active] / 2.0, f_lo[active])
+        last_side[active] = side
+        bisect[active] = hi[active] - lo[active] > 0.5 * (a_hi - a_lo)
+
+        done = (np.abs(x - root[active]) < tolerance_days) | (hi[active] - lo[active] < tolerance_days) | (fx == 0)
+        root[active] = x
+        active = active[~done]
+    return root
+
+
+def _event_rows(jds, kind, bodies, values, exact=True):
+    """Pack parallel arrays into an event table."""
+    rows = np.empty(len(jds), dtype=EVENT_DTYPE)
+    rows["jd"] = jds
+    rows["kind"] = kind
+    rows["body"] = bodies
+    rows["value"] = values
+    rows["exact"] = exact
+    return rows
+
+
+def find_ingresses(grid, positions, tolerance_days):
+    """Exact sign ingresses of every body between grid samples."""
+    signs = sign_indices(positions[:, :, LON])
+    t, b = np.nonzero(signs[1:] != signs[:-1])
+    old, new = signs[t, b], signs[t + 1, b]
+    forward = new == (old + 1) % 12
+    boundary = np.where(forward, new, old) * 30.0
+
+    exact = refine_brackets(lambda jd, i: wrap_angle(calc_column(jd, b[i], LON) - boundary[i]),
+                            grid[t], grid[t + 1],
+                            wrap_angle(positions[t, b, LON] - boundary),
+                            wrap_angle(positions[t + 1, b, LON] - boundary), tolerance_days)
+    return _event_rows(exact, INGRESS, b, new)
+
+
+def find_stations(grid, positions, tolerance_days):
+    """Exact retrograde and direct stations between grid samples."""
+    bodies = np.array(STATION_BODIES)
+    retrograde = positions[:, bodies, SPEED] < 0
+    t, col = np.nonzero(retrograde[1:] != retrograde[:-1])
+    b = bodies[col]
+
+    exact = refine_brackets(lambda jd, i: calc_column(jd, b[i], SPEED),
+                            grid[t], grid[t + 1],
+                            positions[t, b, SPEED], positions[t + 1, b, SPEED], tolerance_days)
+    return _event_rows(exact, STATION, b, np.where(retrograde[t + 1, col], RETROGRADE, DIRECT))
+
+
+def find_lunations(grid, positions, tolerance_days):
+    """Exact new moons, full moons and quarters between grid samples."""
+    elongation = np.mod(positions[:, BODY_INDEX[MOON], LON] - positions[:, BODY_INDEX[SUN], LON], 360.0)
+    quarters = (elongation // 90.0).astype(np.int8) % 4
+    t = np.nonzero(quarters[1:] != quarters[:-1])[0]
+    new = quarters[t + 1]
+    target = new * 90.0
+
+    exact = refine_brackets(lambda jd, i: wrap_angle(_elongation(jd) - target[i]),
+                            grid[t], grid[t + 1],
+                            wrap_angle(elongation[t] - target),
+                            wrap_angle(elongation[t + 1] - target), tolerance_days)
+    return _event_rows(exact, LUNATION, BODY_INDEX[MOON], new)
+
+
+def _initial_state(jd, positions):
+    """Seed rows describing every body's sign, motion and the lunar quarter at jd."""
+    first = positions[0]
+    body_indices = np.arange(len(BODIES))
+    elongation = np.mod(first[BODY_INDEX[MOON], LON] - first[BODY_INDEX[SUN], LON], 360.0)
+    return np.concatenate([
+        _event_rows(np.full(len(BODIES), jd), INGRESS, body_indices,
+                    sign_indices(first[:, LON]), exact=False),
+        _event_rows(np.full(len(BODIES), jd), STATION, body_indices,
+                    np.where(first[:, SPEED] < 0, RETROGRADE, DIRECT), exact=False),
+        _event_rows(np.array([jd]), LUNATION, BODY_INDEX[MOON],
+                    int(elongation // 90.0) % 4, exact=False),
+    ])
+
+
+def find_events(start_jd, end_jd, step_days=STEP_DAYS, tolerance_seconds=TOLERANCE_SECONDS):
+    """Return the time-sorted event table for [start_jd, end_jd].
+
+    The table opens with seed rows (exact=False) holding the state at
+    start_jd, followed by every ingress, station and lunation in the range.
+    """
+    count = int(np.floor((end_jd - start_jd) / step_days)) + 1
+    grid = start_jd + np.arange(count) * step_days
+    if grid[-1] < end_jd:
+        grid = np.append(grid, end_jd)
+
+    positions = compute_positions(grid)
+    tolerance_days = tolerance_seconds / 86400.0
+
+    events = np.concatenate([
+        _initial_state(start_jd, positions),
+        find_ingresses(grid, positions, tolerance_days),
+        find_stations(grid, positions, tolerance_days),
+        find_lunations(grid, positions, tolerance_days),
+    ])
+    return events[np.argsort(events["jd"], kind="stable")]
+
+
+def find_events_for_dates(start_date, end_date, **kwargs):
+    """Event table covering start_date 00:00 UTC to end_date 24:00 UTC."""
+    jds = julian_days(start_date, end_date + datetime.timedelta(days=1))
+    return find_events(jds[0], jds[-1], **kwargs)
+
+
+def state_at(events, when):
+    """Sign, motion and lunar quarter of every body at a datetime or Julian day.
+
+    `when` must fall inside the range the event table was built for.
+    """
+    jd = datetime_to_jd(when) if isinstance(when, datetime.datetime) else float(when)
+    prior = events[:np.searchsorted(events["jd"], jd, side="right")]
+    if not len(prior):
+        raise ValueError("Requested time is before the start of the event table")
+
+    state = {}
+    for kind, suffix, labels in ((INGRESS, "sign", ZODIAC_SIGNS), (STATION, "retrograde", None)):
+        rows = prior[prior["kind"] == kind]
+        for b, name in enumerate(BODY_NAMES):
+            value = rows["value"][rows["body"] == b][-1]
+            state[f"{name}_{suffix}"] = labels[value] if labels else bool(value == RETROGRADE)
+
+    lunations = prior[prior["kind"] == LUNATION]
+    state["moon_phase"] = LUNATION_NAMES[lunations["value"][-1]]
+    return state
+
+
+def to_records(events, include_seed=False):
+    """Convert an event table to JSON-friendly dictionaries."""
+    records = []
+    for row in events:
+        if not row["exact"] and not include_seed:
+            continue
+        kind = int(row["kind"])
+        value = int(row["value"])
+        if kind == INGRESS:
+            label = ZODIAC_SIGNS[value]
+        elif kind == STATION:
+            label = STATION_NAMES[value]
+        else:
+            label = LUNATION_NAMES[value]
+        records.append({
+            "time": jd_to_datetime(row["jd"]).isoformat(timespec="seconds").replace("+00:00", "Z"),
+            "event": EVENT_KINDS[kind],
+            "body": BODY_NAMES[row["body"]],
+            "value": label,
+        })
+    return records
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Find exact times of ingresses, stations and lunations')
+    parser.add_argument('--start', type=datetime.date.fromisoformat, required=True,
+                        help='First date to search (YYYY-MM-DD)')
+    parser.add_argument('--end', type=datetime.date.fromisoformat, required=True,
+                        help='Last date to search (YYYY-MM-DD)')
+    parser.add_argument('--output', required=True,
+                        help='Output file; .npy stores the binary event table, anything else JSON')
+    args = parser.parse_args()
+    if args.end < args.start:
+        parser.error('--end must not be before --start')
+    return args
+
+
+def main():
+    """Main execution function."""
+    args = parse_args()
+    try:
+        started = time.perf_counter()
+        events = find_events_for_dates(args.start, args.end)
+        exact = int(events["exact"].sum())
+        print(f"Found {exact} events between {args.start.isoformat()} and {args.end.isoformat()} "
+              f"in {time.perf_counter() - started:.2f}s")
+
+        if args.output.endswith('.npy'):
+            np.save(args.output, events)
+        else:
+            with open(args.output, 'w') as f:
+                json.dump(to_records(events), f, indent=2)
+        print(f"Wrote event table to {args.output}")
+
+    except Exception as e:
+        print(f"Error: {e}")
+    finally:
+        swe.close()
+
+if __name__ == "__main__":
+    main()
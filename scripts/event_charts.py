@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+event_charts.py - Event charts for scheduled games at their venues.
+
+For every game in a date range, a full chart is cast for the scheduled start
+(games.game_time_utc) at the venue coordinates stored on the home team
+(teams.venue_latitude / venue_longitude): Ascendant, MC, the twelve Placidus
+house cusps from swe.houses, and the longitude and house of each body in
+computeEphemeris.BODIES.
+
+Charts are keyed by (venue, start time, schema version). A game is recast
+only when its key changes, i.e. when the schedule moves it, so a
+daily run after the first one writes just the rescheduled games. Games sharing
+a key are cast once. Casting is spread over a process pool like
+computeEphemeris.py --workers, so a full 2,430-game MLB season is one run.
+
+Usage:
+    python event_charts.py --start 2025-03-27 --end 2025-09-28 --workers 8
+    python event_charts.py --start 2025-03-27 --end 2025-09-28 --full --output charts.json
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import numpy as np
+import swisseph as swe
+
+from computeEphemeris import (
+    EPHE_PATH,
+    LON,
+    UPLOAD_CHUNK_SIZE,
+    UPLOAD_CONCURRENCY,
+    compute_positions,
+    datetime_to_jd,
+    fetch_all,
+    init_worker,
+    parse_game_time,
+    upsert_chunk,
+)
+
+# Placidus, as used by the charts in the app
+HOUSE_SYSTEM = b'P'
+
+# Bump when the chart computation changes so stored charts are recast
+CHART_SCHEMA_VERSION = 1
+
+CHART_TABLE = "game_event_charts"
+
+# Charts cast per process pool task
+CHARTS_PER_TASK = 100
+
+
+def chart_key(venue_id, game_time_utc, latitude, longitude):
+    """Cache key of a chart: changes whenever the venue, start time or computation does."""
+    canonical = json.dumps([venue_id, parse_game_time(game_time_utc).isoformat(),
+                            round(float(latitude), 6), round(float(longitude), 6), CHART_SCHEMA_VERSION])
+    return hashlib.sha1(canonical.encode()).hexdigest()
+
+
+def house_placements(longitudes, cusps):
+    """House number (1-12) of each longitude, for cusps listed from the 1st house."""
+    cusps = np.asarray(cusps)
+    cusp_offsets = np.mod(cusps - cusps[0], 360.0)
+    body_offsets = np.mod(np.asarray(longitudes) - cusps[0], 360.0)
+    return np.searchsorted(cusp_offsets, body_offsets, side='right').astype(np.int8)
+
+
+def cast_charts(jds, latitudes, longitudes):
+    """Cast one chart per (Julian day, latitude, longitude); returns a list of chart dicts."""
+    positions = compute_positions(jds)
+    charts = []
+    for t, (jd, lat, lon) in enumerate(zip(jds, latitudes, longitudes)):
+        cusps, ascmc = swe.houses(float(jd), float(lat), float(lon), HOUSE_SYSTEM)
+        body_lon = positions[t, :, LON]
+        charts.append({
+            "ascendant": round(ascmc[0], 6),
+            "mc": round(ascmc[1], 6),
+            "house_cusps": [round(c, 6) for c in cusps],
+            "body_longitudes": [round(float(v), 6) for v in body_lon],
+            "body_houses": [int(h) for h in house_placements(body_lon, cusps)],
+        })
+    return charts
+
+
+def _cast_task(task):
+    """Process pool task: cast charts for parallel lists of Julian days and coordinates."""
+    return cast_charts(*task)
+
+
+def fetch_schedule(start_date, end_date):
+    """Games starting between the two dates (inclusive, UTC)."""
+    return fetch_all("games", "id,game_time_utc,venue_id,home_team_id,status",
+                     f"{start_date.isoformat()}T00:00:00+00:00",
+                     f"{end_date.isoformat()}T23:59:59.999999+00:00",
+                     key="game_time_utc")
+
+
+def fetch_venues():
+    """Return {team_id: (latitude, longitude)} for teams with venue coordinates."""
+    venues = {}
+    for team in fetch_all("teams", "id,venue_latitude,venue_longitude", key="id"):
+        if team.get("venue_latitude") is not None and team.get("venue_longitude") is not None:
+            venues[team["id"]] = (float(team["venue_latitude"]), float(team["venue_longitude"]))
+    return venues
+
+
+def fetch_stored_keys(game_ids, batch_size=200):
+    """Return {game_id: chart_key} for charts already stored."""
+    stored = {}
+    game_ids = sorted(game_ids)
+    for i in range(0, len(game_ids), batch_size):
+        for row in fetch_all(CHART_TABLE, "game_id,chart_key", key="game_id",
+                             where={"game_id": game_ids[i:i + batch_size]}):
+            stored[row["game_id"]] = row["chart_key"]
+    return stored
+
+
+def plan_charts(games, venues, stored_keys=None):
+    """Work out which games need a chart.
+
+    Returns (rows, to_cast): `rows` are the table rows to write, missing their
+    chart fields; `to_cast` maps each distinct chart_key among them to
+    (Julian day, latitude, longitude). Games with no venue coordinates or no
+    start time are left out.
+    """
+    stored_keys = stored_keys or {}
+    rows, to_cast = [], {}
+    for game in games:
+        venue_id = game.get("venue_id") or game.get("home_team_id")
+        if venue_id not in venues or not game.get("game_time_utc"):
+            continue
+        latitude, longitude = venues[venue_id]
+        key = chart_key(venue_id, game["game_time_utc"], latitude, longitude)
+        if stored_keys.get(game["id"]) == key:
+            continue
+        rows.append({
+            "game_id": game["id"],
+            "venue_id": venue_id,
+            "game_time_utc": game["game_time_utc"],
+            "latitude": latitude,
+            "longitude": longitude,
+            "chart_key": key,
+            "schema_version": CHART_SCHEMA_VERSION,
+        })
+        if key not in to_cast:
+            to_cast[key] = (datetime_to_jd(parse_game_time(game["game_time_utc"])), latitude, longitude)
+    return rows, to_cast
+
+
+def cast_all(to_cast, workers=1):
+    """Cast every planned chart, in a process pool when workers > 1; returns {chart_key: chart}."""
+    keys = list(to_cast)
+    tasks = []
+    for i in range(0, len(keys), CHARTS_PER_TASK):
+        jds, lats, lons = zip(*(to_cast[k] for k in keys[i:i + CHARTS_PER_TASK]))
+        tasks.append((jds, lats, lons))
+
+    if workers <= 1:
+        results = map(_cast_task, tasks)
+        return dict(zip(keys, (chart for charts in results for chart in charts)))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(os.path.abspath(EPHE_PATH),)) as pool:
+        results = list(pool.map(_cast_task, tasks))
+    return dict(zip(keys, (chart for charts in results for chart in charts)))
+
+
+def store_charts(rows, chunk_size=UPLOAD_CHUNK_SIZE, concurrency=UPLOAD_CONCURRENCY):
+    """Upsert chart rows on game_id in concurrent chunks; returns rows written."""
+    chunks = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+    written = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(upsert_chunk, chunk, CHART_TABLE, "game_id"): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            try:
+                written += future.result()
+            except Exception as e:
+                print(f"Exception storing {len(futures[future])} event charts: {e}")
+    return written
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Cast event charts for scheduled games at their venues')
+    parser.add_argument('--start', type=datetime.date.fromisoformat, required=True,
+                        help='First game date (YYYY-MM-DD, UTC)')
+    parser.add_argument('--end', type=datetime.date.fromisoformat, required=True,
+                        help='Last game date (YYYY-MM-DD, UTC)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Worker processes for casting charts (default: 1)')
+    parser.add_argument('--full', action='store_true',
+                        help='Recast every game, not just new or rescheduled ones')
+    parser.add_argument('--output', help='Write chart rows to this JSON file instead of Supabase')
+    args = parser.parse_args()
+    if args.end < args.start:
+        parser.error('--end must not be before --start')
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    return args
+
+
+def main():
+    """Main execution function."""
+    args = parse_args()
+    try:
+        games = fetch_schedule(args.start, args.end)
+        venues = fetch_venues()
+        stored = {} if args.full or args.output else fetch_stored_keys(game["id"] for game in games)
+        rows, to_cast = plan_charts(games, venues, stored)
+        print(f"{len(games)} games scheduled; {len(rows)} need charts "
+              f"({len(to_cast)} distinct venue/time pairs)")
+
+        started = time.perf_counter()
+        charts = cast_all(to_cast, args.workers)
+        for row in rows:
+            row.update(charts[row["chart_key"]])
+        print(f"Cast {len(charts)} charts in {time.perf_counter() - started:.2f}s")
+
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(rows, f, indent=2)
+            print(f"Wrote {len(rows)} event charts to {args.output}")
+        elif rows:
+            print(f"Stored {store_charts(rows)} event charts in Supabase")
+
+    except Exception as e:
+        print(f"Error: {e}")
+    finally:
+        swe.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
 """
-Fetch MLB teams, player rosters, 2025 player stats, and 2025 game data (including odds)
-from SportsData.io and upsert into Supabase.
+Fetch MLB teams, player rosters, and one season's player stats and game data
+(including odds) from SportsData.io and upsert into Supabase.
 """
 import os
 import sys
 import json
+import argparse
 import logging
 import asyncio
 from typing import Dict, List, Optional, Any
@@ -14,6 +15,11 @@ import httpx
 from dotenv import load_dotenv
 from supabase import create_client, Client
 from supabase.lib.client_options import ClientOptions
+from row_ledger import RowLedger, key_columns_of
+from async_db import AsyncSupabase, afilter_changed
+from batch_writer import BatchWriter
+from http_cache import CachingTransport
+from rate_limit import RateLimiter, fetch_as_completed
 
 # Configure logging
 logging.basicConfig(
@@ -41,6 +47,10 @@ TARGET_SEASON = 2025
 MLB_LEAGUE_EXTERNAL_ID = 1 # Assuming 1 is the common external_id for MLB
 MLB_LEAGUE_NAME = "MLB"
 
+# Request limits for the SportsData.io key, as in sync_sports_data.py
+SPORTSDATA_RATE = float(os.getenv("SPORTSDATA_RATE", "5"))  # requests/second
+SPORTSDATA_CONCURRENCY = int(os.getenv("SPORTSDATA_CONCURRENCY", "4"))
+
 if not SPORTSDATA_API_KEY or SPORTSDATA_API_KEY == 'your_sportsdata_api_key_here':
     logger.error("❌ Please set SPORTSDATA_MLB_KEY in your .env file")
     sys.exit(1)
@@ -50,9 +60,12 @@ if not SUPABASE_URL or not SUPABASE_KEY:
 
 class SportsDataClient:
     """Client for interacting with the SportsData.io API."""
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, limiter: Optional[RateLimiter] = None):
+        self.api_key = api_key
+        self.limiter = limiter or RateLimiter(SPORTSDATA_RATE, concurrency=SPORTSDATA_CONCURRENCY)
         self.session = httpx.AsyncClient(
             timeout=30.0,
+            transport=CachingTransport(),
             headers={'Ocp-Apim-Subscription-Key': api_key, 'User-Agent': 'AstroBetAdvisor/1.0'}
         )
 
@@ -78,7 +91,8 @@ class SportsDataClient:
 
     async def _make_request(self, url: str) -> Optional[List[Dict[str, Any]]]:
         try:
-            response = await self.session.get(url)
+            async with self.limiter.limit(self.api_key, url):
+                response = await self.session.get(url)
             response.raise_for_status()
             return response.json()
         except httpx.HTTPStatusError as e:
@@ -96,17 +110,17 @@ class SportsDataClient:
     async def close(self):
         await self.session.aclose()
 
-async def get_or_create_league(supabase: Client, league_name: str, external_id: int) -> Optional[str]:
+async def get_or_create_league(db: AsyncSupabase, league_name: str, external_id: int) -> Optional[str]:
     """Get existing league_id or create it if not found."""
     try:
-        result = supabase.table("leagues").select("id").eq("external_id", external_id).execute()
+        result = await db.execute(db.table("leagues").select("id").eq("external_id", external_id))
         if result.data:
             logger.info(f"Found existing league '{league_name}' with external_id {external_id}.")
             return result.data[0]["id"]
         else:
             logger.info(f"League '{league_name}' not found, creating...")
             insert_data = {"name": league_name, "abbreviation": league_name, "sport": "baseball", "external_id": external_id}
-            result = supabase.table("leagues").insert(insert_data).execute()
+            result = await db.execute(db.table("leagues").insert(insert_data))
             if result.data:
                 logger.info(f"Created league '{league_name}'.")
                 return result.data[0]["id"]
@@ -222,80 +236,242 @@ def prepare_game_for_db(game_api_data: Dict[str, Any], league_id: str,
         # Add more fields as needed, e.g., venue, period, etc.
     }
 
-async def upsert_data_to_supabase(supabase: Client, table_name: str, data: List[Dict[str, Any]], 
-                                on_conflict_columns: Optional[str] = None, chunk_size: int = 200) -> List[Dict[str, Any]]:
+async def upsert_data_to_supabase(db: AsyncSupabase, table_name: str, data: List[Dict[str, Any]], 
+                                on_conflict_columns: Optional[str] = None, chunk_size: int = 200,
+                                ledger: Optional[RowLedger] = None) -> List[Dict[str, Any]]:
     """
-    Insert or update data in Supabase in chunks.
+    Upsert data into Supabase, one request per chunk.
+    
+    Each chunk is sent as a single upsert (INSERT ... ON CONFLICT DO UPDATE)
+    and the response carries the written rows with their ids. A chunk
+    the database rejects is bisected to isolate the bad rows, which go to
+    the dead-letter file; transient errors are retried, then raised (see
+    batch_writer.py).
     
     Args:
-        supabase: Supabase client
+        db: Supabase client; queries run off the event loop
         table_name: Name of the table to upsert to
         data: List of dictionaries representing rows to upsert
-        on_conflict_columns: Comma-separated string of column names for conflict resolution (not used)
-        chunk_size: Number of rows to process in each chunk
+        on_conflict_columns: Comma-separated columns of the unique constraint to upsert on;
+            also the natural key used by the ledger. Without it, rows are inserted.
+        chunk_size: Number of rows per request
+        ledger: Optional content-hash ledger; rows unchanged since the last run are not sent
         
     Returns:
-        List of all inserted/updated rows
+        List of all inserted/updated rows, plus the unchanged rows with their stored ids
     """
     if not data:
         return []
+    
+    if on_conflict_columns:
+        # Postgres rejects an upsert that touches the same row twice, so keep the last row per key
+        key_columns = key_columns_of(on_conflict_columns)
+        by_key = {tuple(row.get(column) for column in key_columns): row for row in data}
+        if len(by_key) < len(data):
+            logger.warning(f"Dropping {len(data) - len(by_key)} duplicate rows for '{table_name}'.")
+        data = list(by_key.values())
         
-    all_processed_data = []
+    data, unchanged = await afilter_changed(ledger, db, table_name, data, on_conflict_columns)
+    if unchanged:
+        logger.info(f"Skipping {len(unchanged)} unchanged rows in '{table_name}'.")
+    
+    async def send(chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        table = db.table(table_name)
+        if on_conflict_columns:
+            return (await db.execute(table.upsert(chunk, on_conflict=on_conflict_columns))).data
+        return (await db.execute(table.insert(chunk))).data
+    
+    writer = BatchWriter(send, table_name, batch_size=chunk_size)
+    all_processed_data = await writer.write(data)
+    
+    logger.info(f"Finished processing {len(all_processed_data)} rows in '{table_name}' in {writer.requests} requests.")
+    if ledger and on_conflict_columns:
+        ledger.record(table_name, data, all_processed_data, on_conflict_columns)
+    return all_processed_data + unchanged
+
+async def sync_teams(db: AsyncSupabase, teams: List[Dict[str, Any]], league_id: str,
+                     ledger: Optional[RowLedger] = None) -> Dict[str, str]:
+    """Upsert the league's teams; returns Supabase team id by SportsData.io TeamID."""
+    team_data = [prepare_team_for_db(team, league_id) for team in teams]
+    
+    # Teams are unique per league
+    upserted_teams = await upsert_data_to_supabase(
+        db,
+        'teams', 
+        team_data,
+        on_conflict_columns='external_id,league_id',
+        chunk_size=50,
+        ledger=ledger
+    )
     
-    # Process data in chunks to avoid overwhelming the database
-    for i in range(0, len(data), chunk_size):
-        chunk = data[i:i + chunk_size]
-        logger.debug(f"Processing chunk {i//chunk_size + 1}/{(len(data)-1)//chunk_size + 1} with {len(chunk)} items")
+    # The upsert returns the teams' Supabase IDs
+    return {str(team['external_id']): team['id']
+            for team in upserted_teams if team.get('external_id') and team.get('id')}
+
+async def load_player_ids(db: AsyncSupabase, team_ids: List[str], page_size: int = 1000) -> Dict[str, str]:
+    """Supabase player id by SportsData.io PlayerID, for the players stored on the given teams."""
+    player_key_to_id = {}
+    offset = 0
+    while True:
+        result = await db.execute(db.table("players").select("id,external_id").in_("team_id", team_ids)
+                                  .order("external_id").range(offset, offset + page_size - 1))
+        page = result.data or []
+        for player in page:
+            if player.get('external_id') and player.get('id'):
+                player_key_to_id[str(player['external_id'])] = player['id']
+        if len(page) < page_size:
+            return player_key_to_id
+        offset += page_size
+
+def season_stats_player(stats_api_data: Dict[str, Any]) -> Dict[str, Any]:
+    """The player fields of a PlayerSeasonStats row, in the shape of a roster entry."""
+    first_name, _, last_name = (stats_api_data.get("Name") or "").partition(" ")
+    return {
+        "PlayerID": stats_api_data.get("PlayerID"),
+        "FirstName": first_name or None,
+        "LastName": last_name or None,
+        "Position": stats_api_data.get("Position"),
+    }
+
+async def sync_season_players(db: AsyncSupabase, player_stats: List[Dict[str, Any]],
+                              player_key_to_id: Dict[str, str], team_key_to_id: Dict[str, str],
+                              ledger: Optional[RowLedger] = None, chunk_size: int = 100) -> Dict[str, str]:
+    """Upsert the players in a season's stats that are not stored yet.
+
+    Past seasons' stats name players who are on no current roster. They are
+    stored with the team they played that season for. Players already in
+    player_key_to_id are left alone, so their current team is kept.
+    Returns the Supabase player id by PlayerID of the players written.
+    """
+    players = {}
+    for stat in player_stats:
+        player_key = str(stat.get("PlayerID"))
+        team_supabase_id = team_key_to_id.get(str(stat.get("TeamID")))
+        if stat.get("PlayerID") and player_key not in player_key_to_id and team_supabase_id:
+            players[player_key] = prepare_player_for_db(season_stats_player(stat), team_supabase_id)
+    if not players:
+        return {}
+    
+    logger.info(f"Upserting {len(players)} players found only in season stats...")
+    result = await upsert_data_to_supabase(
+        db,
+        "players",
+        list(players.values()),
+        on_conflict_columns="external_id",
+        chunk_size=chunk_size,
+        ledger=ledger
+    )
+    return {str(player['external_id']): player['id']
+            for player in result if player.get('external_id') and player.get('id')}
+
+def unmatched_season_stats(player_stats: List[Dict[str, Any]], player_key_to_id: Dict[str, str],
+                           team_key_to_id: Dict[str, str]) -> List[Dict[str, Any]]:
+    """The stats rows whose player or team is not stored, and which cannot be written."""
+    return [stat for stat in player_stats
+            if str(stat.get("PlayerID")) not in player_key_to_id
+            or str(stat.get("TeamID")) not in team_key_to_id]
+
+async def upsert_player_season_stats(db: AsyncSupabase, player_stats: List[Dict[str, Any]], season: int,
+                                     player_key_to_id: Dict[str, str], team_key_to_id: Dict[str, str],
+                                     ledger: Optional[RowLedger] = None, chunk_size: int = 100) -> int:
+    """Upsert one season's player stats; returns the number of rows written or unchanged."""
+    stats_data = []
+    for stat in player_stats:
+        player_supabase_id = player_key_to_id.get(str(stat.get("PlayerID")))
+        team_supabase_id = team_key_to_id.get(str(stat.get("TeamID")))
         
-        for row in chunk:
-            try:
-                # First, try to update existing record
-                if 'external_id' in row and row['external_id'] is not None:
-                    # Check if record exists
-                    result = supabase.table(table_name).select('*').eq('external_id', row['external_id']).execute()
-                    
-                    if hasattr(result, 'data') and result.data:
-                        # Record exists, update it
-                        update_data = {k: v for k, v in row.items() if k != 'external_id'}
-                        result = supabase.table(table_name).update(update_data).eq('external_id', row['external_id']).execute()
-                        if hasattr(result, 'data') and result.data:
-                            all_processed_data.extend(result.data)
-                            continue
-                
-                # If we get here, either the record doesn't exist or we couldn't update it
-                # So try to insert a new record
-                result = supabase.table(table_name).insert(row).execute()
-                if hasattr(result, 'data') and result.data:
-                    all_processed_data.extend(result.data)
+        if player_supabase_id and team_supabase_id:
+            stats_data.append(prepare_player_season_stats_for_db(
+                stat, player_supabase_id, season, team_supabase_id
+            ))
+    if len(stats_data) < len(player_stats):
+        logger.warning(f"Skipping {len(player_stats) - len(stats_data)} {season} stats rows for unknown players or teams.")
+    
+    logger.info(f"Upserting {len(stats_data)} player season stats for {season}...")
+    result = await upsert_data_to_supabase(
+        db,
+        "player_season_stats",
+        stats_data,
+        on_conflict_columns="player_id,season,team_id",
+        chunk_size=chunk_size,
+        ledger=ledger
+    )
+    return len(result)
+
+async def upsert_games(db: AsyncSupabase, games: List[Dict[str, Any]], season: int, league_id: str,
+                       team_key_to_id: Dict[str, str], ledger: Optional[RowLedger] = None,
+                       chunk_size: int = 100) -> int:
+    """Upsert one season's games; returns the number of rows written or unchanged."""
+    game_data = []
+    games_with_odds = 0
+    
+    for game in games:
+        home_team_id = team_key_to_id.get(str(game.get("HomeTeamID")))
+        away_team_id = team_key_to_id.get(str(game.get("AwayTeamID")))
+        
+        if home_team_id and away_team_id:
+            game_entry = prepare_game_for_db(game, league_id, home_team_id, away_team_id, season)
+            
+            # Check if odds data exists
+            if any(game_entry.get(field) is not None for field in ['home_odds', 'away_odds', 'over_under', 'spread']):
+                games_with_odds += 1
                 
-            except Exception as e:
-                logger.error(f"Error processing row in {table_name}: {e}")
-                logger.debug(f"Problematic row data: {row}")
+            game_data.append(game_entry)
     
-    logger.info(f"Finished processing {len(all_processed_data)} rows in '{table_name}'.")
-    return all_processed_data
+    logger.info(f"Upserting {len(game_data)} {season} games ({games_with_odds} with odds data)...")
+    result = await upsert_data_to_supabase(
+        db,
+        "games",
+        game_data,
+        on_conflict_columns="external_id",
+        chunk_size=chunk_size,
+        ledger=ledger
+    )
+    return len(result)
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Fetch MLB data from SportsData.io and upsert it into Supabase')
+    parser.add_argument('--season', type=int, default=TARGET_SEASON,
+                        help=f'Season of the stats and games to sync (default: {TARGET_SEASON}); '
+                             'see backfill.py for several seasons')
+    parser.add_argument('--full', action='store_true',
+                        help='Send every row, even ones the local ledger says are unchanged')
+    return parser.parse_args()
 
 async def main():
+    args = parse_args()
+    season = args.season
     logger.info(f"""
     ======================================================================
-    Starting MLB Data Sync for Season {TARGET_SEASON}
+    Starting MLB Data Sync for Season {season}
     ======================================================================""")
 
     # Initialize clients
     client = None
+    db = None
+    fetches = []
+    ledger = RowLedger(full=args.full)
     try:
         client = SportsDataClient(SPORTSDATA_API_KEY)
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+        db = AsyncSupabase(create_client(SUPABASE_URL, SUPABASE_KEY))
 
-        # Get or create MLB league
-        league_id = await get_or_create_league(supabase, MLB_LEAGUE_NAME, MLB_LEAGUE_EXTERNAL_ID)
+        # Get or create MLB league while fetching all teams
+        logger.info("Fetching all MLB teams...")
+        league_id, teams = await asyncio.gather(
+            get_or_create_league(db, MLB_LEAGUE_NAME, MLB_LEAGUE_EXTERNAL_ID),
+            client.get_all_teams()
+        )
         if not league_id:
             logger.error("❌ Failed to get or create league. Exiting.")
             return
+        
+        # Stats and games need nothing from the database: fetch them while
+        # teams and players are written
+        stats_fetch = asyncio.ensure_future(client.get_player_season_stats(season))
+        games_fetch = asyncio.ensure_future(client.get_games_for_season(season))
+        fetches = [stats_fetch, games_fetch]
 
-        # Fetch and upsert all teams
-        logger.info("Fetching all MLB teams...")
-        teams = await client.get_all_teams()
         if not teams:
             logger.error("❌ Failed to fetch teams. Exiting.")
             return
@@ -303,30 +479,8 @@ async def main():
         # Process teams
         logger.info(f"Processing {len(teams)} teams...")
         
-        # Prepare team data for database
-        team_data = [prepare_team_for_db(team, league_id) for team in teams]
-        
-        # Upsert teams to Supabase
-        upserted_teams = await upsert_data_to_supabase(
-            supabase, 
-            'teams', 
-            team_data,
-            on_conflict_columns='external_id',
-            chunk_size=50
-        )
-        
-        # After upserting, fetch the teams to get their Supabase IDs
-        team_key_to_id = {}
-        for team in teams:
-            team_id = team.get('TeamID')
-            if team_id:
-                try:
-                    # Query the team by external_id to get the Supabase ID
-                    result = supabase.table('teams').select('id, external_id').eq('external_id', team_id).execute()
-                    if result.data and len(result.data) > 0:
-                        team_key_to_id[str(team_id)] = result.data[0]['id']
-                except Exception as e:
-                    logger.error(f"Error fetching team ID for team {team_id}: {e}")
+        # Upsert teams to Supabase, keeping their Supabase IDs
+        team_key_to_id = await sync_teams(db, teams, league_id, ledger)
         
         logger.info(f"Successfully processed {len(team_key_to_id)} teams in Supabase.")
         logger.debug(f"Team ID mapping: {team_key_to_id}")
@@ -338,18 +492,22 @@ async def main():
         all_player_data = []
         team_roster_data = {}
         
+        teams_by_key = {}
         for team in teams:
             team_key = team.get("Key")
-            team_supabase_id = team_key_to_id.get(str(team.get("TeamID")))
-            
-            if not team_supabase_id:
+            if not team_key_to_id.get(str(team.get("TeamID"))):
                 logger.warning(f"Skipping roster for team with API Key {team_key} due to missing Supabase ID.")
                 continue
-                
+            teams_by_key[team_key] = team
+        
+        # Rosters are fetched concurrently, within the client's rate limits, and
+        # prepared in the order they arrive
+        logger.info(f"Fetching rosters for {len(teams_by_key)} teams...")
+        async for team_key, roster in fetch_as_completed(teams_by_key, client.get_team_roster):
+            team = teams_by_key[team_key]
+            team_supabase_id = team_key_to_id[str(team.get("TeamID"))]
             team_name = f"{team.get('City', '')} {team.get('Name', '')}".strip()
-            logger.info(f"Fetching roster for team: {team_name} ({team_key})")
             
-            roster = await client.get_team_roster(team_key)
             if not roster:
                 logger.warning(f"No roster data for team {team_key}")
                 continue
@@ -366,101 +524,57 @@ async def main():
         
         # Upsert all players in batches
         logger.info(f"Upserting {len(all_player_data)} total players...")
-        for i in range(0, len(all_player_data), 100):
-            chunk = all_player_data[i:i+100]
-            result = await upsert_data_to_supabase(
-                supabase,
-                "players",
-                chunk,
-                on_conflict_columns="external_id"
-            )
-            
-            # Update the mapping with the returned IDs
-            if result:
-                for player in result:
-                    if player.get('external_id') and player.get('id'):
-                        player_key_to_id[str(player['external_id'])] = player['id']
+        result = await upsert_data_to_supabase(
+            db,
+            "players",
+            all_player_data,
+            on_conflict_columns="external_id",
+            chunk_size=100,
+            ledger=ledger
+        )
+        
+        # Update the mapping with the returned IDs
+        for player in result:
+            if player.get('external_id') and player.get('id'):
+                player_key_to_id[str(player['external_id'])] = player['id']
         
         logger.info(f"Successfully processed {len(player_key_to_id)} players")
         
         # Fetch and upsert player season stats
         logger.info("\nFetching player season stats...")
-        player_stats = await client.get_player_season_stats(TARGET_SEASON)
+        player_stats = await stats_fetch
         
         if player_stats:
-            # Prepare player stats data
-            stats_data = []
-            for stat in player_stats:
-                player_supabase_id = player_key_to_id.get(str(stat.get("PlayerID"))) if player_key_to_id else None
-                team_supabase_id = team_key_to_id.get(str(stat.get("TeamID"))) if team_key_to_id else None
-                
-                if player_supabase_id and team_supabase_id:
-                    stats_data.append(prepare_player_season_stats_for_db(
-                        stat, player_supabase_id, TARGET_SEASON, team_supabase_id
-                    ))
-            
-            # Upsert player stats in chunks
-            logger.info(f"Upserting {len(stats_data)} player season stats...")
-            for i in range(0, len(stats_data), 100):
-                chunk = stats_data[i:i+100]
-                await upsert_data_to_supabase(
-                    supabase,
-                    "player_season_stats",
-                    chunk,
-                    on_conflict_columns="player_id,season,team_id"
-                )
-            
-            logger.info(f"Successfully upserted {len(stats_data)} player season stats.")
+            count = await upsert_player_season_stats(db, player_stats, season, player_key_to_id,
+                                                     team_key_to_id, ledger)
+            logger.info(f"Successfully upserted {count} player season stats.")
         
         # Fetch and upsert games for the season
         logger.info("\nFetching games for the season...")
-        games = await client.get_games_for_season(TARGET_SEASON)
+        games = await games_fetch
         
         if games:
-            logger.info(f"Found {len(games)} games for the {TARGET_SEASON} season.")
+            logger.info(f"Found {len(games)} games for the {season} season.")
             
             # Log sample game data to verify odds
-            if games:
-                sample_game = games[0]
-                logger.info(f"Sample game data structure: {json.dumps({k: v for k, v in sample_game.items() if 'odds' in str(k).lower() or 'moneyline' in str(k).lower() or 'spread' in str(k).lower() or 'total' in str(k).lower() or 'over' in str(k).lower() or 'under' in str(k).lower()}, indent=2)}")
-            
-            # Prepare game data
-            game_data = []
-            games_with_odds = 0
-            
-            for game in games:
-                home_team_id = team_key_to_id.get(str(game.get("HomeTeamID"))) if team_key_to_id else None
-                away_team_id = team_key_to_id.get(str(game.get("AwayTeamID"))) if team_key_to_id else None
-                
-                if home_team_id and away_team_id:
-                    game_entry = prepare_game_for_db(game, league_id, home_team_id, away_team_id, TARGET_SEASON)
-                    
-                    # Check if odds data exists
-                    if any(game_entry.get(field) is not None for field in ['home_odds', 'away_odds', 'over_under', 'spread']):
-                        games_with_odds += 1
-                        
-                    game_data.append(game_entry)
-            
-            # Upsert games in chunks
-            logger.info(f"Upserting {len(game_data)} games ({games_with_odds} with odds data)...")
-            for i in range(0, len(game_data), 100):
-                chunk = game_data[i:i+100]
-                await upsert_data_to_supabase(
-                    supabase,
-                    "games",
-                    chunk,
-                    on_conflict_columns="external_id"
-                )
+            sample_game = games[0]
+            logger.info(f"Sample game data structure: {json.dumps({k: v for k, v in sample_game.items() if 'odds' in str(k).lower() or 'moneyline' in str(k).lower() or 'spread' in str(k).lower() or 'total' in str(k).lower() or 'over' in str(k).lower() or 'under' in str(k).lower()}, indent=2)}")
             
-            logger.info(f"Successfully upserted {len(game_data)} games ({games_with_odds} with odds data).")
+            count = await upsert_games(db, games, season, league_id, team_key_to_id, ledger)
+            logger.info(f"Successfully upserted {count} games.")
         
         logger.info("\n✅ Data sync completed successfully!")
         
     except Exception as e:
         logger.exception(f"Error in main: {e}")
     finally:
+        for fetch in fetches:
+            fetch.cancel()
         if client:
             await client.close()
+        if db:
+            db.close()
+        ledger.close()
         logger.info("Script completed")
 
 if __name__ == "__main__":
@@ -1,11 +1,15 @@
 import os
 import sys
+import time
+import argparse
+import asyncio
 import requests
 import json
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from supabase import create_client, Client
 from typing import List, Dict, Any, Optional
+from batch_writer import BatchWriter
 
 # Load environment variables
 load_dotenv()
@@ -22,20 +26,39 @@ GAMES_ENDPOINT = f"{BASE_URL}/Games"
 LEAGUES_ENDPOINT = f"{BASE_URL}/Leagues"
 TEAMS_ENDPOINT = f"{BASE_URL}/AllTeams"
 
+# Games per upsert request
+GAME_UPSERT_CHUNK_SIZE = 500
+
 class SportsDataFetcher:
     def __init__(self):
         self.headers = {"Ocp-Apim-Subscription-Key": SPORTSDATA_API_KEY}
         self.supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
         self.league_cache = {}
         self.team_cache = {}
+        self.caches_loaded = False
+
+    def preload_caches(self) -> None:
+        """Load the league and team id maps once, before any game is prepared."""
+        if self.caches_loaded:
+            return
+        result = self.supabase.table("leagues").select("id,external_id").execute()
+        if result.data:
+            self.league_cache = {item["external_id"]: item["id"] for item in result.data}
+
+        result = self.supabase.table("teams").select("id,external_id,abbreviation").execute()
+        if result.data:
+            # Map by external_id and also by common abbreviations for fallback
+            for item in result.data:
+                self.team_cache[item["external_id"]] = item["id"]
+                
+                # Create a mapping of common abbreviations to team IDs
+                if item.get("abbreviation"):
+                    self.team_cache[item["abbreviation"]] = item["id"]
+        self.caches_loaded = True
 
     def get_league_id(self, external_id: int = 1) -> Optional[str]:
         """Get the internal UUID for the specified league by external_id."""
-        if not self.league_cache:
-            result = self.supabase.table("leagues").select("id,external_id").execute()
-            if result.data:
-                self.league_cache = {item["external_id"]: item["id"] for item in result.data}
-        
+        self.preload_caches()
         return self.league_cache.get(external_id)
 
     def get_team_id(self, external_id: int) -> Optional[str]:
@@ -43,16 +66,7 @@ class SportsDataFetcher:
         if not external_id:
             return None
             
-        if not self.team_cache:
-            result = self.supabase.table("teams").select("id,external_id,abbreviation").execute()
-            if result.data:
-                # Map by external_id and also by common abbreviations for fallback
-                for item in result.data:
-                    self.team_cache[item["external_id"]] = item["id"]
-                    
-                    # Create a mapping of common abbreviations to team IDs
-                    if item.get("abbreviation"):
-                        self.team_cache[item["abbreviation"]] = item["id"]
+        self.preload_caches()
         
         # Try direct lookup first
         team_id = self.team_cache.get(external_id)
@@ -78,58 +92,52 @@ class SportsDataFetcher:
         return response.json()
 
     def process_and_store_games(self, games_data: List[Dict[str, Any]]) -> None:
-        """Process and store games data in the database."""
+        """Process and store games data in the database.
+
+        Games are upserted on external_id in chunks of GAME_UPSERT_CHUNK_SIZE;
+        a chunk the database rejects is bisected and the rows that cannot be
+        written go to the dead-letter file (see batch_writer.py).
+        """
+        self.preload_caches()
+
         # Get MLB league by external_id = 1
         league_id = self.get_league_id(1)
         if not league_id:
             print("Error: Could not find MLB league in the database")
             return
 
-        success_count = 0
-        error_count = 0
         skipped_count = 0
-
+        rows_by_id = {}
         for game in games_data:
-            try:
-                game_data = self.prepare_game_data(game, league_id)
-                if not game_data:
-                    skipped_count += 1
-                    continue
-
-                # Check if game already exists
-                existing_game = self.supabase.table("games") \
-                    .select("id") \
-                    .eq("external_id", game_data["external_id"]) \
-                    .execute()
-
-                if existing_game.data:
-                    # Update existing game
-                    self.supabase.table("games") \
-                        .update(game_data) \
-                        .eq("external_id", game_data["external_id"]) \
-                        .execute()
-                    success_count += 1
-                    if success_count % 10 == 0:  # Print progress
-                        print(f"Processed {success_count} games...")
-                else:
-                    # Insert new game
-                    self.supabase.table("games").insert(game_data).execute()
-                    success_count += 1
-                    if success_count % 10 == 0:  # Print progress
-                        print(f"Processed {success_count} games...")
-
-
-            except Exception as e:
-                error_count += 1
-                if error_count < 10:  # Only print first 10 errors to avoid flooding
-                    print(f"Error processing game {game.get('GameID')}: {str(e)}")
-                elif error_count == 10:
-                    print("Too many errors, suppressing further error messages...")
+            game_data = self.prepare_game_data(game, league_id)
+            if not game_data:
+                skipped_count += 1
+                continue
+            # A game listed twice would make the bulk upsert fail
+            rows_by_id[game_data["external_id"]] = game_data
+        rows = list(rows_by_id.values())
+
+        started = time.perf_counter()
+        success_count = 0
+
+        async def send(chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            nonlocal success_count
+            result = self.supabase.table("games").upsert(chunk, on_conflict="external_id").execute()
+            success_count += len(chunk)
+            elapsed = time.perf_counter() - started
+            print(f"Processed {success_count}/{len(rows)} games ({success_count / elapsed:.0f} rows/sec)...")
+            return result.data
+
+        writer = BatchWriter(send, "games", batch_size=GAME_UPSERT_CHUNK_SIZE)
+        asyncio.run(writer.write(rows))
+        elapsed = time.perf_counter() - started
 
         print(f"\nProcessing complete!")
         print(f"Successfully processed: {success_count}")
         print(f"Skipped: {skipped_count}")
-        print(f"Errors: {error_count}")
+        print(f"Errors: {writer.dead_letters}")
+        if success_count:
+            print(f"Throughput: {success_count / elapsed:.0f} rows/sec over {writer.requests} requests")
 
     def prepare_game_data(self, game: Dict[str, Any], league_id: str) -> Optional[Dict[str, Any]]:
         """Prepare game data for database insertion."""
@@ -214,7 +222,15 @@ class SportsDataFetcher:
             return "final"  # If scores exist, consider it final
         return "scheduled"  # Default to scheduled
 
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Fetch MLB games from SportsData.io and upsert them into Supabase')
+    parser.add_argument('--season', type=int, default=datetime.now().year,
+                        help='Season to fetch (default: the current year); see backfill.py for several seasons')
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
     if not SPORTSDATA_API_KEY or SPORTSDATA_API_KEY == "your_mlb_api_key_here":
         print("Error: SPORTSDATA_MLB_KEY not set in .env file")
         sys.exit(1)
@@ -226,9 +242,8 @@ def main():
     try:
         fetcher = SportsDataFetcher()
         
-        current_year = datetime.now().year
-        print(f"Fetching MLB games for {current_year} season...")
-        games = fetcher.fetch_games(current_year)
+        print(f"Fetching MLB games for {args.season} season...")
+        games = fetcher.fetch_games(args.season)
         
         if not games:
             print("No games found in the API response")
@@ -2,10 +2,15 @@
 """
 Fetch NBA teams, player rosters, 2025 player stats, and 2025 game data (including odds)
 from SportsData.io and upsert into Supabase NBA-specific tables.
+
+Teams and players come from MySportsFeeds for one season (default SEASON).
+The NBA tables hold one row per team and per player, so only one season is
+stored at a time.
 """
 import os
 import sys
 import json
+import argparse
 import logging
 import asyncio
 from typing import Dict, List, Optional, Any
@@ -14,6 +19,10 @@ import httpx
 from dotenv import load_dotenv
 from supabase import create_client, Client
 from supabase.lib.client_options import ClientOptions
+from row_ledger import RowLedger
+from async_db import AsyncSupabase, afilter_changed
+from rate_limit import RateLimiter
+from batch_writer import BatchWriter
 
 # Configure logging
 logging.basicConfig(
@@ -40,6 +49,13 @@ MSF_PASSWORD = os.getenv('MY_SPORTS_FEEDS_PASSWORD')
 MSF_BASE_URL = 'https://api.mysportsfeeds.com/v2.1/pull/nba'
 SEASON = '2024-2025-regular'
 
+# Request limits for the MySportsFeeds account
+MSF_RATE = float(os.getenv("MSF_RATE", "1"))  # requests/second
+MSF_CONCURRENCY = int(os.getenv("MSF_CONCURRENCY", "2"))
+
+# Rows per upsert request
+UPSERT_CHUNK_SIZE = 200
+
 # Constants
 SUPABASE_URL = os.getenv("PUBLIC_SUPABASE_URL")
 SUPABASE_KEY = os.getenv("PUBLIC_SUPABASE_KEY")
@@ -48,23 +64,28 @@ if not SUPABASE_URL or not SUPABASE_KEY:
     logger.error("❌ Please set PUBLIC_SUPABASE_URL and PUBLIC_SUPABASE_KEY in your .env file")
     sys.exit(1)
 
-# --- Fetch NBA Teams & Stats ---
-async def fetch_nba_teams():
-    url = f"{MSF_BASE_URL}/{SEASON}/team_stats_totals.json"
+def msf_season(start_year: int) -> str:
+    """MySportsFeeds name of the regular season starting in `start_year`, e.g. 2024 -> '2024-2025-regular'."""
+    return f"{start_year}-{start_year + 1}-regular"
+
+async def msf_get(url: str, limiter: Optional[RateLimiter] = None) -> Dict[str, Any]:
+    """GET a MySportsFeeds feed, within the limiter's quota when one is given."""
+    limiter = limiter or RateLimiter(MSF_RATE, concurrency=MSF_CONCURRENCY)
     async with httpx.AsyncClient(auth=(MSF_API_KEY, MSF_PASSWORD)) as client:
-        resp = await client.get(url)
+        async with limiter.limit(MSF_API_KEY, url):
+            resp = await client.get(url)
         resp.raise_for_status()
-        data = resp.json()
-        return data['teamStatsTotals']
+        return resp.json()
+
+# --- Fetch NBA Teams & Stats ---
+async def fetch_nba_teams(season: str = SEASON, limiter: Optional[RateLimiter] = None):
+    data = await msf_get(f"{MSF_BASE_URL}/{season}/team_stats_totals.json", limiter)
+    return data['teamStatsTotals']
 
 # --- Fetch NBA Players ---
-async def fetch_nba_players():
-    url = f"{MSF_BASE_URL}/players.json?season={SEASON}"
-    async with httpx.AsyncClient(auth=(MSF_API_KEY, MSF_PASSWORD)) as client:
-        resp = await client.get(url)
-        resp.raise_for_status()
-        data = resp.json()
-        return data['players']
+async def fetch_nba_players(season: str = SEASON, limiter: Optional[RateLimiter] = None):
+    data = await msf_get(f"{MSF_BASE_URL}/players.json?season={season}", limiter)
+    return data['players']
 
 # --- Helper: Prepare teams for upsert ---
 def prepare_team_rows(team_stats_totals):
@@ -112,30 +133,46 @@ def prepare_player_rows(players):
     return player_rows
 
 # --- Helper: Upsert to Supabase ---
-def upsert_to_supabase(supabase, table, data, unique_cols):
+async def upsert_to_supabase(db: AsyncSupabase, table, data, unique_cols, ledger: Optional[RowLedger] = None,
+                             chunk_size: int = UPSERT_CHUNK_SIZE) -> int:
+    """Upsert rows chunk_size at a time; returns how many were written or unchanged.
+
+    Rows the database rejects go to the dead-letter file (see
+    batch_writer.py); any other failure is raised.
+    """
     if not data:
         logger.warning(f"No data to upsert for {table}")
-        return
-    try:
-        res = supabase.table(table).upsert(data, on_conflict=unique_cols).execute()
-        logger.info(f"Upserted {len(data)} rows into {table}")
-    except Exception as e:
-        logger.error(f"Failed to upsert {table}: {e}")
+        return 0
+    data, unchanged = await afilter_changed(ledger, db, table, data, unique_cols)
+    if unchanged:
+        logger.info(f"Skipping {len(unchanged)} unchanged rows in {table}")
+    if not data:
+        return len(unchanged)
+
+    async def send(chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return (await db.execute(db.table(table).upsert(chunk, on_conflict=",".join(unique_cols)))).data
+
+    writer = BatchWriter(send, table, batch_size=chunk_size)
+    written = await writer.write(data)
+    logger.info(f"Upserted {writer.written} rows into {table} in {writer.requests} requests")
+    if ledger:
+        ledger.record(table, data, written, unique_cols)
+    return writer.written + len(unchanged)
 
     async def close(self):
         await self.session.aclose()
 
-async def get_or_create_league(supabase: Client, league_name: str, external_id: int, sport_name: str) -> Optional[str]:
+async def get_or_create_league(db: AsyncSupabase, league_name: str, external_id: int, sport_name: str) -> Optional[str]:
     """Get existing league_id or create it if not found."""
     try:
-        result = supabase.table("leagues").select("id").eq("external_id", external_id).eq("name", league_name).execute()
+        result = await db.execute(db.table("leagues").select("id").eq("external_id", external_id).eq("name", league_name))
         if result.data:
             logger.info(f"Found existing league '{league_name}' with external_id {external_id}.")
             return result.data[0]["id"]
         else:
             logger.info(f"League '{league_name}' not found, creating...")
             insert_data = {"name": league_name, "abbreviation": league_name.upper(), "sport": sport_name, "external_id": external_id}
-            result = supabase.table("leagues").insert(insert_data).execute()
+            result = await db.execute(db.table("leagues").insert(insert_data))
             if result.data:
                 logger.info(f"Created league '{league_name}'.")
                 return result.data[0]["id"]
@@ -263,7 +300,7 @@ def prepare_game_for_db(game_api_data: Dict[str, Any], league_id: str,
 
     return {k: v for k, v in game_data.items() if v is not None} # Filter out None values
 
-async def upsert_data_to_supabase(supabase: Client, table_name: str, data: List[Dict[str, Any]], 
+async def upsert_data_to_supabase(db: AsyncSupabase, table_name: str, data: List[Dict[str, Any]], 
                                 unique_column: str = "external_id", chunk_size: int = 100) -> List[Dict[str, Any]]:
     """Upsert data to Supabase table, handling conflicts on a unique column."""
     if not data:
@@ -276,7 +313,7 @@ async def upsert_data_to_supabase(supabase: Client, table_name: str, data: List[
     for i in range(0, len(data), chunk_size):
         chunk = data[i:i + chunk_size]
         try:
-            result = supabase.table(table_name).upsert(chunk, on_conflict=unique_column).execute()
+            result = await db.execute(db.table(table_name).upsert(chunk, on_conflict=unique_column))
             if result.data:
                 all_upserted_rows.extend(result.data)
                 logger.info(f"Successfully upserted/updated {len(result.data)} rows (chunk {i//chunk_size + 1}) into {table_name}.")
@@ -293,22 +330,43 @@ async def upsert_data_to_supabase(supabase: Client, table_name: str, data: List[
     logger.info(f"Finished upsert for {table_name}. Total rows processed in Supabase: {len(all_upserted_rows)}.")
     return all_upserted_rows
 
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Fetch NBA data from MySportsFeeds and upsert it into Supabase')
+    parser.add_argument('--season', default=SEASON,
+                        help=f'MySportsFeeds season to fetch (default: {SEASON})')
+    parser.add_argument('--full', action='store_true',
+                        help='Send every row, even ones the local ledger says are unchanged')
+    return parser.parse_args()
+
 async def main():
+    args = parse_args()
     logger.info("🚀 Starting NBA data fetch and Supabase sync script...")
-    supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-    # Fetch and upsert teams
-    logger.info("Fetching NBA teams and stats from MySportsFeeds...")
-    team_stats_totals = await fetch_nba_teams()
-    teams = prepare_team_rows(team_stats_totals)
-    upsert_to_supabase(supabase, 'nba_teams', teams, unique_cols=['external_team_id'])
-
-    # Fetch and upsert players
-    logger.info("Fetching NBA players from MySportsFeeds...")
-    players = await fetch_nba_players()
-    player_rows = prepare_player_rows(players)
-    upsert_to_supabase(supabase, 'nba_players', player_rows, unique_cols=['external_player_id'])
+    db = AsyncSupabase(create_client(SUPABASE_URL, SUPABASE_KEY))
+    ledger = RowLedger(full=args.full)
+    limiter = RateLimiter(MSF_RATE, concurrency=MSF_CONCURRENCY)
+    players_fetch = None
+    try:
+        # Fetch teams, and start on the players while the teams are written
+        logger.info(f"Fetching NBA teams and stats for {args.season} from MySportsFeeds...")
+        team_stats_totals = await fetch_nba_teams(args.season, limiter)
+        logger.info("Fetching NBA players from MySportsFeeds...")
+        players_fetch = asyncio.ensure_future(fetch_nba_players(args.season, limiter))
+        teams = prepare_team_rows(team_stats_totals)
+        await upsert_to_supabase(db, 'nba_teams', teams, unique_cols=['external_team_id'], ledger=ledger)
 
+        # Upsert players
+        players = await players_fetch
+        player_rows = prepare_player_rows(players)
+        await upsert_to_supabase(db, 'nba_players', player_rows, unique_cols=['external_player_id'], ledger=ledger)
+    except Exception as e:
+        logger.exception(f"NBA sync failed: {e}")
+        sys.exit(1)
+    finally:
+        if players_fetch and not players_fetch.done():
+            players_fetch.cancel()
+        db.close()
+        ledger.close()
     logger.info("NBA teams and players sync complete!")
 
 if __name__ == "__main__":
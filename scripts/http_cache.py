@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Disk-backed HTTP response cache for the provider clients, as an httpx transport.
+
+    client = httpx.AsyncClient(transport=CachingTransport(), ...)
+
+GET responses are stored gzip-compressed under HTTP_CACHE_DIR with their
+ETag / Last-Modified validators. A later request for the same URL is
+answered from disk without touching the network while the entry is younger
+than the endpoint's TTL (see DEFAULT_TTLS). Once it is older, the request is
+sent with If-None-Match / If-Modified-Since (falling back to the time the
+entry was stored when the provider gave no validator), and a 304 is
+answered from disk. Providers that ignore conditional requests simply send
+the full body again once the TTL expires.
+
+Every response passing through carries an X-Cache-Status header: HIT (served
+from disk), REVALIDATED (304, served from disk) or MISS. Together with
+ResponseCache.mark_processed / unchanged_since_processed this lets callers
+skip their downstream work when a body is the one they already handled.
+
+Bodies are streamed to and from disk in CHUNK_SIZE pieces, so a large
+payload never sits in memory whole unless the caller reads it that way
+(see json_stream.iter_json_array for the streaming side).
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+from email.utils import formatdate
+from typing import IO, Any, AsyncIterator, Dict, Optional, Sequence, Tuple
+
+import httpx
+
+CACHE_DIR = os.getenv("HTTP_CACHE_DIR", ".http_cache")
+
+CACHE_STATUS_HEADER = "X-Cache-Status"
+HIT, REVALIDATED, MISS = "HIT", "REVALIDATED", "MISS"
+
+# Bytes read or written per step when streaming bodies
+CHUNK_SIZE = 64 * 1024
+
+# (URL pattern, seconds a response is served without asking the provider),
+# first match wins. Anything else is always revalidated or re-fetched.
+DEFAULT_TTLS: Sequence[Tuple[str, float]] = (
+    (r"/AllTeams\b", 24 * 3600),
+    (r"/teams\b", 24 * 3600),             # API-SPORTS
+    (r"/Players\b", 6 * 3600),
+    (r"/players\b", 6 * 3600),            # API-SPORTS
+    (r"/Standings/", 3600),
+    (r"/PlayerSeasonStats/", 3600),
+    (r"/Games/", 3600),
+    (r"/GamesByDate/", 15 * 60),
+    (r"/GameOddsByDate/", 0),
+)
+
+# Response headers that describe the wire encoding, not the stored body
+_WIRE_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+def cache_status(response: httpx.Response) -> str:
+    """HIT, REVALIDATED or MISS for a response that went through a CachingTransport."""
+    return response.headers.get(CACHE_STATUS_HEADER, MISS)
+
+
+class ResponseCache:
+    """Compressed response bodies and their metadata, one pair of files per URL."""
+
+    def __init__(self, directory: str = CACHE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.sha1(url.encode()).hexdigest()
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        base = os.path.join(self.directory, key)
+        return base + ".json", base + ".gz"
+
+    def load(self, url: str) -> Optional[Dict[str, Any]]:
+        """Metadata for a cached URL, or None."""
+        meta_path, body_path = self._paths(self.key(url))
+        if not (os.path.exists(meta_path) and os.path.exists(body_path)):
+            return None
+        try:
+            with open(meta_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def open_body(self, url: str) -> IO[bytes]:
+        """The cached body for `url` as a decompressing file object."""
+        return gzip.open(self._paths(self.key(url))[1], "rb")
+
+    def _write_meta(self, url: str, meta: Dict[str, Any]) -> None:
+        meta_path = self._paths(self.key(url))[0]
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    async def store(self, url: str, headers: httpx.Headers, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+        """Stream a 200 response body to disk; keeps the processed marker of the previous entry."""
+        previous = self.load(url) or {}
+        body_path = self._paths(self.key(url))[1]
+        digest = hashlib.sha1()
+        try:
+            with gzip.open(body_path + ".tmp", "wb") as f:
+                async for chunk in chunks:
+                    digest.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            os.remove(body_path + ".tmp")
+            raise
+        os.replace(body_path + ".tmp", body_path)
+        meta = {
+            "url": url,
+            "stored_at": time.time(),
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "headers": {k: v for k, v in headers.items() if k.lower() not in _WIRE_HEADERS},
+            "digest": digest.hexdigest(),
+            "processed_digest": previous.get("processed_digest"),
+        }
+        self._write_meta(url, meta)
+        return meta
+
+    def touch(self, url: str, meta: Dict[str, Any]) -> None:
+        """Restart an entry's TTL after the provider confirmed it is current."""
+        meta["stored_at"] = time.time()
+        self._write_meta(url, meta)
+
+    def mark_processed(self, url: str) -> None:
+        """Record that the currently cached body for `url` has been fully handled downstream."""
+        meta = self.load(url)
+        if meta:
+            meta["processed_digest"] = meta["digest"]
+            self._write_meta(url, meta)
+
+    def unchanged_since_processed(self, url: str) -> bool:
+        """True when the cached body for `url` is the one last passed to mark_processed."""
+        meta = self.load(url)
+        return bool(meta) and meta.get("processed_digest") == meta.get("digest")
+
+
+class _CachedBodyStream(httpx.AsyncByteStream):
+    """Response body read back from a cache file in CHUNK_SIZE pieces."""
+
+    def __init__(self, file: IO[bytes]):
+        # Opened up front so a concurrent store of the same URL cannot swap the body mid-read
+        self.file = file
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        try:
+            chunk = self.file.read(CHUNK_SIZE)
+            while chunk:
+                yield chunk
+                chunk = self.file.read(CHUNK_SIZE)
+        finally:
+            self.file.close()
+
+    async def aclose(self) -> None:
+        self.file.close()
+
+
+class CachingTransport(httpx.AsyncBaseTransport):
+    """httpx transport that answers GETs from a ResponseCache when it can."""
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None,
+                 cache: Optional[ResponseCache] = None,
+                 ttls: Sequence[Tuple[str, float]] = DEFAULT_TTLS):
+        self.transport = transport or httpx.AsyncHTTPTransport()
+        self.cache = cache or ResponseCache()
+        self.ttls = [(re.compile(pattern), seconds) for pattern, seconds in ttls]
+
+    def ttl(self, url: str) -> float:
+        for pattern, seconds in self.ttls:
+            if pattern.search(url):
+                return seconds
+        return 0
+
+    def _cached_response(self, request: httpx.Request, url: str, meta: Dict[str, Any], status: str) -> httpx.Response:
+        headers = dict(meta["headers"])
+        headers[CACHE_STATUS_HEADER] = status
+        return httpx.Response(200, headers=headers, stream=_CachedBodyStream(self.cache.open_body(url)),
+                              request=request)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method != "GET":
+            return await self.transport.handle_async_request(request)
+
+        url = str(request.url)
+        meta = self.cache.load(url)
+        if meta and time.time() - meta["stored_at"] < self.ttl(url):
+            return self._cached_response(request, url, meta, HIT)
+
+        if meta:
+            if meta.get("etag"):
+                request.headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                request.headers["If-Modified-Since"] = meta["last_modified"]
+            elif not meta.get("etag"):
+                request.headers["If-Modified-Since"] = formatdate(meta["stored_at"], usegmt=True)
+
+        response = await self.transport.handle_async_request(request)
+        if response.status_code == 304 and meta:
+            await response.aclose()
+            self.cache.touch(url, meta)
+            return self._cached_response(request, url, meta, REVALIDATED)
+        if response.status_code != 200:
+            return response
+
+        # Decode the wire body here; the cache stores it gzip-compressed itself
+        wire = httpx.Response(response.status_code, headers=response.headers,
+                              stream=response.stream, request=request)
+        try:
+            meta = await self.cache.store(url, response.headers, wire.aiter_bytes(CHUNK_SIZE))
+        finally:
+            await wire.aclose()
+        return self._cached_response(request, url, meta, MISS)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
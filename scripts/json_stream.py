@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Incremental parsing of JSON array payloads, shared by the sync scripts.
+
+Provider endpoints such as PlayerSeasonStats/{season} and Games/{season}
+return one large top-level array. iter_json_array yields its elements one at
+a time as the bytes arrive, so only the element being parsed (plus one
+network chunk) is held in memory, never the whole body or the decoded list.
+
+    async with session.stream("GET", url) as response:
+        async for item in iter_json_array(response.aiter_bytes()):
+            ...
+"""
+import codecs
+import json
+from typing import Any, AsyncIterator, List
+
+_WHITESPACE = " \t\r\n"
+
+# Consumed text is dropped from the buffer once it grows past this many characters
+_COMPACT_AT = 64 * 1024
+
+
+async def iter_json_array(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    """Yield the elements of a top-level JSON array from an async stream of UTF-8 bytes.
+
+    Raises ValueError if the payload is not a JSON array or ends early.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    pos = 0
+    started = finished = done = False
+
+    while not finished:
+        try:
+            chunk = await chunks.__anext__()
+            buffer += text.decode(chunk)
+        except StopAsyncIteration:
+            buffer += text.decode(b"", final=True)
+            done = True
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos == len(buffer):
+                break
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError(f"Expected a JSON array, got {buffer[pos:pos + 20]!r}")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                finished = True
+                break
+            if buffer[pos] == ",":
+                pos += 1
+                continue
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                # The element is incomplete; wait for more bytes
+                if done:
+                    raise
+                break
+            # Accept the element only once the delimiter after it has arrived:
+            # a number cut off by the chunk boundary ("1." of "1.5") decodes
+            # without error but is followed by something else
+            after = end
+            while after < len(buffer) and buffer[after] in _WHITESPACE:
+                after += 1
+            if after == len(buffer) or buffer[after] not in ",]":
+                if done:
+                    raise ValueError(f"Expected ',' or ']' at character {after}")
+                break
+            pos = after
+            yield item
+
+        if pos > _COMPACT_AT:
+            buffer, pos = buffer[pos:], 0
+        if done and not finished:
+            raise ValueError("JSON array ended before its closing bracket")
+
+
+async def abatched(items: AsyncIterator[Any], size: int) -> AsyncIterator[List[Any]]:
+    """Group an async stream into lists of at most `size` items."""
+    batch: List[Any] = []
+    async for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
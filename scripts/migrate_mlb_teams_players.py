@@ -9,12 +9,15 @@ This script will:
 """
 import os
 import sys
+import asyncio
 import logging
 from typing import Dict, List, Optional, Any
 from datetime import datetime, timezone
 import httpx
 from dotenv import load_dotenv
 from supabase import create_client, Client as SupabaseClient
+from http_cache import CachingTransport
+from async_db import AsyncSupabase
 
 # Configure logging
 logging.basicConfig(
@@ -38,8 +41,11 @@ if not all([API_SPORTS_KEY, SUPABASE_URL, SUPABASE_KEY]):
     logger.error("Missing required environment variables. Please check your .env file.")
     sys.exit(1)
 
-# Initialize Supabase client
-supabase: SupabaseClient = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Teams migrated at once; each team's players are written concurrently
+TEAM_CONCURRENCY = int(os.getenv('MIGRATE_TEAM_CONCURRENCY', '4'))
+
+# Initialize Supabase client; queries run off the event loop
+db = AsyncSupabase(create_client(SUPABASE_URL, SUPABASE_KEY))
 
 class APISportsClient:
     """Client for interacting with the API-SPORTS API."""
@@ -49,6 +55,7 @@ class APISportsClient:
     def __init__(self, api_key: str):
         self.session = httpx.AsyncClient(
             timeout=30.0,
+            transport=CachingTransport(),
             headers={
                 'x-rapidapi-key': api_key,
                 'x-rapidapi-host': 'v1.baseball.api-sports.io'
@@ -100,22 +107,20 @@ async def find_or_create_team(team_data: Dict[str, Any]) -> Optional[Dict[str, A
     
     try:
         # Try to find by external_id first
-        result = supabase.table('teams') \
+        result = await db.execute(db.table('teams') \
             .select('*') \
             .eq('external_id', str(team_id)) \
-            .eq('sport', 'mlb') \
-            .execute()
+            .eq('sport', 'mlb'))
         
         if result.data and len(result.data) > 0:
             logger.info(f"Found existing team by external_id: {team_name}")
             return result.data[0]
         
         # Try to find by name and sport
-        result = supabase.table('teams') \
+        result = await db.execute(db.table('teams') \
             .select('*') \
             .ilike('name', f"%{team_name}%") \
-            .eq('sport', 'mlb') \
-            .execute()
+            .eq('sport', 'mlb'))
         
         if result.data and len(result.data) > 0:
             # Update existing team with external_id
@@ -133,10 +138,9 @@ async def find_or_create_team(team_data: Dict[str, Any]) -> Optional[Dict[str, A
             if not existing_team.get('abbreviation'):
                 update_data['abbreviation'] = team_data.get('code', '')[:10]
             
-            result = supabase.table('teams') \
+            result = await db.execute(db.table('teams') \
                 .update(update_data) \
-                .eq('id', existing_team['id']) \
-                .execute()
+                .eq('id', existing_team['id']))
             
             return result.data[0] if result.data else None
         
@@ -153,7 +157,7 @@ async def find_or_create_team(team_data: Dict[str, Any]) -> Optional[Dict[str, A
             'updated_at': datetime.now(timezone.utc).isoformat()
         }
         
-        result = supabase.table('teams').insert(new_team).execute()
+        result = await db.execute(db.table('teams').insert(new_team))
         return result.data[0] if result.data else None
         
     except Exception as e:
@@ -199,26 +203,24 @@ async def update_or_create_player(player_data: Dict[str, Any], team_id: str) ->
         }
         
         # Check if player exists by external_id
-        result = supabase.table('players') \
+        result = await db.execute(db.table('players') \
             .select('id') \
-            .eq('external_id', str(player_id)) \
-            .execute()
+            .eq('external_id', str(player_id)))
         
         if result.data and len(result.data) > 0:
             # Update existing player
             player_id_db = result.data[0]['id']
             logger.info(f"Updating existing player: {player_update['name']}")
             
-            result = supabase.table('players') \
+            result = await db.execute(db.table('players') \
                 .update(player_update) \
-                .eq('id', player_id_db) \
-                .execute()
+                .eq('id', player_id_db))
         else:
             # Create new player
             player_update['created_at'] = datetime.now(timezone.utc).isoformat()
             logger.info(f"Creating new player: {player_update['name']}")
             
-            result = supabase.table('players').insert(player_update).execute()
+            result = await db.execute(db.table('players').insert(player_update))
         
         return result.data[0] if result.data else None
         
@@ -226,6 +228,26 @@ async def update_or_create_player(player_data: Dict[str, Any], team_id: str) ->
         logger.error(f"Error in update_or_create_player: {e}")
         return None
 
+async def migrate_team(api_client: APISportsClient, team: Dict[str, Any]) -> None:
+    """Find or create one team, then update or create its players."""
+    # The players are fetched by the API's team id, so the fetch overlaps the team lookup
+    players_fetch = asyncio.ensure_future(api_client.get_team_players(team_id=team['id'], season=2024))
+    
+    # Find or create team in database
+    db_team = await find_or_create_team(team)
+    if not db_team:
+        players_fetch.cancel()
+        logger.error(f"Failed to process team: {team.get('name')}")
+        return
+    
+    logger.info(f"Processing players for team: {db_team['name']}")
+    
+    # Step 3: Fetch players for this team
+    players = await players_fetch
+    
+    # Step 4: Process the players
+    await asyncio.gather(*(update_or_create_player(player_data, db_team['id']) for player_data in players))
+
 async def main():
     """Main function to migrate teams and players."""
     api_client = APISportsClient(API_SPORTS_KEY)
@@ -238,33 +260,22 @@ async def main():
             logger.error("No teams found in the API response")
             return
         
-        # Step 2: Process each team
-        for team_data in teams:
-            team = team_data.get('team', {})
-            if not team:
-                continue
-                
-            # Find or create team in database
-            db_team = await find_or_create_team(team)
-            if not db_team:
-                logger.error(f"Failed to process team: {team.get('name')}")
-                continue
-            
-            logger.info(f"Processing players for team: {db_team['name']}")
-            
-            # Step 3: Fetch players for this team
-            players = await api_client.get_team_players(team_id=team['id'], season=2024)
-            
-            # Step 4: Process each player
-            for player_data in players:
-                await update_or_create_player(player_data, db_team['id'])
+        # Step 2: Process the teams, TEAM_CONCURRENCY at a time
+        semaphore = asyncio.Semaphore(TEAM_CONCURRENCY)
+        
+        async def process(team: Dict[str, Any]) -> None:
+            async with semaphore:
+                await migrate_team(api_client, team)
+        
+        await asyncio.gather(*(process(team_data.get('team', {})) for team_data in teams
+                               if team_data.get('team')))
                 
     except Exception as e:
         logger.error(f"Error in main: {e}")
     finally:
         await api_client.close()
+        db.close()
         logger.info("Migration completed")
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())
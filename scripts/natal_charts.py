@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+natal_charts.py - Batch natal positions for every player with a birth date.
+
+Players synced by sync_sports_data.py carry a birth_date (birth times are not
+available). Downstream scoring used to approximate Sun and Moon signs from
+day-of-year tables one player at a time; this script computes real positions
+for all ten bodies with Swiss Ephemeris instead, using the setup in
+computeEphemeris.py.
+
+Many players share a birth date, so the player table is reduced to its
+unique birth dates first and each date is computed once, in a single
+vectorized pass. Results go to the compact 'natal_positions' table (one row
+per birth date) and optionally to a local .npz file that scoring code can
+load without touching Supabase or swisseph.
+
+Positions are for 12:00 UTC on the birth date, the usual convention when the
+birth time is unknown; every body except the Moon (about +/-6.5 degrees) is
+then accurate to well under a degree.
+
+Usage:
+    python natal_charts.py                          # compute new birth dates, upsert to Supabase
+    python natal_charts.py --full --output natal.npz
+"""
+
+import argparse
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import swisseph as swe
+
+from computeEphemeris import (
+    BODY_NAMES,
+    LON,
+    SPEED,
+    UPLOAD_CHUNK_SIZE,
+    UPLOAD_CONCURRENCY,
+    ZODIAC_SIGNS,
+    compute_positions,
+    fetch_all,
+    get_julday,
+    sign_indices,
+    upsert_chunk,
+)
+
+# Hour (UTC) used for every natal chart, since birth times are unknown
+NATAL_HOUR_UTC = 12
+
+# Bump when the natal computation changes so stored rows are recomputed
+NATAL_SCHEMA_VERSION = 1
+
+NATAL_TABLE = "natal_positions"
+
+
+def parse_birth_date(value):
+    """Parse a birth_date value ('1990-05-12' or '1990-05-12T00:00:00') to a date, or None."""
+    if not value:
+        return None
+    try:
+        return datetime.date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def fetch_player_birth_dates():
+    """Return {player_id: birth date} for every player with a usable birth date."""
+    birth_dates = {}
+    for row in fetch_all("players", "id,birth_date", key="id"):
+        birth_date = parse_birth_date(row.get("birth_date"))
+        if birth_date:
+            birth_dates[row["id"]] = birth_date
+    return birth_dates
+
+
+def fetch_stored_birth_dates():
+    """Birth dates already stored with the current NATAL_SCHEMA_VERSION."""
+    rows = fetch_all(NATAL_TABLE, "birth_date,schema_version", key="birth_date")
+    return {parse_birth_date(row["birth_date"]) for row in rows
+            if (row.get("schema_version") or 0) >= NATAL_SCHEMA_VERSION}
+
+
+def natal_julian_days(birth_dates):
+    """UT Julian day of NATAL_HOUR_UTC on each birth date."""
+    return np.array([get_julday(d.year, d.month, d.day) for d in birth_dates]) + NATAL_HOUR_UTC / 24.0
+
+
+def compute_natal_positions(birth_dates):
+    """Positions (birth dates x bodies x [lon, lat, speed]) for a list of unique birth dates."""
+    return compute_positions(natal_julian_days(birth_dates))
+
+
+def natal_rows(birth_dates, positions):
+    """Rows for the natal_positions table, one per birth date."""
+    signs = sign_indices(positions[:, :, LON])
+    rows = []
+    for i, birth_date in enumerate(birth_dates):
+        rows.append({
+            "birth_date": birth_date.isoformat(),
+            "longitudes": [round(float(v), 6) for v in positions[i, :, LON]],
+            "speeds": [round(float(v), 6) for v in positions[i, :, SPEED]],
+            "signs": [ZODIAC_SIGNS[s] for s in signs[i]],
+            "schema_version": NATAL_SCHEMA_VERSION,
+        })
+    return rows
+
+
+def store_natal_rows(rows, chunk_size=UPLOAD_CHUNK_SIZE, concurrency=UPLOAD_CONCURRENCY):
+    """Upsert natal rows on birth_date in concurrent chunks; returns rows written."""
+    chunks = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+    written = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(upsert_chunk, chunk, NATAL_TABLE, "birth_date"): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            chunk = futures[future]
+            try:
+                written += future.result()
+            except Exception as e:
+                print(f"Exception storing natal rows {chunk[0]['birth_date']} to {chunk[-1]['birth_date']}: {e}")
+    return written
+
+
+def save_natal_table(path, birth_dates, positions):
+    """Write unique birth dates and their positions to a compressed .npz file."""
+    np.savez_compressed(path,
+                        birth_dates=np.array(birth_dates, dtype="datetime64[D]"),
+                        positions=positions.astype(np.float32),
+                        bodies=np.array(BODY_NAMES))
+
+
+class NatalTable:
+    """Natal positions indexed by birth date, loaded from a save_natal_table file."""
+
+    def __init__(self, birth_dates, positions):
+        order = np.argsort(birth_dates)
+        self.birth_dates = np.asarray(birth_dates, dtype="datetime64[D]")[order]
+        self.positions = np.asarray(positions)[order]
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["birth_dates"], data["positions"])
+
+    def _index(self, birth_dates):
+        """(wanted dates, table index of each, mask of the dates found)."""
+        wanted = np.asarray(birth_dates, dtype="datetime64[D]")
+        if not len(self.birth_dates):
+            return wanted, np.zeros(len(wanted), dtype=np.intp), np.zeros(len(wanted), dtype=bool)
+        index = np.searchsorted(self.birth_dates, wanted)
+        index = np.minimum(index, len(self.birth_dates) - 1)
+        return wanted, index, self.birth_dates[index] == wanted
+
+    def contains(self, birth_dates):
+        """Boolean mask of the birth dates that are in the table (None/NaT never are)."""
+        return self._index(birth_dates)[2]
+
+    def lookup(self, birth_dates):
+        """Positions for each birth date (any order, repeats allowed).
+
+        Raises KeyError if a date is not in the table; see contains().
+        """
+        wanted, index, found = self._index(birth_dates)
+        if not np.all(found):
+            raise KeyError(f"No natal positions for {wanted[~found][:5]}")
+        return self.positions[index]
+
+
+def fetch_natal_table(birth_dates, batch_size=200):
+    """NatalTable for the given birth dates, read from the natal_positions table.
+
+    Latitudes are not stored, so that column is NaN.
+    """
+    wanted = sorted({d.isoformat() for d in birth_dates})
+    rows = []
+    for i in range(0, len(wanted), batch_size):
+        rows.extend(fetch_all(NATAL_TABLE, "birth_date,longitudes,speeds", key="birth_date",
+                              where={"birth_date": wanted[i:i + batch_size]}))
+    positions = np.full((len(rows), len(BODY_NAMES), 3), np.nan)
+    for i, row in enumerate(rows):
+        positions[i, :, LON] = row["longitudes"]
+        positions[i, :, SPEED] = row["speeds"]
+    return NatalTable([parse_birth_date(row["birth_date"]) for row in rows], positions)
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Compute natal positions for every player birth date')
+    parser.add_argument('--full', action='store_true',
+                        help='Recompute every birth date, not just ones missing from Supabase')
+    parser.add_argument('--output', help='Also write all unique birth dates and positions to this .npz file')
+    parser.add_argument('--no-store', action='store_true', help='Do not write to Supabase')
+    return parser.parse_args()
+
+
+def main():
+    """Main execution function."""
+    args = parse_args()
+    try:
+        started = time.perf_counter()
+        players = fetch_player_birth_dates()
+        unique_dates = sorted(set(players.values()))
+        print(f"{len(players)} players with birth dates share {len(unique_dates)} unique dates")
+
+        if args.output or args.full or args.no_store:
+            to_compute = unique_dates
+        else:
+            stored = fetch_stored_birth_dates()
+            to_compute = [d for d in unique_dates if d not in stored]
+            print(f"{len(unique_dates) - len(to_compute)} birth dates already stored")
+
+        positions = compute_natal_positions(to_compute) if to_compute else np.empty((0, len(BODY_NAMES), 3))
+        print(f"Computed {len(to_compute)} natal charts in {time.perf_counter() - started:.2f}s")
+
+        if args.output:
+            save_natal_table(args.output, to_compute, positions)
+            print(f"Wrote natal table to {args.output}")
+        if not args.no_store and to_compute:
+            written = store_natal_rows(natal_rows(to_compute, positions))
+            print(f"Stored {written} natal rows in Supabase")
+
+    except Exception as e:
+        print(f"Error: {e}")
+    finally:
+        swe.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Async rate limiting shared by the sync scripts.
+
+A RateLimiter hands out one token bucket and one concurrency cap per
+(API key, host). Every client built with the same RateLimiter and key
+shares that budget. Several leagues using one SportsData.io key therefore
+stay inside the key's quota together, however many league pipelines run
+at once.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional, Tuple, TypeVar
+from urllib.parse import urlsplit
+
+K = TypeVar("K")
+
+
+class AsyncTokenBucket:
+    """Token bucket refilled at `rate` tokens/second, holding at most `capacity`."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """Wait until `tokens` are available and take them."""
+        # The lock queues waiters in FIFO order so no caller starves
+        async with self._lock:
+            self._refill()
+            if self.tokens < tokens:
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= tokens
+
+
+class RateLimiter:
+    """Request rate and concurrency limits per (API key, host)."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None, concurrency: int = 8):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self._limits: Dict[Tuple[str, str], Tuple[AsyncTokenBucket, asyncio.Semaphore]] = {}
+
+    def _get(self, key: str, host: str) -> Tuple[AsyncTokenBucket, asyncio.Semaphore]:
+        if (key, host) not in self._limits:
+            self._limits[(key, host)] = (AsyncTokenBucket(self.rate, self.burst),
+                                         asyncio.Semaphore(self.concurrency))
+        return self._limits[(key, host)]
+
+    @asynccontextmanager
+    async def limit(self, key: str, url: str):
+        """Hold a concurrency slot and one token for a request to `url` made with `key`."""
+        bucket, semaphore = self._get(key, urlsplit(url).netloc or url)
+        async with semaphore:
+            await bucket.acquire()
+            yield
+
+
+async def fetch_as_completed(keys: Iterable[K],
+                             fetch: Callable[[K], Awaitable[Any]]) -> AsyncIterator[Tuple[K, Any]]:
+    """Run fetch(key) for every key at once and yield (key, result) in completion order.
+
+    Concurrency is bounded by the RateLimiter that `fetch` goes through, so
+    all keys can be started together. Exceptions from `fetch` propagate;
+    the remaining fetches are cancelled if the caller stops early.
+    """
+    async def keyed(key: K) -> Tuple[K, Any]:
+        return key, await fetch(key)
+
+    tasks = [asyncio.ensure_future(keyed(key)) for key in keys]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
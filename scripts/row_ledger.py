@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Local content-hash ledger used to skip rows that have not changed since the
+last sync.
+
+The ledger is a SQLite file holding, for every row written, a hash of its
+content keyed by table and natural key (the on_conflict columns), plus the
+row's database id. Before a write, prepared rows are partitioned into
+changed rows, which are sent, and unchanged rows, which are not sent and
+are returned with their stored id so callers can still build their
+external-to-internal id maps. After a successful write the ledger is
+updated from the rows the server returned.
+
+Volatile fields such as updated_at are left out of the hash. Every
+VERIFY_INTERVAL_DAYS the callers run a verification sweep: they read the
+table's natural keys back from the database, and the ledger forgets any
+row that is no longer there, so it is sent again on the next run.
+
+The sweep only recovers deleted rows. It compares keys, not content: a
+row edited out of band keeps its ledger hash and is not sent again until
+its source data changes. Stored rows cannot be hashed the way sent rows
+are (the database adds columns and normalizes values), so run a sync with
+--full to overwrite such edits.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Ledger file, one per machine running the syncs
+LEDGER_PATH = os.getenv("SYNC_LEDGER_PATH", "sync_ledger.sqlite3")
+
+# Fields that change on every run without the row really changing
+VOLATILE_FIELDS = {"updated_at", "last_updated"}
+
+# Days between verification sweeps of a table
+VERIFY_INTERVAL_DAYS = 7
+
+# Natural keys per SQLite lookup when partitioning a batch (SQLite allows 999 parameters)
+KEY_LOOKUP_BATCH_SIZE = 500
+
+
+def row_hash(row: Dict[str, Any]) -> str:
+    """Content hash of a row, ignoring VOLATILE_FIELDS and key order."""
+    content = {k: v for k, v in row.items() if k not in VOLATILE_FIELDS}
+    canonical = json.dumps(content, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(canonical.encode()).hexdigest()
+
+
+def natural_key(row: Dict[str, Any], key_columns: Sequence[str]) -> Optional[str]:
+    """Natural key of a row as a string, or None if a key column is missing."""
+    values = [row.get(column) for column in key_columns]
+    if any(value is None for value in values):
+        return None
+    return "|".join(str(value) for value in values)
+
+
+def key_columns_of(on_conflict) -> List[str]:
+    """Key columns from an on_conflict value ('a,b' or ['a', 'b'])."""
+    if isinstance(on_conflict, str):
+        on_conflict = on_conflict.split(',')
+    return [column.strip() for column in on_conflict if column.strip()]
+
+
+class RowLedger:
+    """Content hashes of written rows, keyed by table and natural key."""
+
+    def __init__(self, path: str = LEDGER_PATH, full: bool = False):
+        self.path = path
+        # With full=True every row is treated as changed, but the ledger is still updated
+        self.full = full
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS rows (
+                table_name TEXT NOT NULL,
+                natural_key TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                row_id TEXT,
+                written_at REAL NOT NULL,
+                PRIMARY KEY (table_name, natural_key)
+            );
+            CREATE TABLE IF NOT EXISTS verified (
+                table_name TEXT PRIMARY KEY,
+                verified_at REAL NOT NULL
+            );
+        """)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def _stored(self, table: str, keys: Optional[Sequence[str]] = None) -> Dict[str, Tuple[str, Optional[str]]]:
+        """Stored (hash, row_id) by natural key, for the whole table or just `keys`."""
+        if keys is None:
+            cursor = self.db.execute("SELECT natural_key, hash, row_id FROM rows WHERE table_name = ?", (table,))
+            return {key: (digest, row_id) for key, digest, row_id in cursor}
+        stored = {}
+        for i in range(0, len(keys), KEY_LOOKUP_BATCH_SIZE):
+            batch = keys[i:i + KEY_LOOKUP_BATCH_SIZE]
+            cursor = self.db.execute(
+                f"SELECT natural_key, hash, row_id FROM rows WHERE table_name = ? "
+                f"AND natural_key IN ({','.join('?' * len(batch))})", (table, *batch))
+            stored.update((key, (digest, row_id)) for key, digest, row_id in cursor)
+        return stored
+
+    def partition(self, table: str, rows: List[Dict[str, Any]],
+                  on_conflict) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Split rows into (changed, unchanged).
+
+        Unchanged rows are returned with their stored database id under 'id'.
+        """
+        if self.full:
+            return list(rows), []
+        key_columns = key_columns_of(on_conflict)
+        keys = [natural_key(row, key_columns) for row in rows]
+        # Only the batch's own keys are looked up, so streamed batches stay cheap
+        stored = self._stored(table, [key for key in set(keys) if key is not None])
+        changed, unchanged = [], []
+        for row, key in zip(rows, keys):
+            entry = stored.get(key)
+            if entry and entry[0] == row_hash(row):
+                unchanged.append({**row, "id": entry[1]} if entry[1] else dict(row))
+            else:
+                changed.append(row)
+        return changed, unchanged
+
+    def record(self, table: str, rows: List[Dict[str, Any]], written: Iterable[Dict[str, Any]],
+               on_conflict) -> int:
+        """Store hashes for the rows the server confirmed in `written`; returns how many were recorded."""
+        key_columns = key_columns_of(on_conflict)
+        ids = {}
+        for result in written:
+            if isinstance(result, dict):
+                ids[natural_key(result, key_columns)] = result.get("id")
+        now = time.time()
+        entries = []
+        for row in rows:
+            key = natural_key(row, key_columns)
+            if key is not None and key in ids:
+                row_id = ids[key]
+                entries.append((table, key, row_hash(row), str(row_id) if row_id is not None else None, now))
+        self.db.executemany("INSERT OR REPLACE INTO rows VALUES (?, ?, ?, ?, ?)", entries)
+        self.db.commit()
+        return len(entries)
+
+    def verification_due(self, table: str, interval_days: float = VERIFY_INTERVAL_DAYS) -> bool:
+        """True when the table has ledger entries and has not been verified within interval_days."""
+        if not self.db.execute("SELECT 1 FROM rows WHERE table_name = ? LIMIT 1", (table,)).fetchone():
+            return False
+        row = self.db.execute("SELECT verified_at FROM verified WHERE table_name = ?", (table,)).fetchone()
+        return row is None or time.time() - row[0] > interval_days * 86400
+
+    def verify(self, table: str, stored_rows: Iterable[Dict[str, Any]], on_conflict) -> int:
+        """Forget ledger entries whose natural key is not among the database's rows.
+
+        `stored_rows` are the table's rows as read back from the database
+        (only the key columns are needed). Returns the number forgotten.
+        Content is not compared, so rows edited in the database stay
+        recorded as written; see the module docstring.
+        """
+        key_columns = key_columns_of(on_conflict)
+        present = {natural_key(row, key_columns) for row in stored_rows}
+        missing = [(table, key) for key in self._stored(table) if key not in present]
+        self.db.executemany("DELETE FROM rows WHERE table_name = ? AND natural_key = ?", missing)
+        self.db.execute("INSERT OR REPLACE INTO verified VALUES (?, ?)", (table, time.time()))
+        self.db.commit()
+        return len(missing)
+
+
+def stored_keys(client, table: str, on_conflict, page_size: int = 1000) -> List[Dict[str, Any]]:
+    """Read the key columns of every row of `table` with a supabase-py client."""
+    columns = ",".join(key_columns_of(on_conflict))
+    stored = []
+    offset = 0
+    while True:
+        page = client.table(table).select(columns).order(key_columns_of(on_conflict)[0]) \
+            .range(offset, offset + page_size - 1).execute().data or []
+        stored.extend(page)
+        if len(page) < page_size:
+            break
+        offset += page_size
+    return stored
+
+
+def verify_with_client(ledger: RowLedger, client, table: str, on_conflict, page_size: int = 1000) -> int:
+    """Run a verification sweep for `table` using a supabase-py client; returns entries forgotten."""
+    return ledger.verify(table, stored_keys(client, table, on_conflict, page_size), on_conflict)
+
+
+def filter_changed(ledger: Optional[RowLedger], client, table: str, rows: List[Dict[str, Any]],
+                   on_conflict) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Partition rows for a supabase-py write, running a verification sweep first when one is due.
+
+    Returns (changed, unchanged); with no ledger every row is changed.
+    """
+    if not ledger or not on_conflict:
+        return rows, []
+    if ledger.verification_due(table):
+        verify_with_client(ledger, client, table, on_conflict)
+    return ledger.partition(table, rows, on_conflict)
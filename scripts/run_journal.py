@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Run journal for resumable syncs.
+
+A sync run records its progress per league and season in a SQLite file:
+which stages have completed and, inside a streamed stage, the offset
+reached after every committed batch together with a row-hash watermark.
+The watermark is a hash chain over every item up to that offset.
+
+With --resume, a run skips completed stages. Inside a stage it skips the
+items before the last committed offset, without transforming or writing
+them. The skipped items are still hashed, and at every recorded offset the
+hash must match the recorded watermark. If the provider's data has changed
+since the interrupted run, the watermark no longer matches: skipping stops
+and the items since the last matching offset are processed again.
+
+Without --resume, a run clears the journal of its league and season and
+starts over, but still journals its progress so that it can be resumed.
+A league's journal is cleared once it syncs completely.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Journal file, next to the row ledger by default
+JOURNAL_PATH = os.getenv("SYNC_JOURNAL_PATH", "sync_journal.sqlite3")
+
+
+def _item_digest(item: Any) -> str:
+    return json.dumps(item, sort_keys=True, separators=(',', ':'), default=str)
+
+
+class RunJournal:
+    """Completed stages and committed batch offsets, keyed by run (league and season)."""
+
+    def __init__(self, path: str = JOURNAL_PATH, resume: bool = False):
+        self.path = path
+        self.resume = resume
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS stages (
+                run TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                completed_at REAL NOT NULL,
+                PRIMARY KEY (run, stage)
+            );
+            CREATE TABLE IF NOT EXISTS batches (
+                run TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                batch_offset INTEGER NOT NULL,
+                watermark TEXT NOT NULL,
+                committed_at REAL NOT NULL,
+                PRIMARY KEY (run, stage, batch_offset)
+            );
+        """)
+
+    def close(self) -> None:
+        self.db.close()
+
+    @staticmethod
+    def run_key(league: str, season: int) -> str:
+        return f"{league}:{season}"
+
+    def begin(self, run: str) -> None:
+        """Start a run: keeps its journal when resuming, otherwise clears it."""
+        if self.resume:
+            done = [row[0] for row in self.db.execute("SELECT stage FROM stages WHERE run = ?", (run,))]
+            if done:
+                logger.info(f"  Resuming {run}: {', '.join(sorted(done))} already complete")
+        else:
+            self.clear(run)
+
+    def clear(self, run: str) -> None:
+        """Forget a run's progress."""
+        self.db.execute("DELETE FROM stages WHERE run = ?", (run,))
+        self.db.execute("DELETE FROM batches WHERE run = ?", (run,))
+        self.db.commit()
+
+    def stage_done(self, run: str, stage: str) -> bool:
+        return self.db.execute("SELECT 1 FROM stages WHERE run = ? AND stage = ?", (run, stage)).fetchone() is not None
+
+    def complete(self, run: str, stage: str) -> None:
+        """Mark a stage complete; its batch offsets are no longer needed."""
+        self.db.execute("INSERT OR REPLACE INTO stages VALUES (?, ?, ?)", (run, stage, time.time()))
+        self.db.execute("DELETE FROM batches WHERE run = ? AND stage = ?", (run, stage))
+        self.db.commit()
+
+    def batches(self, run: str, stage: str) -> List[Tuple[int, str]]:
+        """Committed (offset, watermark) pairs of a stage, in order."""
+        return list(self.db.execute(
+            "SELECT batch_offset, watermark FROM batches WHERE run = ? AND stage = ? ORDER BY batch_offset",
+            (run, stage)))
+
+    def record_batch(self, run: str, stage: str, offset: int, watermark: str) -> None:
+        self.db.execute("INSERT OR REPLACE INTO batches VALUES (?, ?, ?, ?, ?)",
+                        (run, stage, offset, watermark, time.time()))
+        self.db.commit()
+
+    def truncate(self, run: str, stage: str, offset: int) -> None:
+        """Drop a stage's offsets beyond `offset`, once they no longer describe the data."""
+        self.db.execute("DELETE FROM batches WHERE run = ? AND stage = ? AND batch_offset > ?", (run, stage, offset))
+        self.db.commit()
+
+    def checkpoint(self, run: str, stage: str, key: Optional[Callable[[Any], Any]] = None) -> "StageCheckpoint":
+        return StageCheckpoint(self, run, stage, key)
+
+
+class StageCheckpoint:
+    """Progress through one streamed stage: decides which items to skip and records commits.
+
+    Feed every batch of items through split(), in stream order, and call
+    commit() once the items it returned for processing have been written.
+    `key` picks the part of an item that goes into the watermark.
+    """
+
+    def __init__(self, journal: RunJournal, run: str, stage: str, key: Optional[Callable[[Any], Any]] = None):
+        self.journal = journal
+        self.run = run
+        self.stage = stage
+        self.key = key or (lambda item: item)
+        self.position = 0
+        self.watermark = ""
+        self.offsets = journal.batches(run, stage) if journal.resume else []
+        self.skipping = bool(self.offsets)
+        self.verified = 0
+        # Skipped items not yet matched against a recorded watermark
+        self.held: List[Any] = []
+        self.skipped = 0
+
+    def _advance(self, item: Any) -> None:
+        self.position += 1
+        self.watermark = hashlib.sha1((self.watermark + _item_digest(self.key(item))).encode()).hexdigest()
+
+    def split(self, batch: List[Any]) -> Tuple[List[Any], List[Any]]:
+        """Split a batch into (already written, to process)."""
+        skip: List[Any] = []
+        process: List[Any] = []
+        for item in batch:
+            self._advance(item)
+            if not self.skipping:
+                process.append(item)
+                continue
+            self.held.append(item)
+            offset, expected = self.offsets[0]
+            if self.position < offset:
+                continue
+            self.offsets.pop(0)
+            if self.watermark == expected:
+                skip.extend(self.held)
+                self.verified = self.position
+                self.skipping = bool(self.offsets)
+            else:
+                logger.warning(f"  {self.run} {self.stage}: data changed since the interrupted run, "
+                               f"reprocessing from item {self.verified}")
+                process.extend(self.held)
+                self.skipping = False
+                self.offsets = []
+                self.journal.truncate(self.run, self.stage, self.verified)
+            self.held = []
+        self.skipped += len(skip)
+        return skip, process
+
+    def flush(self) -> List[Any]:
+        """At the end of the stream, the held items that could not be verified; they must be processed."""
+        held, self.held = self.held, []
+        if held:
+            self.skipping = False
+            self.journal.truncate(self.run, self.stage, self.verified)
+        return held
+
+    def commit(self) -> None:
+        """Record that everything up to the current position has been written."""
+        if not self.held and self.position > self.verified:
+            self.journal.record_batch(self.run, self.stage, self.position, self.watermark)
+            self.verified = self.position
@@ -1,6 +1,7 @@
 # scripts/scrape_teams_only.py
 import os
 import sys
+import asyncio
 import logging
 from datetime import datetime
 from pathlib import Path
@@ -8,6 +9,7 @@ from dotenv import load_dotenv
 import httpx
 from supabase import create_client, Client
 from typing import Dict, List, Optional
+from async_db import AsyncSupabase
 
 # Load environment variables from .env file
 env_path = Path(__file__).parent.parent / '.env'
@@ -36,7 +38,8 @@ if not SUPABASE_URL or not SUPABASE_KEY:
                      "Please set VITE_SUPABASE_URL and VITE_SUPABASE_KEY or "
                      "SUPABASE_URL and SUPABASE_KEY in your .env file.")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Queries run in a thread pool so the sports can be fetched and written concurrently
+db = AsyncSupabase(create_client(SUPABASE_URL, SUPABASE_KEY))
 
 # ESPN API configuration
 ESPN_BASE_URL = "https://site.api.espn.com/apis/site/v2/sports"
@@ -168,11 +171,11 @@ async def upsert_teams(teams_data: List[Dict], sport: str) -> None:
         logger.info(f"Upserting batch {i//batch_size + 1} with {len(batch)} teams...")
         logger.info(f"Batch payload: {batch}")
         try:
-            response = supabase.table('teams').upsert(
+            response = await db.execute(db.table('teams').upsert(
                 batch,
                 on_conflict='espn_id',
                 returning='representation'
-            ).execute()
+            ))
             logger.info(f"Supabase response: {response}")
             if hasattr(response, 'data') and response.data:
                 logger.info(f"Successfully upserted {len(response.data)} {sport.upper()} teams (batch {i//batch_size + 1})")
@@ -185,21 +188,28 @@ async def upsert_teams(teams_data: List[Dict], sport: str) -> None:
             logger.error(f"Batch data: {batch}")
 
 
+async def update_sport(sport: str) -> None:
+    """Fetch and update the teams of one sport."""
+    logger.info(f"Fetching {sport.upper()} teams...")
+    teams = await fetch_teams(sport)
+    if teams:
+        logger.info(f"Found {len(teams)} {sport.upper()} teams")
+        await upsert_teams(teams, sport)
+    else:
+        logger.warning(f"No teams found for {sport.upper()}")
+
+
 async def main():
     """Main function to fetch and update teams for all sports."""
     logger.info("Starting team data update...")
     
-    for sport in SPORTS.keys():
-        logger.info(f"Fetching {sport.upper()} teams...")
-        teams = await fetch_teams(sport)
-        if teams:
-            logger.info(f"Found {len(teams)} {sport.upper()} teams")
-            await upsert_teams(teams, sport)
-        else:
-            logger.warning(f"No teams found for {sport.upper()}")
+    # One sport's fetch overlaps another's writes
+    try:
+        await asyncio.gather(*(update_sport(sport) for sport in SPORTS.keys()))
+    finally:
+        db.close()
     
     logger.info("Team data update complete!")
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())
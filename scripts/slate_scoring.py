@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+slate_scoring.py - Transit-to-natal aspect scoring for a day's slate of games.
+
+For every game on the slate, the transiting bodies are computed at the
+scheduled start (games.game_time_utc). Every rostered player on both teams is
+paired with that chart, and the separations between all ten transiting and
+all ten natal bodies are computed as one NumPy tensor of shape
+(appearances, transit bodies, natal bodies). Aspects are classified against
+the orbs in computeEphemeris.ASPECTS and scored in the same pass, then
+summed per player and per team.
+
+An appearance is one player in one game, so doubleheaders score twice.
+Natal positions come from the natal_positions table written by
+natal_charts.py, or from a local .npz file written with its --output flag.
+
+Usage:
+    python slate_scoring.py --date 2025-06-14 --output slate.json
+    python slate_scoring.py --date 2025-06-14 --natal natal.npz --output slate.json
+"""
+
+import argparse
+import datetime
+import json
+import time
+
+import numpy as np
+import swisseph as swe
+
+from computeEphemeris import (
+    ASPECTS,
+    BODY_NAMES,
+    LON,
+    angular_separation,
+    classify_aspects,
+    compute_positions,
+    datetime_to_jd,
+    fetch_all,
+    parse_game_time,
+)
+from natal_charts import NatalTable, fetch_natal_table, parse_birth_date
+
+ASPECT_NAMES = tuple(name for name, _, _ in ASPECTS)
+ASPECT_ANGLES = np.array([angle for _, angle, _ in ASPECTS])
+ASPECT_ORBS = np.array([orb for _, _, orb in ASPECTS])
+
+# Signed weight of an exact aspect: the strengths from src/lib/astroUtils.ts
+# ASPECT_DEFINITIONS, negative for the challenging aspects
+ASPECT_WEIGHTS = {
+    "conjunction": 1.0,
+    "opposition": -0.9,
+    "trine": 0.8,
+    "square": -0.7,
+    "sextile": 0.6,
+}
+WEIGHTS = np.array([ASPECT_WEIGHTS[name] for name in ASPECT_NAMES])
+
+
+def fetch_slate(date):
+    """Games scheduled to start on the given UTC date, in start-time order."""
+    return fetch_all("games", "id,league_id,game_time_utc,home_team_id,away_team_id",
+                     f"{date.isoformat()}T00:00:00+00:00", f"{date.isoformat()}T23:59:59.999999+00:00",
+                     key="game_time_utc")
+
+
+def fetch_rosters(team_ids):
+    """Active players with a birth date on the given teams."""
+    rows = fetch_all("players", "id,current_team_id,birth_date", key="id",
+                     where={"current_team_id": sorted(team_ids), "is_active": ["true"]})
+    return [row for row in rows if parse_birth_date(row.get("birth_date"))]
+
+
+def build_appearances(games, players):
+    """Pair each player with every game their team plays on the slate.
+
+    Returns parallel arrays (game index, player index, team id) with one
+    entry per appearance.
+    """
+    games_by_team = {}
+    for g, game in enumerate(games):
+        games_by_team.setdefault(game["home_team_id"], []).append(g)
+        games_by_team.setdefault(game["away_team_id"], []).append(g)
+
+    game_index, player_index, team_ids = [], [], []
+    for p, player in enumerate(players):
+        for g in games_by_team.get(player["current_team_id"], ()):
+            game_index.append(g)
+            player_index.append(p)
+            team_ids.append(player["current_team_id"])
+    return np.array(game_index, dtype=np.intp), np.array(player_index, dtype=np.intp), team_ids
+
+
+def score_tensor(transit_lon, natal_lon):
+    """Aspect tensors for matched rows of transit and natal longitudes.
+
+    Both inputs have shape (appearances, bodies). Returns a dict of
+    (appearances x transit bodies x natal bodies) arrays:
+        aspect: index into ASPECTS, -1 where no aspect is in orb
+        orb:    distance from exact in degrees (NaN where no aspect)
+        score:  signed aspect weight scaled by closeness to exact (0 where no aspect)
+    """
+    separation = angular_separation(transit_lon[:, :, None], natal_lon[:, None, :])
+    aspect = classify_aspects(separation)
+    has_aspect = aspect >= 0
+    index = np.where(has_aspect, aspect, 0)
+    orb = np.abs(separation - ASPECT_ANGLES[index])
+    score = np.where(has_aspect, WEIGHTS[index] * (1.0 - orb / ASPECT_ORBS[index]), 0.0)
+    return {"aspect": aspect, "orb": np.where(has_aspect, orb, np.nan), "score": score}
+
+
+def aggregate(tensor, keys):
+    """Sum scores and count aspects by ASPECTS entry for each distinct key.
+
+    Returns (unique keys, scores, counts) where counts has one column per aspect.
+    """
+    unique, inverse = np.unique(np.asarray(keys), return_inverse=True)
+    per_row = tensor["score"].sum(axis=(1, 2))
+    scores = np.bincount(inverse, weights=per_row, minlength=len(unique))
+    counts = np.zeros((len(unique), len(ASPECTS)), dtype=np.int64)
+    aspect = tensor["aspect"].reshape(len(inverse), len(BODY_NAMES) ** 2)
+    for a in range(len(ASPECTS)):
+        counts[:, a] = np.bincount(inverse, weights=(aspect == a).sum(axis=1), minlength=len(unique))
+    return unique, scores, counts
+
+
+def score_slate(games, players, natal):
+    """Score every appearance on a slate.
+
+    `games` and `players` are rows from fetch_slate and fetch_rosters;
+    `natal` is a NatalTable of the players' birth dates. Appearances of
+    players whose birth date is missing or not in the table are dropped
+    with a warning, and listed under "unscored".
+    """
+    game_index, player_index, team_ids = build_appearances(games, players)
+    jds = [datetime_to_jd(parse_game_time(game["game_time_utc"])) for game in games]
+    transits = compute_positions(jds)
+
+    birth_dates = [parse_birth_date(players[p]["birth_date"]) for p in player_index]
+    found = natal.contains(birth_dates) if len(player_index) else np.zeros(0, dtype=bool)
+    unscored = sorted({players[p]["id"] for p in player_index[~found]}, key=str)
+    if unscored:
+        print(f"Warning: no natal positions for {len(unscored)} players "
+              f"({(~found).sum()} appearances), e.g. {unscored[:5]}; they are not scored")
+        game_index, player_index = game_index[found], player_index[found]
+        team_ids = [team for team, keep in zip(team_ids, found) if keep]
+        birth_dates = [d for d, keep in zip(birth_dates, found) if keep]
+
+    natal_lon = natal.lookup(birth_dates)[:, :, LON] if len(player_index) else np.empty((0, len(BODY_NAMES)))
+    tensor = score_tensor(transits[game_index, :, LON], natal_lon)
+
+    appearance_keys = [f"{players[p]['id']}:{games[g]['id']}" for g, p in zip(game_index, player_index)]
+    team_keys = [f"{team}:{games[g]['id']}" for g, team in zip(game_index, team_ids)]
+    return {
+        "players": list(zip(*aggregate(tensor, appearance_keys))),
+        "teams": list(zip(*aggregate(tensor, team_keys))),
+        "tensor": tensor,
+        "unscored": unscored,
+    }
+
+
+def to_records(result):
+    """Per-player and per-team scores in JSON-friendly form."""
+    def rows(entries, id_field):
+        records = []
+        for key, score, counts in entries:
+            entity_id, game_id = str(key).split(':')
+            records.append({
+                id_field: entity_id,
+                "game_id": game_id,
+                "score": round(float(score), 4),
+                "aspects": {name: int(n) for name, n in zip(ASPECT_NAMES, counts)},
+            })
+        return records
+
+    return {"players": rows(result["players"], "player_id"), "teams": rows(result["teams"], "team_id"),
+            "unscored_player_ids": [str(player_id) for player_id in result.get("unscored", [])]}
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Score transit-to-natal aspects for a day of games')
+    parser.add_argument('--date', type=datetime.date.fromisoformat, default=datetime.date.today(),
+                        help='Slate date in UTC (YYYY-MM-DD, default: today)')
+    parser.add_argument('--natal', help='Natal table .npz from natal_charts.py (default: read from Supabase)')
+    parser.add_argument('--output', required=True, help='JSON file to write')
+    return parser.parse_args()
+
+
+def main():
+    """Main execution function."""
+    args = parse_args()
+    try:
+        games = fetch_slate(args.date)
+        team_ids = {game["home_team_id"] for game in games} | {game["away_team_id"] for game in games}
+        players = fetch_rosters(team_ids) if team_ids else []
+        natal = (NatalTable.load(args.natal) if args.natal
+                 else fetch_natal_table(parse_birth_date(p["birth_date"]) for p in players))
+
+        started = time.perf_counter()
+        result = score_slate(games, players, natal)
+        print(f"Scored {len(result['players'])} player appearances in {len(games)} games "
+              f"in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+        with open(args.output, 'w') as f:
+            json.dump(to_records(result), f, indent=2)
+        print(f"Wrote slate scores to {args.output}")
+
+    except Exception as e:
+        print(f"Error: {e}")
+    finally:
+        swe.close()
+
+if __name__ == "__main__":
+    main()
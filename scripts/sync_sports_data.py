@@ -5,16 +5,25 @@ Synchronize sports data from SportsData.io to Supabase
 import os
 import sys
 import json
+import argparse
 import logging
 import asyncio
+import time
 import aiohttp
 from datetime import datetime, timezone
-from typing import Dict, List, Optional, Any, Union
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Any, Union
 from enum import Enum
 from uuid import UUID
 import httpx
 from dotenv import load_dotenv
 from supabase import create_client, Client as SupabaseClient
+from rate_limit import RateLimiter, fetch_as_completed
+from batch_writer import AdaptiveBatchSizer, BatchWriter, request_seconds
+from row_ledger import RowLedger, key_columns_of
+from http_cache import HIT, REVALIDATED, CachingTransport, ResponseCache, cache_status
+from json_stream import abatched, iter_json_array
+from run_journal import RunJournal, StageCheckpoint
 
 class UUIDEncoder(json.JSONEncoder):
     """Custom JSON encoder that handles UUID objects."""
@@ -75,11 +84,55 @@ if not any(LEAGUE_KEYS.values()) and not DEFAULT_KEY:
 # Constants
 SPORTSDATA_API_KEY = os.getenv('SPORTSDATA_API_KEY')
 
+# Maximum GameOddsByDate requests in flight at once
+ODDS_FETCH_CONCURRENCY = 5
+
+# External game IDs per `in.(...)` lookup when resolving internal game IDs
+GAME_ID_LOOKUP_BATCH_SIZE = 500
+
+# Rows transformed and handed to the writer at a time when streaming large payloads
+STREAM_BATCH_ROWS = 500
+
+# Batches buffered between two pipelined sync_league stages
+STAGE_QUEUE_SIZE = 4
+
+# Request limits, shared by every league using the same API key and host.
+# Override with --sportsdata-rate / --sportsdata-concurrency / --supabase-rate / --supabase-concurrency
+SPORTSDATA_RATE = float(os.getenv("SPORTSDATA_RATE", "5"))  # requests/second per API key
+SPORTSDATA_CONCURRENCY = int(os.getenv("SPORTSDATA_CONCURRENCY", "4"))
+SUPABASE_RATE = float(os.getenv("SUPABASE_RATE", "20"))
+SUPABASE_CONCURRENCY = int(os.getenv("SUPABASE_CONCURRENCY", "8"))
+
 # Validate environment variables
 if not all([SPORTSDATA_API_KEY, SUPABASE_URL, SUPABASE_KEY]):
     logger.error("❌ Missing required environment variables. Check SPORTSDATA_API_KEY, SUPABASE_URL, and SUPABASE_SERVICE_KEY")
     sys.exit(1)
 
+async def run_stages(*stages: Awaitable[Any]) -> List[Any]:
+    """Run pipeline stages concurrently and return their results.
+
+    If one stage fails the others are cancelled, so no stage is left blocked
+    on a queue whose other end has gone away, and the error is raised.
+    """
+    tasks = [asyncio.ensure_future(stage) for stage in stages]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if task.exception():
+                raise task.exception()
+        return [task.result() for task in tasks]
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+class SupabaseRequestError(Exception):
+    """A PostgREST request failed; carries the HTTP status and response body."""
+    def __init__(self, status: int, body: str):
+        super().__init__(f"{status}: {body}")
+        self.status = status
+        self.body = body
+
 class League(Enum):
     NHL = "nhl"
     NBA = "nba"
@@ -90,9 +143,17 @@ class League(Enum):
 class SportsDataClient:
     """Client for interacting with the SportsData.io API."""
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, limiter: Optional[RateLimiter] = None,
+                 cache: Optional[ResponseCache] = None):
+        self.api_key = api_key
+        self.limiter = limiter or RateLimiter(SPORTSDATA_RATE, concurrency=SPORTSDATA_CONCURRENCY)
+        # Disk cache of responses; GETs are revalidated with If-None-Match / If-Modified-Since
+        self.cache = cache or ResponseCache()
+        # url -> X-Cache-Status of the last response (HIT, REVALIDATED or MISS)
+        self.cache_statuses: Dict[str, str] = {}
         self.session = httpx.AsyncClient(
             timeout=30.0,
+            transport=CachingTransport(cache=self.cache),
             headers={
                 'Ocp-Apim-Subscription-Key': api_key,
                 'User-Agent': 'AstroBetAdvisor/1.0',
@@ -117,18 +178,23 @@ class SportsDataClient:
             url = f"{SPORTSDATA_BASE_URL}/{league.value}/scores/json/Players"
         return await self._make_request(url)
     
+    @staticmethod
+    def player_season_stats_url(league: League, season: int) -> str:
+        return f"{SPORTSDATA_BASE_URL}/{league.value}/stats/json/PlayerSeasonStats/{season}"
+    
     async def get_player_season_stats(self, league: League, season: int) -> List[Dict[str, Any]]:
         """Get season stats for all players in a league."""
-        url = f"{SPORTSDATA_BASE_URL}/{league.value}/stats/json/PlayerSeasonStats/{season}"
-        return await self._make_request(url)
+        return await self._make_request(self.player_season_stats_url(league, season))
+    
+    @staticmethod
+    def games_url(league: League, season: int, date: str = None) -> str:
+        if date:
+            return f"{SPORTSDATA_BASE_URL}/{league.value}/scores/GamesByDate/{date}"
+        return f"{SPORTSDATA_BASE_URL}/{league.value}/scores/Games/{season}"
     
     async def get_games(self, league: League, season: int, date: str = None) -> List[Dict[str, Any]]:
         """Get games for a league and season, optionally filtered by date."""
-        if date:
-            url = f"{SPORTSDATA_BASE_URL}/{league.value}/scores/GamesByDate/{date}"
-        else:
-            url = f"{SPORTSDATA_BASE_URL}/{league.value}/scores/Games/{season}"
-        return await self._make_request(url)
+        return await self._make_request(self.games_url(league, season, date))
     
     async def get_standings(self, league: League, season: int) -> List[Dict[str, Any]]:
         """Get standings for a league and season."""
@@ -144,8 +210,10 @@ class SportsDataClient:
         """Make an HTTP request and handle errors."""
         try:
             logger.debug(f"Fetching {url}")
-            response = await self.session.get(url)
+            async with self.limiter.limit(self.api_key, url):
+                response = await self.session.get(url)
             response.raise_for_status()
+            self.cache_statuses[url] = cache_status(response)
             return response.json()
         except httpx.HTTPStatusError as e:
             logger.error(f"HTTP error for {url}: {e.response.status_code} - {e.response.text}")
@@ -156,6 +224,48 @@ class SportsDataClient:
             logger.error(f"Request failed for {url}: {e}")
             return None
     
+    @asynccontextmanager
+    async def stream(self, url: str) -> AsyncIterator[AsyncIterator[Any]]:
+        """GET a JSON array and yield an async iterator over its elements as they are parsed.
+
+        Unlike _make_request, HTTP errors are raised rather than returned as None.
+
+            async with client.stream(url) as items:
+                async for item in items:
+                    ...
+
+        The rate limiter's token and concurrency slot are held only while the
+        response is opened. The caching transport has the body on disk by then,
+        so the slot is free for other requests (odds, say) while the items are
+        transformed and written, however long that takes.
+        """
+        logger.debug(f"Streaming {url}")
+        request = self.session.build_request("GET", url)
+        async with self.limiter.limit(self.api_key, url):
+            response = await self.session.send(request, stream=True)
+        try:
+            if response.is_error:
+                await response.aread()
+                logger.error(f"HTTP error for {url}: {response.status_code} - {response.text}")
+                response.raise_for_status()
+            self.cache_statuses[url] = cache_status(response)
+            yield iter_json_array(response.aiter_bytes())
+        finally:
+            await response.aclose()
+    
+    def unchanged(self, url: str) -> bool:
+        """True when the last response for `url` came from the cache and was already processed.
+
+        Callers use this to skip transforming and writing a body they
+        handled on a previous run; see mark_processed.
+        """
+        return (self.cache_statuses.get(url) in (HIT, REVALIDATED)
+                and self.cache.unchanged_since_processed(url))
+    
+    def mark_processed(self, url: str) -> None:
+        """Record that the cached body for `url` has been fully written downstream."""
+        self.cache.mark_processed(url)
+    
     async def close(self):
         """Close the HTTP session."""
         await self.session.aclose()
@@ -163,8 +273,13 @@ class SportsDataClient:
 class SupabaseManager:
     """Manager for Supabase operations using raw HTTP requests."""
     
-    def __init__(self, url: str, key: str):
+    def __init__(self, url: str, key: str, limiter: Optional[RateLimiter] = None,
+                 ledger: Optional[RowLedger] = None):
         self.base_url = url.rstrip('/')
+        self.key = key
+        self.limiter = limiter or RateLimiter(SUPABASE_RATE, concurrency=SUPABASE_CONCURRENCY)
+        # Content-hash ledger used to skip unchanged rows (None writes everything)
+        self.ledger = ledger
         self.headers = {
             'apikey': key,
             'Authorization': f'Bearer {key}',
@@ -172,6 +287,12 @@ class SupabaseManager:
             'Prefer': 'return=representation'
         }
         self.session = aiohttp.ClientSession(headers=self.headers)
+        # league_id -> {external game id: internal game id}, shared across leagues and stages
+        self.game_id_cache: Dict[str, Dict[str, str]] = {}
+        # table -> byte-budget batch sizer, tuned from every write to that table
+        self.batch_sizers: Dict[str, AdaptiveBatchSizer] = {}
+        # Rows sent to the dead-letter file so far
+        self.dead_letters = 0
     
     async def close(self):
         """Close the HTTP session."""
@@ -197,17 +318,23 @@ class SupabaseManager:
             headers = {k: v for k, v in kwargs.get('headers', {}).items() if k.lower() != 'authorization'}
             logger.debug(f"Request headers: {headers}")
                 
-            async with self.session.request(method, url, **kwargs) as response:
+            async with self.limiter.limit(self.key, url):
+                # Timed from here, so waiting for the limiter is not read as a slow write
+                started = time.perf_counter()
                 try:
-                    response.raise_for_status()
-                    if response.status == 204:  # No content
-                        return {}
-                    return await response.json()
-                except aiohttp.ClientResponseError as e:
-                    # Log response details for errors
-                    error_text = await response.text()
-                    logger.error(f"Error response ({e.status}): {error_text}")
-                    raise
+                    async with self.session.request(method, url, **kwargs) as response:
+                        try:
+                            response.raise_for_status()
+                            if response.status == 204:  # No content
+                                return {}
+                            return await response.json()
+                        except aiohttp.ClientResponseError as e:
+                            # Log response details for errors
+                            error_text = await response.text()
+                            logger.error(f"Error response ({e.status}): {error_text}")
+                            raise SupabaseRequestError(e.status, error_text) from e
+                finally:
+                    request_seconds.set(time.perf_counter() - started)
                 
         except aiohttp.ClientError as e:
             logger.error(f"Error making {method} request to {url}: {str(e)}")
@@ -219,6 +346,104 @@ class SupabaseManager:
                     pass
             raise
     
+    async def upsert_rows(self, table: str, rows: List[Dict[str, Any]], on_conflict: str) -> List[Dict[str, Any]]:
+        """Upsert rows in batches, returning the upserted rows.
+
+        With a ledger, rows unchanged since the last sync are not sent; they
+        are returned with their stored id alongside the upserted rows.
+        Batches are sized by serialized bytes, with a budget per table that
+        adapts to observed latency and 413/timeout responses. Batches the
+        database rejects are bisected to isolate the bad rows, which go to
+        the dead-letter file (see batch_writer.py) instead of failing the
+        batch; transient errors are retried with backoff, then raised.
+        """
+        unchanged: List[Dict[str, Any]] = []
+        if self.ledger:
+            if self.ledger.verification_due(table):
+                await self.verify_ledger(table, on_conflict)
+            rows, unchanged = self.ledger.partition(table, rows, on_conflict)
+            if unchanged:
+                logger.info(f"  Skipping {len(unchanged)} unchanged {table} rows")
+
+        async def send(batch):
+            return await self._make_request('POST', table, params={'on_conflict': on_conflict}, json=batch)
+
+        sizer = self.batch_sizers.setdefault(table, AdaptiveBatchSizer())
+        writer = BatchWriter(send, table, sizer=sizer)
+        results = await writer.write(rows)
+        self.dead_letters += writer.dead_letters
+        logger.debug(f"Upserted {writer.written}/{len(rows)} {table} rows in {writer.requests} requests "
+                     f"(batch budget now {sizer.budget} bytes)")
+        if self.ledger:
+            self.ledger.record(table, rows, results, on_conflict)
+        return results + unchanged
+
+    async def upsert_stream(self, table: str, items: AsyncIterator[Dict[str, Any]],
+                            transform: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]],
+                            on_conflict: str,
+                            on_written: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None,
+                            batch_rows: int = STREAM_BATCH_ROWS,
+                            checkpoint: Optional[StageCheckpoint] = None,
+                            on_skipped: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None) -> int:
+        """Transform a stream of provider items and upsert them batch_rows at a time.
+
+        Items for which `transform` returns None are dropped. Each batch's
+        upserted rows go to `on_written` and are then discarded, so memory
+        stays flat however long the stream is; as on_written is awaited, a
+        slow consumer holds back the next batch. With a checkpoint, items
+        an interrupted run already wrote are passed to `on_skipped` instead
+        of being written, and every written batch is journaled. Returns the
+        rows upserted.
+        """
+        written = 0
+
+        async def write(batch: List[Dict[str, Any]]) -> None:
+            nonlocal written
+            rows = [row for row in map(transform, batch) if row]
+            if rows:
+                results = await self.upsert_rows(table, rows, on_conflict)
+                written += len(results)
+                if on_written:
+                    await on_written(results)
+            if checkpoint and batch:
+                checkpoint.commit()
+
+        async for batch in abatched(items, batch_rows):
+            if checkpoint:
+                skipped, batch = checkpoint.split(batch)
+                if skipped and on_skipped:
+                    await on_skipped(skipped)
+            await write(batch)
+        if checkpoint:
+            await write(checkpoint.flush())
+            if checkpoint.skipped:
+                logger.info(f"  Skipped {checkpoint.skipped} {table} items written by the interrupted run")
+        return written
+
+    async def verify_ledger(self, table: str, on_conflict: str, page_size: int = 1000) -> None:
+        """Read the table's natural keys back and drop ledger entries for rows that are gone."""
+        columns = key_columns_of(on_conflict)
+        stored = []
+        offset = 0
+        while True:
+            page = await self._make_request('GET', table, params={
+                'select': ','.join(columns),
+                'order': ','.join(columns),
+                'limit': str(page_size),
+                'offset': str(offset)
+            })
+            page = page if isinstance(page, list) else []
+            stored.extend(page)
+            if len(page) < page_size:
+                break
+            offset += page_size
+        forgotten = self.ledger.verify(table, stored, on_conflict)
+        logger.info(f"  Verified ledger for {table}: {len(stored)} rows in database, {forgotten} entries forgotten")
+
+    def batch_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Adaptive batch sizing metrics per table."""
+        return {table: sizer.metrics() for table, sizer in self.batch_sizers.items()}
+    
     async def get_league_id(self, league_key: str) -> UUID:
         """Get the database ID for a league by its key, creating it if it doesn't exist."""
         try:
@@ -336,45 +561,7 @@ class SupabaseManager:
         
         try:
             # Perform the upsert in smaller batches to avoid request size limits
-            batch_size = 20
-            all_results = []
-            
-            for i in range(0, len(upsert_data), batch_size):
-                batch = upsert_data[i:i + batch_size]
-                logger.debug(f"Processing batch {i//batch_size + 1}/{(len(upsert_data)-1)//batch_size + 1} with {len(batch)} teams")
-                
-                # First try to insert with conflict on (external_id, league_id)
-                try:
-                    result = await self._make_request(
-                        'POST',
-                        'teams',
-                        params={'on_conflict': 'external_id,league_id'},
-                        json=batch
-                    )
-                    
-                    if isinstance(result, list):
-                        all_results.extend(result)
-                    else:
-                        all_results.append(result)
-                        
-                except Exception as e:
-                    logger.error(f"Error upserting batch: {str(e)}")
-                    # If batch upsert fails, try one by one
-                    logger.info("Falling back to individual team upserts...")
-                    for team in batch:
-                        try:
-                            result = await self._make_request(
-                                'POST',
-                                'teams',
-                                params={'on_conflict': 'external_id,league_id'},
-                                json=team
-                            )
-                            if isinstance(result, list):
-                                all_results.extend(result)
-                            else:
-                                all_results.append(result)
-                        except Exception as single_error:
-                            logger.error(f"Failed to upsert team {team.get('external_id')}: {str(single_error)}")
+            all_results = await self.upsert_rows('teams', upsert_data, 'external_id,league_id')
             
             # Create a mapping of external_id to internal_id
             logger.info(f"Successfully processed {len(all_results)} teams")
@@ -508,53 +695,8 @@ class SupabaseManager:
         
         try:
             # Perform the upsert in smaller batches to avoid request size limits
-            batch_size = 50
-            all_results = []
-            total_upserted = 0
-            
-            for i in range(0, len(upsert_data), batch_size):
-                batch = upsert_data[i:i + batch_size]
-                logger.debug(f"Processing batch {i//batch_size + 1}/{(len(upsert_data)-1)//batch_size + 1} with {len(batch)} players")
-                
-                try:
-                    result = await self._make_request(
-                        'POST',
-                        'players',
-                        params={'on_conflict': 'external_id'},
-                        json=batch
-                    )
-                    
-                    if isinstance(result, list):
-                        all_results.extend(result)
-                        total_upserted += len(result)
-                    else:
-                        all_results.append(result)
-                        total_upserted += 1
-                        
-                    logger.debug(f"Successfully processed batch {i//batch_size + 1}")
-                    
-                except Exception as batch_error:
-                    logger.error(f"Error upserting batch of players: {str(batch_error)}")
-                    logger.info("Falling back to individual player upserts...")
-                    
-                    # Try to upsert players one by one
-                    for player in batch:
-                        try:
-                            single_result = await self._make_request(
-                                'POST',
-                                'players',
-                                params={'on_conflict': 'external_id'},
-                                json=player
-                            )
-                            if single_result:
-                                if isinstance(single_result, list):
-                                    all_results.extend(single_result)
-                                    total_upserted += len(single_result)
-                                else:
-                                    all_results.append(single_result)
-                                    total_upserted += 1
-                        except Exception as single_error:
-                            logger.error(f"Failed to upsert player {player.get('external_id')}: {str(single_error)}")
+            all_results = await self.upsert_rows('players', upsert_data, 'external_id')
+            total_upserted = len(all_results)
             
             logger.info(f"Successfully processed {total_upserted} players")
             
@@ -576,6 +718,49 @@ class SupabaseManager:
                 logger.debug(f"First player in upsert data: {json.dumps(upsert_data[0], indent=2, cls=UUIDEncoder)}")
             return {}
     
+    @staticmethod
+    def _game_row(game: Dict[str, Any], league_id: str, team_id_map: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """Build a games row from a SportsData.io game, or None if its teams are unknown."""
+        home_team_id = team_id_map.get(str(game.get('HomeTeamID')))
+        away_team_id = team_id_map.get(str(game.get('AwayTeamID')))
+        
+        if not home_team_id or not away_team_id:
+            logger.warning(f"Skipping game {game.get('GameID')} - team not found")
+            return None
+            
+        game_time = game.get('DateTimeUTC')
+        if game_time:
+            try:
+                game_time = datetime.fromisoformat(game_time.replace('Z', '+00:00'))
+            except (ValueError, AttributeError):
+                game_time = None
+        
+        game_data = {
+            'external_id': game.get('GameID'),
+            'league_id': league_id,
+            'season': game.get('Season'),
+            'season_type': game.get('SeasonType', 'regular').lower(),
+            'game_date': game.get('Day'),
+            'game_time_utc': game_time.isoformat() if game_time else None,
+            'game_time_local': game_time.isoformat() if game_time else None,  # Adjust with timezone if needed
+            'status': game.get('Status', 'scheduled').lower(),
+            'period': game.get('Period'),
+            'period_time_remaining': game.get('TimeRemainingMinutes'),
+            'home_team_id': home_team_id,
+            'away_team_id': away_team_id,
+            'venue_id': home_team_id,  # Assuming home team's venue
+            'home_score': game.get('HomeTeamScore'),
+            'away_score': game.get('AwayTeamScore'),
+            'home_odds': game.get('HomeTeamMoneyLine'),
+            'away_odds': game.get('AwayTeamMoneyLine'),
+            'over_under': game.get('OverUnder'),
+            'spread': game.get('PointSpread'),
+            'attendance': game.get('Attendance'),
+            'broadcasters': game.get('Broadcasters', []),
+            'notes': game.get('Notes')
+        }
+        return game_data
+    
     async def upsert_games(self, games_data: List[Dict[str, Any]], 
                           league_id: str,
                           team_id_map: Dict[str, str]) -> Dict[str, str]:
@@ -584,62 +769,71 @@ class SupabaseManager:
             return {}
             
         # Prepare the data for upsert
-        upsert_data = []
-        for game in games_data:
-            home_team_id = team_id_map.get(str(game.get('HomeTeamID')))
-            away_team_id = team_id_map.get(str(game.get('AwayTeamID')))
-            
-            if not home_team_id or not away_team_id:
-                logger.warning(f"Skipping game {game.get('GameID')} - team not found")
-                continue
-                
-            game_time = game.get('DateTimeUTC')
-            if game_time:
-                try:
-                    game_time = datetime.fromisoformat(game_time.replace('Z', '+00:00'))
-                except (ValueError, AttributeError):
-                    game_time = None
-            
-            game_data = {
-                'external_id': game.get('GameID'),
-                'league_id': league_id,
-                'season': game.get('Season'),
-                'season_type': game.get('SeasonType', 'regular').lower(),
-                'game_date': game.get('Day'),
-                'game_time_utc': game_time.isoformat() if game_time else None,
-                'game_time_local': game_time.isoformat() if game_time else None,  # Adjust with timezone if needed
-                'status': game.get('Status', 'scheduled').lower(),
-                'period': game.get('Period'),
-                'period_time_remaining': game.get('TimeRemainingMinutes'),
-                'home_team_id': home_team_id,
-                'away_team_id': away_team_id,
-                'venue_id': home_team_id,  # Assuming home team's venue
-                'home_score': game.get('HomeTeamScore'),
-                'away_score': game.get('AwayTeamScore'),
-                'home_odds': game.get('HomeTeamMoneyLine'),
-                'away_odds': game.get('AwayTeamMoneyLine'),
-                'over_under': game.get('OverUnder'),
-                'spread': game.get('PointSpread'),
-                'attendance': game.get('Attendance'),
-                'broadcasters': game.get('Broadcasters', []),
-                'notes': game.get('Notes')
-            }
-            upsert_data.append(game_data)
+        upsert_data = [row for row in (self._game_row(game, league_id, team_id_map) for game in games_data) if row]
         
         # Perform the upsert
         if upsert_data:  # Only make the request if we have data
-            result = await self._make_request(
-                'POST',
-                'games',
-                params={'on_conflict': 'external_id,league_id'},
-                json=upsert_data
-            )
+            result_list = await self.upsert_rows('games', upsert_data, 'external_id,league_id')
             
             # Create a mapping of external_id to internal_id
-            result_list = result if isinstance(result, list) else [result]
-            return {str(game['external_id']): str(game['id']) for game in result_list}
+            game_id_map = {str(game['external_id']): str(game['id']) for game in result_list}
+            self.game_id_cache.setdefault(str(league_id), {}).update(game_id_map)
+            return game_id_map
         
         return {}
+
+    async def upsert_games_stream(self, games: AsyncIterator[Dict[str, Any]],
+                                  league_id: str,
+                                  team_id_map: Dict[str, str],
+                                  on_written: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None,
+                                  checkpoint: Optional[StageCheckpoint] = None,
+                                  on_skipped: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None) -> int:
+        """Streaming upsert_games: returns the number of games upserted.
+
+        Internal IDs go to game_id_cache rather than a returned map, so
+        memory does not grow with the season's length. Each batch of
+        upserted rows is also passed to `on_written`.
+        """
+        cache = self.game_id_cache.setdefault(str(league_id), {})
+
+        async def remember(results: List[Dict[str, Any]]) -> None:
+            cache.update((str(game['external_id']), str(game['id'])) for game in results)
+            if on_written:
+                await on_written(results)
+
+        return await self.upsert_stream('games', games, lambda game: self._game_row(game, league_id, team_id_map),
+                                        'external_id,league_id', remember,
+                                        checkpoint=checkpoint, on_skipped=on_skipped)
+
+    async def resolve_game_ids(self, league_id: str, external_ids: List[Any]) -> Dict[str, str]:
+        """Map external game IDs to internal IDs for a league.
+
+        IDs already known from upsert_games or earlier lookups come from the
+        in-process cache; the rest are fetched with paged `in.(...)` queries,
+        GAME_ID_LOOKUP_BATCH_SIZE IDs per request.
+        """
+        cache = self.game_id_cache.setdefault(str(league_id), {})
+        wanted = {str(external_id) for external_id in external_ids if external_id}
+        missing = sorted(wanted - cache.keys())
+
+        for i in range(0, len(missing), GAME_ID_LOOKUP_BATCH_SIZE):
+            batch = missing[i:i + GAME_ID_LOOKUP_BATCH_SIZE]
+            result = await self._make_request(
+                'GET',
+                'games',
+                params={
+                    'select': 'id,external_id',
+                    'league_id': f'eq.{league_id}',
+                    'external_id': f'in.({",".join(batch)})'
+                }
+            )
+            for game in result if isinstance(result, list) else []:
+                cache[str(game['external_id'])] = str(game['id'])
+
+        if missing:
+            logger.info(f"Resolved {len(missing)} game IDs in {-(-len(missing) // GAME_ID_LOOKUP_BATCH_SIZE)} requests "
+                        f"({len(wanted) - len(missing)} cached)")
+        return {external_id: cache[external_id] for external_id in wanted if external_id in cache}
     
     async def upsert_player_seasons(self, stats_data: List[Dict[str, Any]], 
                                    player_id_map: Dict[str, str],
@@ -652,73 +846,109 @@ class SupabaseManager:
         # Prepare the data for upsert
         upsert_data = []
         for stats in stats_data:
-            player_id = player_id_map.get(str(stats.get('PlayerID')))
-            team_id = team_id_map.get(str(stats.get('TeamID')))
+            season_data = self._player_season_row(stats, player_id_map, team_id_map, league_id)
+            if season_data:
+                upsert_data.append(season_data)
+        
+        # Upsert in batches to avoid large payloads
+        await self.upsert_rows('player_seasons', upsert_data, 'player_id,team_id,season,league_id')
+
+    async def upsert_player_seasons_stream(self, stats_data: AsyncIterator[Dict[str, Any]],
+                                           player_id_map: Dict[str, str],
+                                           team_id_map: Dict[str, str],
+                                           league_id: str,
+                                           checkpoint: Optional[StageCheckpoint] = None) -> int:
+        """Streaming upsert_player_seasons: returns the number of player seasons upserted."""
+        return await self.upsert_stream(
+            'player_seasons', stats_data,
+            lambda stats: self._player_season_row(stats, player_id_map, team_id_map, league_id),
+            'player_id,team_id,season,league_id', checkpoint=checkpoint)
+
+    @staticmethod
+    def _player_season_row(stats: Dict[str, Any], player_id_map: Dict[str, str],
+                           team_id_map: Dict[str, str], league_id: str) -> Optional[Dict[str, Any]]:
+        """Build a player_seasons row from SportsData.io season stats, or None if the player or team is unknown."""
+        player_id = player_id_map.get(str(stats.get('PlayerID')))
+        team_id = team_id_map.get(str(stats.get('TeamID')))
+        
+        if not player_id or not team_id:
+            return None
             
-            if not player_id or not team_id:
+        # Extract common stats
+        season_data = {
+            'player_id': player_id,
+            'team_id': team_id,
+            'league_id': league_id,
+            'season': stats.get('Season'),
+            'games_played': stats.get('Games', 0),
+            'games_started': stats.get('GamesStarted', 0),
+            'minutes_played': stats.get('Minutes', 0),
+            'stats': {},
+            'advanced_stats': {}
+        }
+        
+        # Add sport-specific stats
+        for key, value in stats.items():
+            if key in ['PlayerID', 'TeamID', 'Season', 'Games', 'GamesStarted', 'Minutes']:
                 continue
                 
-            # Extract common stats
-            season_data = {
-                'player_id': player_id,
-                'team_id': team_id,
-                'league_id': league_id,
-                'season': stats.get('Season'),
-                'games_played': stats.get('Games', 0),
-                'games_started': stats.get('GamesStarted', 0),
-                'minutes_played': stats.get('Minutes', 0),
-                'stats': {},
-                'advanced_stats': {}
-            }
-            
-            # Add sport-specific stats
-            for key, value in stats.items():
-                if key in ['PlayerID', 'TeamID', 'Season', 'Games', 'GamesStarted', 'Minutes']:
-                    continue
-                    
-                # Add to appropriate stats dictionary
-                if key in ['OPS', 'WAR', 'BABIP', 'wOBA', 'wRC+']:
-                    season_data['advanced_stats'][key] = value
-                else:
-                    season_data['stats'][key] = value
-            
-            upsert_data.append(season_data)
+            # Add to appropriate stats dictionary
+            if key in ['OPS', 'WAR', 'BABIP', 'wOBA', 'wRC+']:
+                season_data['advanced_stats'][key] = value
+            else:
+                season_data['stats'][key] = value
         
-        # Upsert in batches to avoid large payloads
-        batch_size = 50
-        for i in range(0, len(upsert_data), batch_size):
-            batch = upsert_data[i:i + batch_size]
-            await self._make_request(
-                'POST',
-                'player_seasons',
-                params={'on_conflict': 'player_id,team_id,season,league_id'},
-                json=batch
-            )
+        return season_data
 
 class SportsDataSync:
     """Main class for syncing sports data."""
     
-    def __init__(self):
+    def __init__(self, sportsdata_limiter: Optional[RateLimiter] = None,
+                 supabase_limiter: Optional[RateLimiter] = None,
+                 ledger: Optional[RowLedger] = None,
+                 journal: Optional[RunJournal] = None):
         self.clients = {}
-        self.supabase = SupabaseManager(SUPABASE_URL, SUPABASE_KEY)
+        self.supabase = SupabaseManager(SUPABASE_URL, SUPABASE_KEY, supabase_limiter, ledger)
         self.current_year = datetime.now().year
+        # With --full, stages run even when the provider's response is unchanged
+        self.full = ledger.full if ledger else False
+        # Progress of each league's stats, games and odds stages, for --resume
+        self.journal = journal
+        # One response cache for all clients
+        cache = ResponseCache()
+        
+        # One limiter for all clients, so leagues sharing a key share its quota
+        sportsdata_limiter = sportsdata_limiter or RateLimiter(SPORTSDATA_RATE, concurrency=SPORTSDATA_CONCURRENCY)
         
         # Initialize API clients for each league with valid keys
         for league_name, key in LEAGUE_KEYS.items():
             if key and key != 'your_'+league_name+'_api_key_here':  # Skip placeholder keys
-                self.clients[league_name] = SportsDataClient(key)
+                self.clients[league_name] = SportsDataClient(key, sportsdata_limiter, cache)
         
         # If no league-specific keys, use default key if available
         if not self.clients and DEFAULT_KEY and DEFAULT_KEY != 'your_default_sportsdata_api_key_here':
             logger.warning("⚠️  Using default API key for all leagues")
             for league in League:
-                self.clients[league.value] = SportsDataClient(DEFAULT_KEY)
+                self.clients[league.value] = SportsDataClient(DEFAULT_KEY, sportsdata_limiter, cache)
         
         if not self.clients:
             raise ValueError("No valid API keys found for any league")
     
     async def sync_league(self, league: League) -> None:
-        """Sync data for a specific league."""
+        """Sync data for a specific league.
+
+        The stages form a small DAG and only wait on real dependencies:
+        players and games need the team map, stats need the player map, and
+        odds need committed games. Once teams are in, the players/stats
+        chain and the games stream run concurrently, and each committed
+        batch of games is handed to the odds stage through a bounded queue,
+        so odds fetching starts with the first batch.
+
+        With a run journal, the streamed stages are checkpointed per batch
+        so that an interrupted run can be resumed (see run_journal.py).
+        Teams and players are cheap and always rerun, as later stages need
+        their ID maps.
+        """
         league_name = league.value.upper()
         logger.info(f"\n🔄 Starting sync for {league_name}")
         
@@ -728,236 +958,299 @@ class SportsDataSync:
             logger.warning(f"⚠️  No API key found for {league_name}. Skipping...")
             return
         
+        run = RunJournal.run_key(league.value, self.current_year)
+        if self.journal:
+            self.journal.begin(run)
+        
         try:
-            # Get or create the league in the database
-            league_id = await self.supabase.get_league_id(league_name)
-            
-            # Sync teams
-            logger.info(f"  📋 Syncing {league_name} teams...")
-            teams = await client.get_teams(league)
-            team_id_map = await self.supabase.upsert_teams(league_id, teams)
-            logger.info(f"  ✅ Synced {len(team_id_map)} teams")
-            
-            # Sync players
-            logger.info(f"  👥 Syncing {league_name} players...")
-            
-            # First, try to get all players at once (more efficient if the API supports it)
+            # The full player list needs nothing from the database, so fetch it while teams sync
+            players_fetch = asyncio.create_task(client.get_players(league))
             try:
-                players = await client.get_players(league)
-                logger.info(f"  Fetched {len(players)} players in one request")
-            except Exception as e:
-                logger.warning(f"  Could not fetch all players at once, falling back to per-team fetch: {str(e)}")
-                players = []
-                for team_ext_id in team_id_map.keys():
-                    try:
-                        team_players = await client.get_players(league, team_ext_id)
-                        if team_players:
-                            players.extend(team_players)
-                            logger.debug(f"  Fetched {len(team_players)} players for team {team_ext_id}")
-                    except Exception as team_error:
-                        logger.error(f"  Error fetching players for team {team_ext_id}: {str(team_error)}")
-            
-            if not players:
-                logger.warning("  No players found to sync")
-                player_id_map = {}
-            else:
-                logger.info(f"  Upserting {len(players)} players...")
-                player_id_map = await self.supabase.upsert_players(players, team_id_map)
-                logger.info(f"  ✅ Synced {len(player_id_map)} players")
-            
-            # Sync player stats
-            logger.info(f"  📊 Syncing {league_name} player stats...")
-            current_year = datetime.now().year
-            stats = await client.get_player_season_stats(league, current_year)
-            await self.supabase.upsert_player_seasons(stats, player_id_map, team_id_map, league_id)
-            logger.info(f"  ✅ Synced stats for {len(stats)} player seasons")
-            
-            # Sync games
-            logger.info(f"  🏟️  Syncing {league_name} games...")
-            games = await client.get_games(league, current_year)
-            game_id_map = await self.supabase.upsert_games(games, league_id, team_id_map)
-            logger.info(f"  ✅ Synced {len(game_id_map)} games")
+                # Get or create the league in the database
+                league_id = await self.supabase.get_league_id(league_name)
+                
+                # Sync teams
+                logger.info(f"  📋 Syncing {league_name} teams...")
+                teams = await client.get_teams(league)
+                team_id_map = await self.supabase.upsert_teams(league_id, teams)
+                logger.info(f"  ✅ Synced {len(team_id_map)} teams")
+            except BaseException:
+                players_fetch.cancel()
+                raise
             
-            # Sync betting odds
-            logger.info(f"  🎰 Syncing {league_name} betting odds...")
-            await self.sync_betting_odds(league, games, client)
+            # Committed game batches, as (internal id, external id, date) tuples; None ends the stream
+            game_batches: asyncio.Queue = asyncio.Queue(maxsize=STAGE_QUEUE_SIZE)
+            await run_stages(
+                self._sync_players_and_stats(league, client, league_id, team_id_map, players_fetch, run),
+                self._sync_games(league, client, league_id, team_id_map, game_batches, run),
+                self.sync_betting_odds(league, league_id, game_batches, client, run),
+            )
             
+            if self.journal:
+                self.journal.clear(run)
             logger.info(f"✅ Successfully synced {league_name} data")
             
         except Exception as e:
             logger.error(f"❌ Error syncing {league_name}: {str(e)}")
             logger.exception(e)  # Log full traceback for debugging
 
-    async def sync_betting_odds(self, league: League, games_data: List[Dict[str, Any]], client) -> None:
+    async def _sync_players_and_stats(self, league: League, client: SportsDataClient, league_id: str,
+                                      team_id_map: Dict[str, str], players_fetch: "asyncio.Task",
+                                      run: str) -> None:
+        """Players stage followed by the player stats stage, which needs its player map."""
+        league_name = league.value.upper()
+        
+        # Sync players
+        logger.info(f"  👥 Syncing {league_name} players...")
+        
+        # First, try to get all players at once (more efficient if the API supports it)
+        try:
+            players = await players_fetch
+            logger.info(f"  Fetched {len(players)} players in one request")
+        except Exception as e:
+            logger.warning(f"  Could not fetch all players at once, falling back to per-team fetch: {str(e)}")
+            players = []
+
+            async def fetch_team(team_ext_id: str) -> Optional[List[Dict[str, Any]]]:
+                try:
+                    return await client.get_players(league, team_ext_id)
+                except Exception as team_error:
+                    logger.error(f"  Error fetching players for team {team_ext_id}: {str(team_error)}")
+                    return None
+
+            # All teams at once; the client's rate limiter bounds the requests in flight
+            async for team_ext_id, team_players in fetch_as_completed(team_id_map.keys(), fetch_team):
+                if team_players:
+                    players.extend(team_players)
+                    logger.debug(f"  Fetched {len(team_players)} players for team {team_ext_id}")
+        
+        if not players:
+            logger.warning("  No players found to sync")
+            player_id_map = {}
+        else:
+            logger.info(f"  Upserting {len(players)} players...")
+            player_id_map = await self.supabase.upsert_players(players, team_id_map)
+            logger.info(f"  ✅ Synced {len(player_id_map)} players")
+        
+        # Sync player stats
+        logger.info(f"  📊 Syncing {league_name} player stats...")
+        if self._stage_done(run, 'stats'):
+            logger.info("  ✅ Player stats already synced by the interrupted run, skipping")
+            return
+        current_year = datetime.now().year
+        # Season stats and games are large payloads: they are parsed, transformed
+        # and written STREAM_BATCH_ROWS at a time instead of being loaded whole
+        stats_url = client.player_season_stats_url(league, current_year)
+        async with client.stream(stats_url) as stats:
+            if not self.full and client.unchanged(stats_url):
+                logger.info("  ✅ Player stats unchanged since the last sync, skipping")
+            else:
+                dead_letters = self.supabase.dead_letters
+                synced = await self.supabase.upsert_player_seasons_stream(
+                    stats, player_id_map, team_id_map, league_id, self._checkpoint(run, 'stats'))
+                if self.supabase.dead_letters == dead_letters:
+                    client.mark_processed(stats_url)
+                logger.info(f"  ✅ Synced stats for {synced} player seasons")
+        self._complete(run, 'stats')
+
+    def _stage_done(self, run: str, stage: str) -> bool:
+        return bool(self.journal) and self.journal.stage_done(run, stage)
+
+    def _checkpoint(self, run: str, stage: str, key=None) -> Optional[StageCheckpoint]:
+        return self.journal.checkpoint(run, stage, key) if self.journal else None
+
+    def _complete(self, run: str, stage: str) -> None:
+        if self.journal:
+            self.journal.complete(run, stage)
+
+    async def _sync_games(self, league: League, client: SportsDataClient, league_id: str,
+                          team_id_map: Dict[str, str], game_batches: asyncio.Queue, run: str) -> None:
+        """Games stage: streams the season's games and queues each committed batch for the odds stage."""
+        league_name = league.value.upper()
+        logger.info(f"  🏟️  Syncing {league_name} games...")
+        games_done = self._stage_done(run, 'games')
+        if games_done and self._stage_done(run, 'odds'):
+            logger.info("  ✅ Games already synced by the interrupted run, skipping")
+            await game_batches.put(None)
+            return
+        current_year = datetime.now().year
+        games_url = client.games_url(league, current_year)
+
+        async def existing(batch: List[Dict[str, Any]]) -> None:
+            # Games not written now: the odds stage still needs them and their IDs
+            ids = await self.supabase.resolve_game_ids(league_id, [game.get('GameID') for game in batch])
+            await game_batches.put([(ids[str(game.get('GameID'))], str(game.get('GameID')), game.get('Day'))
+                                    for game in batch if str(game.get('GameID')) in ids])
+
+        async with client.stream(games_url) as items:
+            if games_done or (not self.full and client.unchanged(games_url)):
+                async for batch in abatched(items, STREAM_BATCH_ROWS):
+                    await existing(batch)
+                if games_done:
+                    logger.info("  ✅ Games already synced by the interrupted run, skipping")
+                else:
+                    logger.info("  ✅ Games unchanged since the last sync, skipping")
+            else:
+                async def committed(rows: List[Dict[str, Any]]) -> None:
+                    await game_batches.put([(str(row['id']), str(row['external_id']), row.get('game_date'))
+                                            for row in rows if row.get('id')])
+
+                dead_letters = self.supabase.dead_letters
+                synced = await self.supabase.upsert_games_stream(items, league_id, team_id_map, committed,
+                                                                 self._checkpoint(run, 'games'), existing)
+                if self.supabase.dead_letters == dead_letters:
+                    client.mark_processed(games_url)
+                logger.info(f"  ✅ Synced {synced} games")
+        self._complete(run, 'games')
+        # On failure run_stages cancels the odds stage, so the end marker is only needed here
+        await game_batches.put(None)
+
+    async def sync_betting_odds(self, league: League, league_id: str, game_batches: asyncio.Queue, client,
+                                run: Optional[str] = None) -> None:
         """Fetch and upsert betting odds for each game into game_odds table.
         
         Args:
             league: The league to sync odds for
-            games_data: List of game data dictionaries from get_games
+            league_id: Internal ID of the league
+            game_batches: Queue of committed game batches from _sync_games, ended by None
             client: The API client to use for fetching odds
+            run: Run journal key, to checkpoint the stage and skip it on --resume
         """
-        if not games_data:
-            logger.warning("No games data provided to sync_betting_odds")
-            return
-            
-        # Get the league ID for foreign key reference
-        league_id = await self.supabase.get_league_id(league.value.upper())
-        if not league_id:
-            logger.error(f"League {league.value} not found in database")
-            return
-            
-        # Create a mapping of external game ID to our internal game ID
-        game_id_map = {}
-        for game in games_data:
-            game_id = game.get('GameID')
-            if not game_id:
-                continue
-                
-            # Look up the game in our database to get the internal ID
-            result = await self.supabase._make_request(
-                'GET',
-                'games',
-                params={
-                    'select': 'id',
-                    'external_id': f'eq.{game_id}',
-                    'league_id': f'eq.{league_id}'
-                }
-            )
-            
-            if result and isinstance(result, list) and len(result) > 0:
-                game_id_map[str(game_id)] = result[0]['id']
-        
-        if not game_id_map:
-            logger.warning("No valid game IDs found in the database to sync odds for")
+        league_name = league.value.upper()
+        logger.info(f"  🎰 Syncing {league_name} betting odds...")
+        if run and self._stage_done(run, 'odds'):
+            logger.info("  ✅ Odds already synced by the interrupted run, skipping")
+            while await game_batches.get() is not None:
+                pass
             return
-            
-        # Fetch and upsert odds for each game
-        logger.info(f"Fetching odds for {len(game_id_map)} games...")
-        
-        # Process in batches to avoid rate limits
-        batch_size = 10
-        game_ids = list(game_id_map.keys())
-        total_games = len(game_ids)
-        
-        for i in range(0, total_games, batch_size):
-            batch = game_ids[i:i + batch_size]
-            logger.info(f"Processing games {i+1} to {min(i + batch_size, total_games)} of {total_games}")
-            
-            # Fetch odds for this batch
+        # Checkpointed by external game ID, which both ways of queueing games share
+        checkpoint = self._checkpoint(run, 'odds', key=lambda game: game[1]) if run else None
+        semaphore = asyncio.Semaphore(ODDS_FETCH_CONCURRENCY)
+        # GameOddsByDate returns every game on a date, so each date is fetched
+        # once and fanned out to its games, including games in later batches
+        odds_by_date: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+
+        async def fetch_date(game_date: str) -> None:
+            async with semaphore:
+                odds = await client.get_game_odds(league, game_date)
+            # Index the date's odds by GameID
+            odds_by_date[game_date] = {str(odd.get('GameID')): odd.get('PregameOdds') or []
+                                       for odd in (odds if isinstance(odds, list) else [])
+                                       if isinstance(odd, dict)}
+
+        games = dates = total = 0
+
+        async def sync_batch(batch: List[tuple]) -> None:
+            nonlocal games, dates, total
+            games_by_date: Dict[str, List[tuple]] = {}
+            for game_id, external_id, game_date in batch:
+                if not game_date:
+                    logger.warning(f"Could not find game date for game ID {external_id}")
+                    continue
+                games_by_date.setdefault(str(game_date).split('T')[0], []).append((game_id, external_id))
+
+            new_dates = [d for d in games_by_date if d not in odds_by_date]
+            await asyncio.gather(*(fetch_date(d) for d in new_dates))
+            games += len(batch)
+            dates += len(new_dates)
+
             odds_records = []
-            for game_id in batch:
-                try:
-                    # Get the game details to extract the date for the API call
-                    game_date = None
-                    for game in games_data:
-                        if str(game.get('GameID')) == game_id:
-                            game_date = game.get('Day')
-                            break
-                    
-                    if not game_date:
-                        logger.warning(f"Could not find game date for game ID {game_id}")
-                        continue
-                    
-                    # Format the date as YYYY-MM-DD
-                    game_date = game_date.split('T')[0] if 'T' in game_date else game_date
-                    
-                    # Get odds for this game
-                    odds = await client.get_game_odds(league, game_date)
-                    if not odds or not isinstance(odds, list):
-                        continue
-                        
-                    # Find odds for this specific game
-                    game_odds = None
-                    for odd in odds:
-                        if str(odd.get('GameID')) == game_id:
-                            game_odds = odd.get('PregameOdds', [])
-                            break
-                    
-                    if not game_odds:
-                        continue
-                        
-                    # Process each sportsbook's odds for this game
-                    for book_odds in game_odds:
-                        if not book_odds or not isinstance(book_odds, dict):
-                            continue
-                            
-                        # Extract relevant data
-                        sportsbook = book_odds.get('Sportsbook')
-                        if not sportsbook:
-                            continue
-                            
-                        # Process each market (moneyline, spread, total)
-                        markets = book_odds.get('Markets', [])
-                        if not isinstance(markets, list):
-                            continue
-                            
-                        # Initialize record with common fields
-                        record = {
-                            'game_id': game_id_map[game_id],
-                            'sportsbook': sportsbook,
-                            'last_updated': datetime.utcnow().isoformat()
-                        }
-                        
-                        # Process each market
-                        for market in markets:
-                            if not isinstance(market, dict):
-                                continue
-                                
-                            market_type = market.get('MarketType')
-                            outcomes = market.get('Outcomes', [])
-                            
-                            if market_type == 'Game':  # Moneyline
-                                for outcome in outcomes:
-                                    if outcome.get('Name') == 'Home':
-                                        record['home_moneyline'] = outcome.get('Price')
-                                    elif outcome.get('Name') == 'Away':
-                                        record['away_moneyline'] = outcome.get('Price')
-                                        
-                            elif market_type == 'Spread':
-                                for outcome in outcomes:
-                                    if outcome.get('Name') == 'Home':
-                                        record['home_spread'] = outcome.get('Point')
-                                        record['home_spread_odds'] = outcome.get('Price')
-                                    elif outcome.get('Name') == 'Away':
-                                        record['away_spread'] = outcome.get('Point')
-                                        record['away_spread_odds'] = outcome.get('Price')
-                                        
-                            elif market_type == 'Total':
-                                for outcome in outcomes:
-                                    if outcome.get('Name') == 'Over':
-                                        record['over_under'] = outcome.get('Point')
-                                        record['over_odds'] = outcome.get('Price')
-                                    elif outcome.get('Name') == 'Under':
-                                        record['under_odds'] = outcome.get('Price')
-                        
-                        # Add the record if we have any odds data
-                        if any(k in record for k in ['home_moneyline', 'away_moneyline', 'home_spread', 'away_spread', 'over_under']):
-                            odds_records.append(record)
-                            
-                except Exception as e:
-                    logger.error(f"Error processing odds for game {game_id}: {e}")
-            
-            # Upsert the batch of odds records
+            for game_date, date_games in games_by_date.items():
+                for game_id, external_id in date_games:
+                    for book_odds in odds_by_date[game_date].get(external_id, []):
+                        try:
+                            record = self._odds_record(game_id, book_odds)
+                            if record:
+                                odds_records.append(record)
+                        except Exception as e:
+                            logger.error(f"Error processing odds for game {external_id}: {e}")
+
             if odds_records:
-                total = len(odds_records)
-                logger.info(f"  Upserting {total} odds records...")
-                
-                # Process in smaller batches for upsert
-                upsert_batch_size = 50
-                for i in range(0, total, upsert_batch_size):
-                    batch = odds_records[i:i + upsert_batch_size]
-                    try:
-                        await self.supabase._make_request(
-                            'POST',
-                            'game_odds',
-                            params={'on_conflict': 'game_id,sportsbook'},
-                            json=batch
-                        )
-                        logger.info(f"  ✅ Upserted batch {i//upsert_batch_size + 1}/{(total + upsert_batch_size - 1)//upsert_batch_size}")
-                    except Exception as e:
-                        logger.error(f"Error upserting batch {i//upsert_batch_size + 1}: {e}")
-            else:
-                logger.warning("No odds records to upsert for this batch")
+                await self.supabase.upsert_rows('game_odds', odds_records, 'game_id,sportsbook')
+                total += len(odds_records)
+            if checkpoint and batch:
+                checkpoint.commit()
+
+        while True:
+            batch = await game_batches.get()
+            if batch is None:
+                break
+            if checkpoint:
+                _, batch = checkpoint.split(batch)
+            await sync_batch(batch)
+        if checkpoint:
+            await sync_batch(checkpoint.flush())
+            if checkpoint.skipped:
+                logger.info(f"  Skipped odds for {checkpoint.skipped} games synced by the interrupted run")
+        if run:
+            self._complete(run, 'odds')
+
+        if not games:
+            logger.warning("No games to sync odds for")
+        elif not total:
+            logger.warning("No odds records to upsert")
+        else:
+            logger.info(f"  ✅ Upserted {total} odds records for {games} games on {dates} dates")
+
+    @staticmethod
+    def _odds_record(game_id: str, book_odds: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Build a game_odds row from one sportsbook's PregameOdds entry, or None if it has no odds."""
+        if not book_odds or not isinstance(book_odds, dict):
+            return None
+
+        # Extract relevant data
+        sportsbook = book_odds.get('Sportsbook')
+        if not sportsbook:
+            return None
+
+        # Process each market (moneyline, spread, total)
+        markets = book_odds.get('Markets', [])
+        if not isinstance(markets, list):
+            return None
+
+        # Initialize record with common fields
+        record = {
+            'game_id': game_id,
+            'sportsbook': sportsbook,
+            'last_updated': datetime.utcnow().isoformat()
+        }
+
+        # Process each market
+        for market in markets:
+            if not isinstance(market, dict):
+                continue
+
+            market_type = market.get('MarketType')
+            outcomes = market.get('Outcomes', [])
+
+            if market_type == 'Game':  # Moneyline
+                for outcome in outcomes:
+                    if outcome.get('Name') == 'Home':
+                        record['home_moneyline'] = outcome.get('Price')
+                    elif outcome.get('Name') == 'Away':
+                        record['away_moneyline'] = outcome.get('Price')
+
+            elif market_type == 'Spread':
+                for outcome in outcomes:
+                    if outcome.get('Name') == 'Home':
+                        record['home_spread'] = outcome.get('Point')
+                        record['home_spread_odds'] = outcome.get('Price')
+                    elif outcome.get('Name') == 'Away':
+                        record['away_spread'] = outcome.get('Point')
+                        record['away_spread_odds'] = outcome.get('Price')
+
+            elif market_type == 'Total':
+                for outcome in outcomes:
+                    if outcome.get('Name') == 'Over':
+                        record['over_under'] = outcome.get('Point')
+                        record['over_odds'] = outcome.get('Price')
+                    elif outcome.get('Name') == 'Under':
+                        record['under_odds'] = outcome.get('Price')
+
+        # Keep the record only if we have any odds data
+        if any(k in record for k in ['home_moneyline', 'away_moneyline', 'home_spread', 'away_spread', 'over_under']):
+            return record
+        return None
 
     async def close(self):
         """Clean up resources."""
@@ -965,17 +1258,52 @@ class SportsDataSync:
         for client in self.clients.values():
             await client.close()
 
+def parse_leagues(value: str) -> List[League]:
+    """Parse a comma-separated league list such as 'mlb,nba'."""
+    try:
+        return [League(name.strip().lower()) for name in value.split(',') if name.strip()]
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f"{e}; choose from {', '.join(l.value for l in League)}")
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Sync sports data from SportsData.io to Supabase')
+    parser.add_argument('--leagues', type=parse_leagues, default=[League.MLB],
+                        help='Comma-separated leagues to sync concurrently, e.g. mlb,nba,nhl,nfl,mls (default: mlb)')
+    parser.add_argument('--sportsdata-rate', type=float, default=SPORTSDATA_RATE,
+                        help=f'SportsData.io requests/second per API key (default: {SPORTSDATA_RATE:g})')
+    parser.add_argument('--sportsdata-concurrency', type=int, default=SPORTSDATA_CONCURRENCY,
+                        help=f'SportsData.io requests in flight per API key (default: {SPORTSDATA_CONCURRENCY})')
+    parser.add_argument('--supabase-rate', type=float, default=SUPABASE_RATE,
+                        help=f'Supabase requests/second (default: {SUPABASE_RATE:g})')
+    parser.add_argument('--supabase-concurrency', type=int, default=SUPABASE_CONCURRENCY,
+                        help=f'Supabase requests in flight (default: {SUPABASE_CONCURRENCY})')
+    parser.add_argument('--full', action='store_true',
+                        help='Send every row, even ones the local ledger or HTTP cache says are unchanged')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue an interrupted run from its journal instead of starting over')
+    return parser.parse_args()
+
 async def main():
     """Main function to run the sync."""
+    args = parse_args()
     sync = None
+    ledger = RowLedger(full=args.full)
+    journal = RunJournal(resume=args.resume)
     try:
-        sync = SportsDataSync()
+        sync = SportsDataSync(
+            RateLimiter(args.sportsdata_rate, concurrency=args.sportsdata_concurrency),
+            RateLimiter(args.supabase_rate, concurrency=args.supabase_concurrency),
+            ledger,
+            journal,
+        )
         
-        # Sync all leagues or specify which ones to sync
-        leagues_to_sync = [League.MLB]  # Start with MLB only for now
+        # League pipelines run concurrently; the shared limiters keep them within quota
+        logger.info(f"Syncing {', '.join(l.value.upper() for l in args.leagues)}")
+        await asyncio.gather(*(sync.sync_league(league) for league in args.leagues))
         
-        for league in leagues_to_sync:
-            await sync.sync_league(league)
+        for table, metrics in sync.supabase.batch_metrics().items():
+            logger.info(f"📦 {table} batch sizing: {json.dumps(metrics)}")
             
     except KeyboardInterrupt:
         logger.info("\n🛑 Sync interrupted by user")
@@ -984,6 +1312,8 @@ async def main():
     finally:
         if sync:
             await sync.close()
+        ledger.close()
+        journal.close()
         logger.info("👋 Sync completed")
 
 if __name__ == "__main__":
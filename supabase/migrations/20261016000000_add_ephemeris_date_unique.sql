@@ -0,0 +1,2 @@
+-- Ensure one ephemeris row per date so computeEphemeris.py can upsert on date
+CREATE UNIQUE INDEX IF NOT EXISTS idx_ephemeris_date_unique ON ephemeris(date);
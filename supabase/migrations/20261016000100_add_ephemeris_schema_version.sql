@@ -0,0 +1,6 @@
+-- Track which version of computeEphemeris.py produced each row so
+-- `computeEphemeris.py --fill-gaps` can recompute stale dates.
+-- Existing rows predate versioning and are treated as version 1.
+ALTER TABLE ephemeris ADD COLUMN IF NOT EXISTS schema_version INTEGER NOT NULL DEFAULT 1;
+
+CREATE INDEX IF NOT EXISTS idx_ephemeris_schema_version ON ephemeris(schema_version);
@@ -0,0 +1,30 @@
+-- Natal positions computed by scripts/natal_charts.py, one row per birth date.
+-- Players join on players.birth_date; arrays follow the body order
+-- sun, moon, mercury, venus, mars, jupiter, saturn, uranus, neptune, pluto.
+CREATE TABLE IF NOT EXISTS natal_positions (
+    birth_date DATE PRIMARY KEY,
+    longitudes DOUBLE PRECISION[] NOT NULL,
+    speeds DOUBLE PRECISION[] NOT NULL,
+    signs TEXT[] NOT NULL,
+    schema_version INTEGER NOT NULL DEFAULT 1,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+ALTER TABLE natal_positions ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Allow read access to all users" ON natal_positions
+    FOR SELECT
+    TO authenticated
+    USING (true);
+
+CREATE POLICY "Allow insert/update to service role" ON natal_positions
+    FOR ALL
+    TO service_role
+    USING (true)
+    WITH CHECK (true);
+
+CREATE TRIGGER update_natal_positions_updated_at
+    BEFORE UPDATE ON natal_positions
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
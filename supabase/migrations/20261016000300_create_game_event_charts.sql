@@ -0,0 +1,40 @@
+-- Event charts cast by scripts/event_charts.py for each game at its venue.
+-- chart_key hashes venue, start time and computation version; a game is
+-- recast only when it changes. Body arrays follow the order
+-- sun, moon, mercury, venus, mars, jupiter, saturn, uranus, neptune, pluto.
+CREATE TABLE IF NOT EXISTS game_event_charts (
+    game_id UUID PRIMARY KEY REFERENCES games(id) ON DELETE CASCADE,
+    venue_id UUID REFERENCES teams(id) ON DELETE SET NULL,
+    game_time_utc TIMESTAMPTZ NOT NULL,
+    latitude DOUBLE PRECISION NOT NULL,
+    longitude DOUBLE PRECISION NOT NULL,
+    chart_key TEXT NOT NULL,
+    ascendant DOUBLE PRECISION NOT NULL,
+    mc DOUBLE PRECISION NOT NULL,
+    house_cusps DOUBLE PRECISION[] NOT NULL,
+    body_longitudes DOUBLE PRECISION[] NOT NULL,
+    body_houses SMALLINT[] NOT NULL,
+    schema_version INTEGER NOT NULL DEFAULT 1,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_game_event_charts_game_time ON game_event_charts(game_time_utc);
+
+ALTER TABLE game_event_charts ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Allow read access to all users" ON game_event_charts
+    FOR SELECT
+    TO authenticated
+    USING (true);
+
+CREATE POLICY "Allow insert/update to service role" ON game_event_charts
+    FOR ALL
+    TO service_role
+    USING (true)
+    WITH CHECK (true);
+
+CREATE TRIGGER update_game_event_charts_updated_at
+    BEFORE UPDATE ON game_event_charts
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
@@ -0,0 +1,5 @@
+-- Content hash of each row as computed by computeEphemeris.py, written with
+-- the row, so re-runs can skip unchanged dates without comparing the values
+-- read back through the column types. Rows written before this column are
+-- NULL and are rewritten once.
+ALTER TABLE ephemeris ADD COLUMN IF NOT EXISTS content_hash TEXT;